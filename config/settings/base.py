@@ -60,6 +60,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # External data files
 DATA_DIR = Path(APPS_DIR) / "static" / "data"
 FULL_PATH_PROFILES = Path(DATA_DIR) / "1-hour_mean_365_days_all_users.parquet"
+# Memory-mapped float32 copy of the load profiles, built from FULL_PATH_PROFILES (see build_load_profiles command)
+FULL_PATH_PROFILES_ARRAY = Path(
+    os.getenv(
+        "PROFILES_ARRAY_PATH", Path(DATA_DIR) / "1-hour_mean_365_days_all_users.npy"
+    )
+)
 
 # URLS
 # ------------------------------------------------------------------------------
@@ -381,6 +387,25 @@ SPECTACULAR_SETTINGS = {
 # OFFGRIDPLANNER SETTINGS
 # Assumed country based on timeseries data (used for map settings and user warning if a different country is selected)
 DEFAULT_COUNTRY = ("NG", "Nigeria")
+# Storage format for the dataframes of the optimization models (Nodes, Links, EnergyFlow, ...), either "arrow"
+# (columnar Arrow IPC blob) or "json" (legacy JSON string). Rows in either format can always be read.
+JSON_DATA_STORAGE = os.getenv("JSON_DATA_STORAGE", "arrow")
+# Size in degrees of the grid cells for which the solar potential is computed and cached
+SOLAR_POTENTIAL_RESOLUTION = float(os.getenv("SOLAR_POTENTIAL_RESOLUTION", "0.1"))
+# Maximal distance in degrees between a site and the grid point of the locally stored weather data (WeatherData)
+WEATHER_DATA_SEARCH_RADIUS = float(os.getenv("WEATHER_DATA_SEARCH_RADIUS", "0.5"))
+# Precomputed solar potential of the service country (see build_solar_raster command), not used if the file is missing
+SOLAR_POTENTIAL_RASTER_PATH = Path(
+    os.getenv(
+        "SOLAR_POTENTIAL_RASTER_PATH", Path(DATA_DIR) / "solar_potential_raster.npz"
+    )
+)
+# Zoom level of the (slippy map) tiles of the local building footprint store, tiles missing in the store are fetched
+# from Overpass if OVERPASS_FALLBACK is set (see load_building_footprints command)
+BUILDING_TILE_ZOOM = int(os.getenv("BUILDING_TILE_ZOOM", "14"))
+OVERPASS_FALLBACK = env.bool("OVERPASS_FALLBACK", default=True)
+# Distance in metres below which two nodes edited on the map are considered the same node (see grid.node_index)
+NODE_DUPLICATE_TOLERANCE = float(os.getenv("NODE_DUPLICATE_TOLERANCE", "1"))
 
 # SIMULATION
 # ------------------------------------------------------------------------------
@@ -388,6 +413,37 @@ SIM_API_HOST = os.getenv("SIM_API_HOST")
 SIM_GRID_POST_URL = f"{SIM_API_HOST}/sendjson/grid"
 SIM_SUPPLY_POST_URL = f"{SIM_API_HOST}/sendjson/supply"
 SIM_GET_URL = f"{SIM_API_HOST}/check/"
+# HTTP client settings for the simulation server (timeouts in seconds)
+SIM_CONNECT_TIMEOUT = float(os.getenv("SIM_CONNECT_TIMEOUT", "5"))
+SIM_REQUEST_TIMEOUT = float(os.getenv("SIM_REQUEST_TIMEOUT", "60"))
+SIM_REQUEST_RETRIES = int(os.getenv("SIM_REQUEST_RETRIES", "3"))
+SIM_RETRY_BACKOFF = float(os.getenv("SIM_RETRY_BACKOFF", "0.5"))
+SIM_MAX_CONNECTIONS = int(os.getenv("SIM_MAX_CONNECTIONS", "100"))
+# Seconds between two status checks of the pending simulations
+SIM_STATUS_POLL_INTERVAL = float(os.getenv("SIM_STATUS_POLL_INTERVAL", "3"))
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-schedule
+# The status of all pending simulations is checked by one periodic task, runs which could not start in time are dropped
+CELERY_BEAT_SCHEDULE = {
+    "poll-simulation-status": {
+        "task": "task_poll_simulation_status",
+        "schedule": SIM_STATUS_POLL_INTERVAL,
+        "options": {"expires": SIM_STATUS_POLL_INTERVAL},
+    },
+}
+# Seconds the results of a finished simulation are kept in the cache until they are processed
+SIM_RESULTS_CACHE_TIMEOUT = int(os.getenv("SIM_RESULTS_CACHE_TIMEOUT", "86400"))
+# Results of earlier simulations reused for an identical input: seconds they are kept and maximum total size in bytes
+# (compressed)
+SIM_INPUT_CACHE_TIMEOUT = int(os.getenv("SIM_INPUT_CACHE_TIMEOUT", "604800"))
+SIM_INPUT_CACHE_MAX_SIZE = int(os.getenv("SIM_INPUT_CACHE_MAX_SIZE", "268435456"))
+# Scenario sweeps: number of variants simulated at the same time and maximum number of variants of one sweep
+SIM_SWEEP_MAX_CONCURRENCY = int(os.getenv("SIM_SWEEP_MAX_CONCURRENCY", "4"))
+SIM_SWEEP_MAX_VARIANTS = int(os.getenv("SIM_SWEEP_MAX_VARIANTS", "1000"))
+SIM_SCHEMA_URL = f"{SIM_API_HOST}/schema/"
+# Seconds a fetched schema is used before it is revalidated with the simulation server
+SIM_SCHEMA_TTL = float(os.getenv("SIM_SCHEMA_TTL", "3600"))
+# Vendored copies of the schemas, used when the simulation server is unreachable
+SIM_SCHEMA_DIR = Path(os.getenv("SIM_SCHEMA_DIR", Path(DATA_DIR) / "sim_schemas"))
 
 # simulation status
 DONE = "DONE"
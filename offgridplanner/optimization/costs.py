@@ -0,0 +1,97 @@
+"""
+Annualized costs (equivalent periodical costs, EPC) of the components of the grid and the energy system.
+
+All functions take scalars or arrays, which are broadcast against each other, so the EPC of many components or
+parameter combinations (e.g. for a sensitivity study) is computed in one call. The replacements during the project
+lifetime are summed as a geometric series instead of one by one.
+"""
+
+import numpy as np
+
+
+def capital_recovery_factor(wacc, project_lifetime):
+    """
+    Parameters:
+        wacc (float or np.ndarray): Weighted average cost of capital (e.g. 0.1 for 10 %)
+        project_lifetime (float or np.ndarray): Project lifetime in years
+    Returns:
+        np.ndarray: Capital recovery factor (1 / project_lifetime for a wacc of 0)
+    """
+    wacc, project_lifetime = np.broadcast_arrays(
+        np.asarray(wacc, dtype=np.float64),
+        np.asarray(project_lifetime, dtype=np.float64),
+    )
+    growth = (1 + wacc) ** project_lifetime
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crf = (wacc * growth) / (growth - 1)
+    return np.where(wacc == 0, 1 / project_lifetime, crf)[()]
+
+
+def number_of_investments(component_lifetime, project_lifetime):
+    """Number of investments into a component (the first one and its replacements) during the project lifetime"""
+    component_lifetime = np.asarray(component_lifetime, dtype=np.float64)
+    project_lifetime = np.asarray(project_lifetime, dtype=np.float64)
+    # np.round rounds half to even, as round() did in the previous scalar implementation
+    n = np.round(project_lifetime / component_lifetime + 0.5)
+    return np.where(project_lifetime == component_lifetime, 1, n).astype(np.int64)[()]
+
+
+def capex_multi_investment(capex, component_lifetime, project_lifetime, wacc, tax=0):
+    """
+    Equivalent CAPEX of a component including its discounted replacements during the project lifetime, minus the
+    discounted salvage value of the last replacement (linear depreciation).
+    Parameters:
+        capex (float or np.ndarray): Initial CAPEX of the component
+        component_lifetime (float or np.ndarray): Lifetime of the component in years
+        project_lifetime (float or np.ndarray): Project lifetime in years
+        wacc (float or np.ndarray): Weighted average cost of capital
+        tax (float or np.ndarray): Tax on the investment
+    Returns:
+        np.ndarray: Equivalent CAPEX
+    """
+    capex, lifetime, project_lifetime, wacc, tax = np.broadcast_arrays(
+        *(
+            np.asarray(value, dtype=np.float64)
+            for value in (capex, component_lifetime, project_lifetime, wacc, tax)
+        )
+    )
+    n = number_of_investments(lifetime, project_lifetime)
+    first_investment = capex * (1 + tax)
+    discount = 1 + wacc
+
+    # Replacements k = 1, ..., n - 1, discounted by q ** k with q = discount ** -lifetime
+    n_replacements = np.maximum(n - 1, 0)
+    q = discount**-lifetime
+    with np.errstate(divide="ignore", invalid="ignore"):
+        series = np.where(q == 1, n_replacements, q * (1 - q**n_replacements) / (1 - q))
+    # A replacement at the very end of the project is not bought
+    k_end = np.round(project_lifetime / lifetime)
+    at_end = (k_end * lifetime == project_lifetime) & (k_end >= 1) & (k_end < n)
+    series = series - np.where(at_end, discount**-project_lifetime, 0)
+    equivalent_capex = first_investment * (1 + series)
+
+    # Salvage value of the last investment at the end of the project
+    remaining = n * lifetime - project_lifetime
+    last_investment = first_investment * discount ** (-(n - 1) * lifetime)
+    salvage = last_investment / lifetime * remaining / discount**project_lifetime
+    return np.where(remaining > 0, equivalent_capex - salvage, equivalent_capex)[()]
+
+
+def epc(capex, opex, component_lifetime, project_lifetime, wacc, tax=0):  # noqa:PLR0913
+    """
+    Equivalent periodical (annual) costs of a component
+    Parameters:
+        capex (float or np.ndarray): Initial CAPEX of the component
+        opex (float or np.ndarray): Annual OPEX of the component
+        component_lifetime (float or np.ndarray): Lifetime of the component in years
+        project_lifetime (float or np.ndarray): Project lifetime in years
+        wacc (float or np.ndarray): Weighted average cost of capital
+        tax (float or np.ndarray): Tax on the investment
+    Returns:
+        np.ndarray: EPC of the component
+    """
+    crf = capital_recovery_factor(wacc, project_lifetime)
+    equivalent_capex = capex_multi_investment(
+        capex, component_lifetime, project_lifetime, wacc, tax
+    )
+    return crf * equivalent_capex + np.asarray(opex, dtype=np.float64)
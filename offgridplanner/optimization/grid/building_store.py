@@ -0,0 +1,350 @@
+"""
+Local store of the OpenStreetMap buildings (mean coordinates and surface areas), partitioned into slippy map tiles of
+zoom BUILDING_TILE_ZOOM. The store is filled from OSM extracts with the load_building_footprints command and answers
+the bounding box queries of identify_consumers_on_map.get_consumer_within_boundaries. Only the buildings of tiles
+missing in the store, or not complete (e.g. at the edge of an extract), are requested from the Overpass API, they are
+stored so each tile is requested at most once.
+
+A tile is assigned to a building by its mean coordinates, a building is never split between tiles. The tile and the
+(tile, latitude, longitude) index serve as spatial index, so no spatial database extension is required.
+"""
+
+import importlib.util
+import itertools
+import json
+import logging
+import math
+from pathlib import Path
+
+import numpy as np
+import shapely
+from django.db import transaction
+from shapely import geometry
+
+from config.settings.base import BUILDING_TILE_ZOOM
+from config.settings.base import OVERPASS_FALLBACK
+from offgridplanner.optimization.grid.identify_consumers_on_map import (
+    buildings_from_rings,
+)
+from offgridplanner.optimization.grid.identify_consumers_on_map import (
+    iter_buildings_from_overpass_elements,
+)
+from offgridplanner.optimization.grid.identify_consumers_on_map import (
+    iter_overpass_elements,
+)
+from offgridplanner.optimization.grid.identify_consumers_on_map import (
+    request_overpass_buildings,
+)
+from offgridplanner.optimization.models import BuildingFootprint
+from offgridplanner.optimization.models import BuildingTile
+
+logger = logging.getLogger(__name__)
+
+OSMIUM_AVAILABLE = importlib.util.find_spec("osmium") is not None
+EXTRACT_SUFFIXES = (".json", ".geojson", ".geojsonseq", ".pbf")
+
+
+def tile_of(latitude, longitude, zoom=BUILDING_TILE_ZOOM):
+    """
+    Parameters:
+        latitude (float or np.ndarray): Latitude(s) in degrees
+        longitude (float or np.ndarray): Longitude(s) in degrees
+        zoom (int): Zoom level of the tiles
+    Returns:
+        tuple: x and y of the slippy map tile(s) containing the coordinates (y increases southward)
+    """
+    n = 2**zoom
+    x = np.floor((np.asarray(longitude, dtype=float) + 180) / 360 * n)
+    y = np.floor(
+        (1 - np.arcsinh(np.tan(np.radians(latitude))) / np.pi) / 2 * n,
+    )
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+def tile_bounds(x, y, zoom=BUILDING_TILE_ZOOM):
+    """Bounding box (min_latitude, min_longitude, max_latitude, max_longitude) of a tile"""
+    n = 2**zoom
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return latitude(y + 1), x / n * 360 - 180, latitude(y), (x + 1) / n * 360 - 180
+
+
+def tiles_in_bbox(
+    min_latitude, min_longitude, max_latitude, max_longitude, zoom=BUILDING_TILE_ZOOM
+):
+    """Tiles (x, y) overlapping a bounding box"""
+    min_x, min_y = tile_of(max_latitude, min_longitude, zoom)
+    max_x, max_y = tile_of(min_latitude, max_longitude, zoom)
+    return list(
+        itertools.product(range(min_x, max_x + 1), range(min_y, max_y + 1)),
+    )
+
+
+def tiles_within(boundary, zoom=BUILDING_TILE_ZOOM):
+    """
+    Tiles (x, y) lying completely inside a boundary
+    Parameters:
+        boundary (shapely.Geometry): (Multi)polygon with (longitude, latitude) coordinates, e.g. the area of an extract
+        zoom (int): Zoom level of the tiles
+    """
+    min_longitude, min_latitude, max_longitude, max_latitude = boundary.bounds
+    tiles = tiles_in_bbox(
+        min_latitude, min_longitude, max_latitude, max_longitude, zoom
+    )
+    bounds = np.array([tile_bounds(x, y, zoom) for x, y in tiles]).reshape(-1, 4)
+    boxes = shapely.box(bounds[:, 1], bounds[:, 0], bounds[:, 3], bounds[:, 2])
+    shapely.prepare(boundary)
+    return [
+        tile
+        for tile, inside in zip(tiles, boundary.contains(boxes), strict=True)
+        if inside
+    ]
+
+
+def store_buildings(buildings, zoom=BUILDING_TILE_ZOOM, source="extract"):
+    """
+    Add buildings to the store, each in the tile of its mean coordinates. New tiles are not complete until they are
+    marked with mark_tiles_complete. Buildings which are already stored (same OSM id) are skipped, so an extract can be
+    loaded again.
+    Parameters:
+        buildings (list): Buildings (id, [lat, lon], area)
+        zoom (int): Zoom level of the tiles
+        source (str): Origin of the buildings, e.g. the name of the extract or "overpass"
+    Returns:
+        int: Number of given buildings
+    """
+    if not buildings:
+        return 0
+    coordinates = np.array([coord for _id, coord, _area in buildings], dtype=float)
+    x, y = tile_of(coordinates[:, 0], coordinates[:, 1], zoom)
+    building_tiles = list(zip(x.tolist(), y.tolist(), strict=True))
+    tiles = set(building_tiles)
+    with transaction.atomic():
+        BuildingTile.objects.bulk_create(
+            [BuildingTile(zoom=zoom, x=x, y=y, source=source) for x, y in tiles],
+            ignore_conflicts=True,
+        )
+        tile_ids = {
+            (x, y): tile_id
+            for tile_id, x, y in BuildingTile.objects.filter(
+                zoom=zoom, x__range=(x.min(), x.max()), y__range=(y.min(), y.max())
+            ).values_list("id", "x", "y")
+        }
+        BuildingFootprint.objects.bulk_create(
+            [
+                BuildingFootprint(
+                    tile_id=tile_ids[tile],
+                    osm_id=building_id,
+                    latitude=mean_coord[0],
+                    longitude=mean_coord[1],
+                    area=area,
+                )
+                for (building_id, mean_coord, area), tile in zip(
+                    buildings, building_tiles, strict=True
+                )
+            ],
+            ignore_conflicts=True,
+            batch_size=5000,
+        )
+    return len(buildings)
+
+
+def mark_tiles_complete(
+    tiles, zoom=BUILDING_TILE_ZOOM, source="extract", batch_size=5000
+):
+    """
+    Mark tiles (x, y) whose buildings are all stored as complete (tiles without buildings are created), so the
+    buildings of these tiles are no longer requested from Overpass
+    """
+    for batch in itertools.batched(tiles, batch_size):
+        BuildingTile.objects.bulk_create(
+            [
+                BuildingTile(zoom=zoom, x=x, y=y, source=source, complete=True)
+                for x, y in batch
+            ],
+            update_conflicts=True,
+            unique_fields=["zoom", "x", "y"],
+            update_fields=["source", "complete"],
+        )
+
+
+def buildings_in_bbox(
+    min_latitude, min_longitude, max_latitude, max_longitude, zoom=BUILDING_TILE_ZOOM
+):
+    """
+    Buildings (id, [lat, lon], area) within a bounding box, from the store. The buildings of the tiles which are
+    missing or not complete (e.g. at the edge of an extract) are requested from the Overpass API (one request for the
+    bounding box of these tiles) and stored, unless OVERPASS_FALLBACK is disabled. Buildings requested from Overpass
+    may lie outside the bounding box.
+    Raises:
+        OverpassError: If the Overpass response is incomplete, nothing is stored then
+        OSError: If the Overpass request failed
+    """
+    tiles = tiles_in_bbox(
+        min_latitude, min_longitude, max_latitude, max_longitude, zoom
+    )
+    xs, ys = zip(*tiles, strict=True)
+    stored_tiles = {
+        (x, y): (tile_id, complete)
+        for tile_id, x, y, complete in BuildingTile.objects.filter(
+            zoom=zoom, x__range=(min(xs), max(xs)), y__range=(min(ys), max(ys))
+        ).values_list("id", "x", "y", "complete")
+    }
+    buildings = [
+        (osm_id, [latitude, longitude], area)
+        for osm_id, latitude, longitude, area in BuildingFootprint.objects.filter(
+            tile_id__in=[tile_id for tile_id, _complete in stored_tiles.values()],
+            latitude__range=(min_latitude, max_latitude),
+            longitude__range=(min_longitude, max_longitude),
+        ).values_list("osm_id", "latitude", "longitude", "area")
+    ]
+    missing_tiles = [
+        tile for tile in tiles if not stored_tiles.get(tile, (None, False))[1]
+    ]
+    if not missing_tiles:
+        return buildings
+    if not OVERPASS_FALLBACK:
+        logger.warning(
+            "%s of %s tiles of the bounding box are not complete in the building store",
+            len(missing_tiles),
+            len(tiles),
+        )
+        return buildings
+
+    bounds = np.array([tile_bounds(x, y, zoom) for x, y in missing_tiles])
+    requested = request_overpass_buildings(
+        *bounds[:, :2].min(axis=0).tolist(), *bounds[:, 2:].max(axis=0).tolist()
+    )
+    with transaction.atomic():
+        store_buildings(requested, zoom=zoom, source="overpass")
+        mark_tiles_complete(missing_tiles, zoom=zoom, source="overpass")
+    # Buildings of stored tiles requested again have the same id as the stored ones
+    return buildings + requested
+
+
+def extract_boundary(path, bbox=None, boundary_path=None):
+    """
+    Area covered by an OSM extract, the tiles inside it are complete once the extract is loaded
+    Parameters:
+        path (Path): Extract file, the bounding box in the header of a .osm.pbf file is used by default
+        bbox (tuple): Bounding box (min_latitude, min_longitude, max_latitude, max_longitude) of the extract
+        boundary_path (Path): GeoJSON file with the (multi)polygon the extract was cut with
+    Returns:
+        shapely.Geometry: (Multi)polygon with (longitude, latitude) coordinates, None if the area is not known
+    """
+    if boundary_path is not None:
+        with Path(boundary_path).open() as file:
+            geojson = json.load(file)
+        features = geojson.get("features", [geojson])
+        return shapely.union_all(
+            [geometry.shape(feature.get("geometry", feature)) for feature in features]
+        )
+    if bbox is None and Path(path).suffix == ".pbf":
+        bbox = _osm_pbf_bbox(path)
+    if bbox is None:
+        return None
+    min_latitude, min_longitude, max_latitude, max_longitude = bbox
+    return shapely.box(min_longitude, min_latitude, max_longitude, max_latitude)
+
+
+def iter_extract_buildings(path, batch_size=10000):
+    """
+    Batches of the buildings (id, [lat, lon], area) with building=yes of an OSM extract: an Overpass response (.json),
+    a GeoJSON FeatureCollection (.geojson) or GeoJSON text sequence (.geojsonseq), e.g. written by osmium export, or
+    an OSM PBF file (.osm.pbf, requires pyosmium). Only the exterior ring of the building outlines is used.
+    """
+    path = Path(path)
+    if path.suffix == ".json":
+        with path.open("rb") as stream:
+            yield from itertools.batched(
+                iter_buildings_from_overpass_elements(iter_overpass_elements(stream)),
+                batch_size,
+            )
+        return
+
+    outlines = {
+        ".geojson": _geojson_outlines,
+        ".geojsonseq": _geojsonseq_outlines,
+        ".pbf": _osm_pbf_outlines,
+    }[path.suffix](path)
+    for batch in itertools.batched(outlines, batch_size):
+        building_ids, rings = zip(*batch, strict=True)
+        yield buildings_from_rings(list(building_ids), list(rings), rings[0][0])
+
+
+def _osm_id(feature):
+    # "way/<id>" as returned by Overpass, also for the ids of osmium export ("w<id>") and ogr2ogr (<id>)
+    osm_id = str(feature.get("id") or (feature.get("properties") or {}).get("@id"))
+    if osm_id[:1] == "w" and osm_id[1:].isdigit():
+        return f"way/{osm_id[1:]}"
+    return f"way/{osm_id}" if osm_id.isdigit() else osm_id
+
+
+def _geojson_outline(feature):
+    # (id, [[lat, lon], ...]) of a building feature, None for other features
+    properties = feature.get("properties") or {}
+    geometry = feature.get("geometry") or {}
+    if properties.get("building", "yes") != "yes":
+        return None
+    if geometry.get("type") == "Polygon":
+        exterior = geometry["coordinates"][0]
+    elif geometry.get("type") == "MultiPolygon":
+        exterior = geometry["coordinates"][0][0]
+    else:
+        return None
+    return _osm_id(feature), [[lat, lon] for lon, lat, *_ in exterior]
+
+
+def _geojson_outlines(path):
+    with path.open() as file:
+        features = json.load(file)["features"]
+    for feature in features:
+        if (outline := _geojson_outline(feature)) is not None:
+            yield outline
+
+
+def _geojsonseq_outlines(path):
+    with path.open() as file:
+        for line in file:
+            if (text := line.strip().lstrip("\x1e")) and (
+                outline := _geojson_outline(json.loads(text))
+            ) is not None:
+                yield outline
+
+
+def _import_osmium():
+    if not OSMIUM_AVAILABLE:
+        msg = "Reading .osm.pbf files requires pyosmium (pip install osmium)"
+        raise ImportError(msg)
+    return importlib.import_module("osmium")
+
+
+def _osm_pbf_bbox(path):
+    # Bounding box of the header of a .osm.pbf file (set by the extract tools), None if there is none
+    osmium = _import_osmium()
+    reader = osmium.io.Reader(str(path), osmium.osm.osm_entity_bits.NOTHING)
+    try:
+        box = reader.header().box()
+    finally:
+        reader.close()
+    if not box.valid():
+        return None
+    return (
+        box.bottom_left.lat,
+        box.bottom_left.lon,
+        box.top_right.lat,
+        box.top_right.lon,
+    )
+
+
+def _osm_pbf_outlines(path):
+    osmium = _import_osmium()
+    for way in osmium.FileProcessor(str(path)).with_locations():
+        if (
+            way.is_way()
+            and way.tags.get("building") == "yes"
+            and all(node.location.valid() for node in way.nodes)
+        ):
+            yield f"way/{way.id}", [[node.lat, node.lon] for node in way.nodes]
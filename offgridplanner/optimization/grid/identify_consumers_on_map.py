@@ -7,25 +7,99 @@ geographic data processing tasks efficiently, extracting meaningful information
 from raw OpenStreetMap data.
 """
 
+import codecs
 import datetime
 import json
+import logging
 import math
+import re
 import time
 import urllib.request
 
 import numpy as np
+import shapely
 from shapely import geometry
 
+logger = logging.getLogger(__name__)
 
-def get_consumer_within_boundaries(df):
-    # min and max of latitudes and longitudes are sent to the overpass to get
-    # a large rectangle including (maybe) more buildings than selected
-    min_latitude, min_longitude, max_latitude, max_longitude = (
+OVERPASS_ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+OVERPASS_SEPARATORS = re.compile(r"[\s,]*")
+OVERPASS_REMARK = re.compile(r'"remark"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class OverpassError(Exception):
+    """The Overpass response has no elements or reports an error (e.g. a timeout), its elements may be incomplete"""
+
+
+def get_consumer_within_boundaries(df, buildings_in_bbox=None):
+    """
+    Mean coordinates of the buildings inside the boundary drawn by the user
+
+    Parameters
+    ----------
+    df (pd.DataFrame):
+        Vertices of the boundary (columns latitude and longitude)
+
+    buildings_in_bbox (callable):
+        Returns the buildings (id, [lat, lon], area) within a bounding box (min_latitude, min_longitude,
+        max_latitude, max_longitude), defaults to request_overpass_buildings (see also
+        building_store.buildings_in_bbox)
+    """
+    # min and max of latitudes and longitudes are used to get a large
+    # rectangle including (maybe) more buildings than selected
+    buildings = (buildings_in_bbox or request_overpass_buildings)(
         df["latitude"].min(),
         df["longitude"].min(),
         df["latitude"].max(),
         df["longitude"].max(),
     )
+    building_coord = {
+        building_id: mean_coord for building_id, mean_coord, _area in buildings
+    }
+    # excluding the buildings which are outside the drawn boundary
+    coordinates = np.array(list(building_coord.values()), dtype=float).reshape(-1, 2)
+    mask_building_within_boundaries = points_in_boundaries(
+        coordinates[:, 0],
+        coordinates[:, 1],
+        df[["latitude", "longitude"]].to_numpy(),
+    )
+    building_coordinates_within_boundaries = {
+        key: value
+        for (key, value), inside in zip(
+            building_coord.items(), mask_building_within_boundaries, strict=True
+        )
+        if inside
+    }
+    return building_coordinates_within_boundaries
+
+
+class _StreamText:
+    # Text of a binary UTF-8 stream, decoded chunk by chunk
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.eof = False
+
+    def read(self):
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.text += self.decoder.decode(chunk, final=self.eof)
+
+    def read_all(self):
+        while not self.eof:
+            self.read()
+
+
+def request_overpass_buildings(
+    min_latitude, min_longitude, max_latitude, max_longitude
+):
+    """
+    Buildings (id, [lat, lon], area) with building=yes in a bounding box, requested from the Overpass API. The
+    response is parsed while it is read, the mean coordinates of the buildings are obtained as soon as their way is
+    complete.
+    """
     url = (
         f"https://www.overpass-api.de/api/interpreter?data=[out:json][timeout:2500]"
         f"[bbox:{min_latitude},{min_longitude},{max_latitude},{max_longitude}];"
@@ -38,30 +112,118 @@ def get_consumer_within_boundaries(df):
         raise ValueError(error)
 
     with urllib.request.urlopen(url_formatted) as url:  # noqa: S310 (fixed with ValueError call above)
-        res = url.read().decode()
-        if len(res) > 0:
-            data = json.loads(res)
+        return list(iter_buildings_from_overpass_elements(iter_overpass_elements(url)))
+
+
+def iter_overpass_elements(stream, chunk_size=65536):
+    """
+    Parse the "elements" array of an Overpass JSON response incrementally while it is read, so neither the response
+    nor the parsed JSON is held in memory as a whole.
+
+    Parameters
+    ----------
+    stream (file-like):
+        Binary stream of the response, e.g. the return value of urllib.request.urlopen
+
+    chunk_size (int):
+        Number of bytes read at once
+
+    Yields
+    ------
+        dict: One element (node or way) after the other, in the order of the response
+
+    Raises
+    ------
+        OverpassError: After the last element if the response reports an error in a remark (the elements are
+            incomplete), or if it has no elements array
+    """
+    decoder = json.JSONDecoder()
+    buffer = _StreamText(stream, chunk_size)
+
+    # skip the header (version, generator, osm3s) up to the start of the array
+    while (match := OVERPASS_ELEMENTS_START.search(buffer.text)) is None:
+        if buffer.eof:
+            msg = f"No elements in the Overpass response: {buffer.text[:200]}"
+            raise OverpassError(msg)
+        # keep the end of the text, the key might be split between two chunks
+        buffer.text = buffer.text[-len('"elements" : [') :]
+        buffer.read()
+    position = match.end()
+
+    while True:
+        position = OVERPASS_SEPARATORS.match(buffer.text, position).end()
+        if buffer.text.startswith("]", position):
+            break
+        try:
+            element, position = decoder.raw_decode(buffer.text, position)
+        except json.JSONDecodeError:
+            # the element is not complete yet
+            if buffer.eof:
+                raise
+            buffer.text = buffer.text[position:]
+            position = 0
+            buffer.read()
+            continue
+        yield element
+
+    # overpass reports errors (e.g. a timeout with incomplete results) in a remark after the elements
+    buffer.read_all()
+    if (remark := OVERPASS_REMARK.search(buffer.text, position)) is not None:
+        msg = f"Overpass remark: {remark.group(1)}"
+        raise OverpassError(msg)
+
+
+def iter_buildings_from_overpass_elements(elements, batch_size=1000):
+    """
+    Mean coordinates and surface areas of the buildings, computed batch by batch as soon as all nodes of the buildings
+    (ways) have been read. Overpass returns the nodes before the ways, a way with nodes that come later is processed
+    at the end.
+
+    Parameters
+    ----------
+    elements (iterable):
+        Elements of an Overpass response, see iter_overpass_elements
+
+    batch_size (int):
+        Number of buildings whose metrics are computed at once, see building_metrics
+
+    Yields
+    ------
+        tuple: Id of the building ("way/<id>"), its mean coordinates [lat, lon] and its surface area in m²
+            (only outlines recognized as buildings by building_metrics)
+    """
+    node_coordinates = {}
+    pending_ways = []
+    batch = []
+    reference_coordinate = None
+
+    def buildings(ways):
+        nonlocal reference_coordinate
+        rings = [[node_coordinates[node] for node in way["nodes"]] for way in ways]
+        reference_coordinate = reference_coordinate or rings[0][0]
+        return buildings_from_rings(
+            [f"way/{way['id']}" for way in ways], rings, reference_coordinate
+        )
+
+    def is_complete(way):
+        return all(node in node_coordinates for node in way["nodes"])
+
+    for element in elements:
+        if element["type"] == "node":
+            node_coordinates[element["id"]] = [element["lat"], element["lon"]]
+        elif element["type"] == "way":
+            (batch if is_complete(element) else pending_ways).append(element)
+            if len(batch) >= batch_size:
+                yield from buildings(batch)
+                batch = []
+
+    for way in pending_ways:
+        if is_complete(way):
+            batch.append(way)
         else:
-            return None, None
-    # first converting the json file, which is delivered by overpass to geojson,
-    # then obtaining coordinates and surface areas of all buildings inside the
-    # 'big' rectangle.
-    geojson_data = convert_overpass_json_to_geojson(data)
-
-    building_coord, building_surface_areas = (
-        obtain_areas_and_mean_coordinates_from_geojson(geojson_data)
-    )
-    # excluding the buildings which are outside the drawn boundary
-    mask_building_within_boundaries = {
-        key: is_point_in_boundaries(value, df.to_numpy().tolist())
-        for key, value in building_coord.items()
-    }
-    building_coordinates_within_boundaries = {
-        key: value
-        for key, value in building_coord.items()
-        if mask_building_within_boundaries[key]
-    }
-    return data, building_coordinates_within_boundaries
+            logger.warning("Skipping way %s with missing nodes", way["id"])
+    if batch:
+        yield from buildings(batch)
 
 
 def convert_overpass_json_to_geojson(json_dict):
@@ -116,39 +278,108 @@ def obtain_areas_and_mean_coordinates_from_geojson(geojson: dict):
 
     if len(geojson["features"]) != 0:
         reference_coordinate = geojson["features"][0]["geometry"]["coordinates"][0][0]
-        for building in geojson["features"]:
-            latitudes_longitudes = list(building["geometry"]["coordinates"][0])
-            latitudes = [x[0] for x in latitudes_longitudes]
-            longitudes = [x[1] for x in latitudes_longitudes]
-            mean_coord = [np.mean(latitudes), np.mean(longitudes)]
-            xy_coordinates = [
-                xy_coordinates_from_latitude_longitude(
-                    latitude=latitudes_longitudes[edge][0],
-                    longitude=latitudes_longitudes[edge][1],
-                    ref_latitude=reference_coordinate[0],
-                    ref_longitude=reference_coordinate[1],
-                )
-                for edge in range(len(latitudes))
-            ]
-            polygon = geometry.Polygon(xy_coordinates)
-            area = polygon.area
-            perimeter = polygon.length
-            # TODO check what these magic numbers mean
-            min_valid_area = 4
-            compactness_lower_bound = 0.81
-            compactness_upper_bound = 1.91
-            max_compact_building_area = 8
-
-            compactness = 4 * np.pi * area / (perimeter**2) if perimeter else 0
-            if area > min_valid_area and not (
-                compactness_lower_bound < compactness < compactness_upper_bound
-                and area < max_compact_building_area
-            ):
-                building_mean_coordinates[building["property"]["@id"]] = mean_coord
-                building_surface_areas[building["property"]["@id"]] = area
+        for building_id, mean_coord, area in buildings_from_rings(
+            [building["property"]["@id"] for building in geojson["features"]],
+            [
+                building["geometry"]["coordinates"][0]
+                for building in geojson["features"]
+            ],
+            reference_coordinate,
+        ):
+            building_mean_coordinates[building_id] = mean_coord
+            building_surface_areas[building_id] = area
     return building_mean_coordinates, building_surface_areas
 
 
+def buildings_from_rings(building_ids, rings, reference_coordinate):
+    # (id, [lat, lon], area) of the outlines recognized as buildings, see building_metrics
+    metrics = building_metrics(rings, reference_coordinate)
+    return [
+        (building_id, [latitude, longitude], area)
+        for building_id, latitude, longitude, area, is_building in zip(
+            building_ids,
+            metrics["latitude"].tolist(),
+            metrics["longitude"].tolist(),
+            metrics["area"].tolist(),
+            metrics["is_building"],
+            strict=True,
+        )
+        if is_building
+    ]
+
+
+def building_metrics(rings, reference_coordinate):
+    """
+    Mean coordinates, surface areas, perimeters and compactness of many buildings at once. The vertices of all
+    outlines are packed into flat arrays, projected to plane coordinates in one call and the metrics of each outline
+    are summed per outline (shoelace formula for the area, closing the outline like shapely.Polygon).
+
+    Parameters
+    ----------
+    rings (list):
+        Outlines of the buildings, each in format [[lat1, lon1], ..., [latn, lonn]]
+
+    reference_coordinate (list or tuple):
+        Reference [lat, lon] of the conversion to plane coordinates
+
+    Returns
+    -------
+        dict: Arrays "latitude" and "longitude" (mean of the vertices), "area" (m²), "perimeter" (m), "compactness"
+            and "is_building" (False for outlines that are too small or compact small shapes)
+    """
+    n_rings = len(rings)
+    lengths = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=n_rings)
+    vertices = np.array(
+        [vertex for ring in rings for vertex in ring], dtype=float
+    ).reshape(-1, 2)
+    ring_index = np.repeat(np.arange(n_rings), lengths)
+    starts = np.cumsum(lengths) - lengths
+
+    # index of the next vertex of the outline, the last vertex is connected to the first one
+    next_vertex = np.arange(len(vertices)) + 1
+    closed = lengths > 0
+    next_vertex[(starts + lengths - 1)[closed]] = starts[closed]
+
+    def sum_per_ring(values):
+        return np.bincount(ring_index, weights=values, minlength=n_rings)
+
+    x, y = xy_coordinates_from_latitude_longitude(
+        latitude=vertices[:, 0],
+        longitude=vertices[:, 1],
+        ref_latitude=reference_coordinate[0],
+        ref_longitude=reference_coordinate[1],
+    )
+    # relative to the first vertex of the outline, for the precision of the shoelace formula
+    x = x - x[starts[ring_index]]
+    y = y - y[starts[ring_index]]
+    area = np.abs(sum_per_ring(x * y[next_vertex] - x[next_vertex] * y)) / 2
+    perimeter = sum_per_ring(np.hypot(x[next_vertex] - x, y[next_vertex] - y))
+
+    # TODO check what these magic numbers mean
+    min_valid_area = 4
+    compactness_lower_bound = 0.81
+    compactness_upper_bound = 1.91
+    max_compact_building_area = 8
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        compactness = np.where(perimeter > 0, 4 * np.pi * area / perimeter**2, 0)
+        latitude = sum_per_ring(vertices[:, 0]) / lengths
+        longitude = sum_per_ring(vertices[:, 1]) / lengths
+    is_building = (area > min_valid_area) & ~(
+        (compactness_lower_bound < compactness)
+        & (compactness < compactness_upper_bound)
+        & (area < max_compact_building_area)
+    )
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "area": area,
+        "perimeter": perimeter,
+        "compactness": compactness,
+        "is_building": is_building,
+    }
+
+
 def obtain_mean_coordinates_from_geojson(df):
     """
     This function creates a dictionary with the 'id' of each building as a key
@@ -208,13 +439,39 @@ def is_point_in_boundaries(point_coordinates: tuple, boundaries: tuple):
     return polygon.contains(point)
 
 
-def are_points_in_boundaries(df, boundaries):
+def points_in_boundaries(latitudes, longitudes, boundaries):
+    """
+    Vectorized version of is_point_in_boundaries for many points: the polygon is built and prepared once and the
+    points are tested in one call.
+
+    Parameter
+    ---------
+    latitudes (array-like):
+        Latitudes of the points
+
+    longitudes (array-like):
+        Longitudes of the points
+
+    boundaries (list, tuple or np.ndarray):
+        Coordinates of the angle of the polygon forming the boundaries in format
+        [[lat1, lon1], [lat2, lon2], ..., [latn, lonn]] for a polygon with n vertices.
+
+    Returns
+    -------
+        np.ndarray: Boolean mask, True for the points inside the boundaries (not on them)
+    """
     polygon = geometry.Polygon(boundaries)
-    df["inside_boundary"] = df.apply(
-        lambda row: polygon.contains(
-            geometry.Point([row["latitude"], row["longitude"]]),
-        ),
-        axis=1,
+    shapely.prepare(polygon)
+    return shapely.contains_xy(
+        polygon,
+        np.asarray(latitudes, dtype=float),
+        np.asarray(longitudes, dtype=float),
+    )
+
+
+def are_points_in_boundaries(df, boundaries):
+    df["inside_boundary"] = points_in_boundaries(
+        df["latitude"], df["longitude"], boundaries
     )
     return df["inside_boundary"]
 
@@ -249,8 +506,8 @@ def xy_coordinates_from_latitude_longitude(
     """
 
     r = 6371000  # Radius of the earth [m]
-    latitude_rad = math.radians(latitude)
-    longitude_rad = math.radians(longitude)
+    latitude_rad = np.radians(latitude)
+    longitude_rad = np.radians(longitude)
     ref_latitude_rad = math.radians(ref_latitude)
     ref_longitude_rad = math.radians(ref_longitude)
 
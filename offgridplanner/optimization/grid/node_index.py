@@ -0,0 +1,91 @@
+"""
+In-memory spatial index of the nodes (consumers and power house) edited on the map. It is built once per request over
+the nodes of the project and answers the queries of the consumer editing views without scanning all nodes: nodes
+closer than a tolerance to another node and nodes inside a drawn boundary.
+
+The nodes are indexed in a local equirectangular projection around their mean latitude, so distances are in metres.
+The projection only scales the coordinates, so a node is inside a boundary in the projection exactly when it is in
+latitude/longitude (as tested by identify_consumers_on_map.points_in_boundaries).
+"""
+
+import math
+
+import numpy as np
+import shapely
+
+from config.settings.base import NODE_DUPLICATE_TOLERANCE
+
+EARTH_RADIUS = 6371000  # [m]
+
+
+class NodeIndex:
+    # STRtree over the nodes, the positions in the tree are the positions of the nodes as given (e.g. df rows)
+    def __init__(self, latitudes, longitudes):
+        latitudes = np.asarray(latitudes, dtype=float)
+        self.ref_latitude = float(latitudes.mean()) if len(latitudes) else 0.0
+        self.points = shapely.points(self.xy(latitudes, longitudes))
+        self.tree = shapely.STRtree(self.points)
+
+    @classmethod
+    def from_df(cls, df):
+        """Index of the nodes of a DataFrame with the columns latitude and longitude"""
+        if df.empty:
+            return cls([], [])
+        return cls(df["latitude"], df["longitude"])
+
+    def __len__(self):
+        return len(self.points)
+
+    def xy(self, latitudes, longitudes):
+        """Coordinates (x, y) in metres of points in the projection of the index"""
+        scale = math.radians(1) * EARTH_RADIUS
+        return np.column_stack(
+            [
+                np.asarray(longitudes, dtype=float)
+                * scale
+                * math.cos(math.radians(self.ref_latitude)),
+                np.asarray(latitudes, dtype=float) * scale,
+            ]
+        ).reshape(-1, 2)
+
+    def duplicated(self, tolerance=NODE_DUPLICATE_TOLERANCE):
+        """
+        Boolean mask of the nodes closer than tolerance (in metres) to an earlier kept node, like DataFrame.duplicated
+        with keep="first" (a tolerance of 0 only matches identical coordinates). The nodes are compared only to the
+        kept nodes, so a chain of nodes each closer than tolerance to the previous one is thinned out, not dropped.
+        """
+        nodes, others = self.tree.query(
+            self.points, predicate="dwithin", distance=tolerance
+        )
+        earlier = others < nodes
+        order = np.argsort(nodes[earlier], kind="stable")
+        nodes, others = nodes[earlier][order], others[earlier][order]
+        mask = np.zeros(len(self), dtype=bool)
+        # In the order of the nodes, the earlier node of each pair is already decided
+        for node, other in zip(nodes.tolist(), others.tolist(), strict=True):
+            if not mask[other]:
+                mask[node] = True
+        return mask
+
+    def within(self, boundaries):
+        """
+        Boolean mask of the nodes inside (not on) the boundaries [[lat1, lon1], ..., [latn, lonn]] of a polygon
+        """
+        boundaries = np.asarray(boundaries, dtype=float)
+        polygon = shapely.Polygon(self.xy(boundaries[:, 0], boundaries[:, 1]))
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.tree.query(polygon, predicate="contains")] = True
+        return mask
+
+
+def duplicated_consumers(df, tolerance=NODE_DUPLICATE_TOLERANCE):
+    """
+    Boolean mask of the consumers of a DataFrame of nodes closer than tolerance (in metres) to an earlier kept
+    consumer (see NodeIndex.duplicated). Other nodes, like the power house, are never marked.
+    """
+    mask = np.zeros(len(df), dtype=bool)
+    if df.empty:
+        return mask
+    consumers = (df["node_type"] == "consumer").to_numpy()
+    mask[consumers] = NodeIndex.from_df(df[consumers]).duplicated(tolerance)
+    return mask
@@ -1,13 +1,19 @@
+import csv
 import io
 import logging
 import os
+import time
+from contextlib import contextmanager
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import pycountry
 from country_bounding_boxes import country_subunits_by_iso_code
 from django.core.exceptions import ValidationError
 from django.http import JsonResponse
+from pyarrow import csv as pa_csv
+from pyarrow.lib import ArrowInvalid
 from rest_framework.generics import get_object_or_404
 
 from config.settings.base import DEFAULT_COUNTRY
@@ -20,6 +26,17 @@ from offgridplanner.projects.models import Project
 
 logger = logging.getLogger(__name__)
 
+CONSUMER_DEFAULTS = {
+    "consumer_detail": "",
+    "consumer_type": "household",
+    "custom_specification": "",
+    "shs_options": 0,
+}
+# Machines of a custom_specification entry, e.g. "Milling Machine (7.5kW);2 x Welder (5.25kW)", without the number
+CUSTOM_LOAD_PATTERN = r"(?:^|;)(?:\d[^;]*? x )?([^;]*)"
+# Number of rows listed per error of an imported file
+MAX_REPORTED_ROWS = 10
+
 
 def validate_file_extension(filename):
     allowed_extensions = ["csv", "xlsx"]
@@ -29,24 +46,43 @@ def validate_file_extension(filename):
     return True, file_extension
 
 
+def read_csv_upload(file):
+    """
+    Read an uploaded CSV file, parsed (multithreaded) directly from the upload stream. Empty fields are missing values
+    as in pandas. The columns of CONSUMER_DEFAULTS are read as strings, so their values are validated as written
+    instead of as inferred numbers (e.g. shs_options with missing values as floats).
+    """
+    header = next(csv.reader([file.readline().decode("utf-8-sig")]), [])
+    file.seek(0)
+    column_types = {
+        name: pa.string()
+        for name in header
+        if name.strip().lower() in CONSUMER_DEFAULTS
+    }
+    return pa_csv.read_csv(
+        file,
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types, strings_can_be_null=True
+        ),
+    ).to_pandas()
+
+
 def convert_file_to_df(file, file_extension):
+    if not file.size:
+        return JsonResponse({"responseMsg": "Uploaded file is empty."}, status=400)
     try:
         if file_extension == "csv":
-            decoded_content = file.read().decode("utf-8")
-            df = pd.read_csv(io.StringIO(decoded_content))
+            df = read_csv_upload(file)
         else:  # "xlsx"
             df = pd.read_excel(io.BytesIO(file.read()), engine="openpyxl")
 
-    except UnicodeDecodeError:
-        return JsonResponse(
-            {"responseMsg": "File encoding error. Please check the file format."},
-            status=400,
-        )
-    except pd.errors.ParserError:
-        return JsonResponse(
-            {"responseMsg": "Error parsing the file. Ensure it is properly formatted."},
-            status=400,
-        )
+    except (UnicodeDecodeError, pd.errors.ParserError, ArrowInvalid) as e:
+        # pyarrow reports invalid UTF-8 as ArrowInvalid ("CSV conversion error to string: invalid UTF8 data")
+        if isinstance(e, UnicodeDecodeError) or "UTF8" in str(e):
+            msg = "File encoding error. Please check the file format."
+        else:
+            msg = "Error parsing the file. Ensure it is properly formatted."
+        return JsonResponse({"responseMsg": msg}, status=400)
     except OSError as e:
         return JsonResponse(
             {"responseMsg": f"File read/write error: {e!s}"}, status=500
@@ -73,9 +109,9 @@ def set_default_values(df, defaults):
     return df
 
 
-def validate_column_inputs(input_values, column):
+def allowed_column_values():
     # TODO get these directly from load profiles instead of manual
-    allowed_values = {
+    return {
         "consumer_type": {"household", "enterprise", "public_service"},
         "shs_options": {0, 1},
         "consumer_detail": {"", "default"}
@@ -87,26 +123,87 @@ def validate_column_inputs(input_values, column):
         }
         | {""},
     }
-    invalid_values = set(input_values) - allowed_values[column]
-    if invalid_values:
-        error = f"Invalid consumer_type values: {list(invalid_values)}. Allowed: {allowed_values[column]}"
-        raise ValidationError(error)
 
 
-def convert_column_types(df, column_types):
-    for col, dtype in column_types.items():
-        try:
-            df[col] = df[col].astype(dtype)
-        except ValueError as e:
-            error = f"Error converting '{col}' to {dtype.__name__}: {e}"
-            raise ValidationError(error) from e
-    return df
+def invalid_values_mask(values, allowed):
+    """
+    Boolean mask of the values which are not allowed, missing values included. The values are converted to a
+    categorical, so each distinct value is only checked once.
+    """
+    categorical = pd.Categorical(values)
+    # The code of missing values is -1, i.e. the appended last element
+    is_invalid = np.append(~categorical.categories.isin(list(allowed)), True)
+    return is_invalid[categorical.codes]
+
+
+def rows_text(rows):
+    """Row numbers in the imported file (the header is row 1) of the positions of the DataFrame rows"""
+    rows = np.unique(rows) + 2
+    text = ", ".join(str(row) for row in rows[:MAX_REPORTED_ROWS])
+    if len(rows) > MAX_REPORTED_ROWS:
+        text += f" and {len(rows) - MAX_REPORTED_ROWS} more"
+    return text
+
+
+def invalid_custom_loads(custom_specification, allowed):
+    """
+    Entries of custom_specification with machines which are not allowed. An entry may list several machines
+    separated by ";", each distinct entry is only split once.
+    Returns:
+        tuple: Boolean mask of the invalid entries and the sorted invalid machines
+    """
+    entries = pd.Categorical(custom_specification.astype(str))
+    loads = (
+        pd.Series(entries.categories, dtype=object)
+        .str.extractall(CUSTOM_LOAD_PATTERN)[0]
+        .fillna("")
+    )
+    invalid = invalid_values_mask(loads, allowed)
+    invalid_entries = np.unique(loads.index.get_level_values(0)[invalid])
+    return np.isin(entries.codes, invalid_entries), sorted(set(loads[invalid]))
+
+
+def invalid_value_errors(df):
+    """
+    Errors of the invalid values of the categorical columns of imported consumer data, all columns are validated in
+    bulk.
+    Parameters:
+        df (pd.DataFrame): Consumer data with a RangeIndex and the columns of CONSUMER_DEFAULTS
+    Returns:
+        list: One error message per column with invalid values, with the rows and the values
+    """
+    allowed_values = allowed_column_values()
+    invalid_columns = {}
+    for column, values in {
+        "consumer_type": df["consumer_type"],
+        "shs_options": pd.to_numeric(df["shs_options"], errors="coerce"),
+        "consumer_detail": df["consumer_detail"],
+    }.items():
+        invalid = invalid_values_mask(values, allowed_values[column])
+        invalid_columns[column] = invalid, sorted({str(v) for v in df[column][invalid]})
+    invalid_columns["custom_specification"] = invalid_custom_loads(
+        df["custom_specification"], allowed_values["custom_specification"]
+    )
+    return [
+        f"Invalid {column} values in rows {rows_text(np.flatnonzero(invalid))}: {invalid_values}. "
+        f"Allowed: {sorted(str(value) for value in allowed_values[column])}"
+        for column, (invalid, invalid_values) in invalid_columns.items()
+        if invalid.any()
+    ]
 
 
 def get_country_bounds(proj_id):
     project = get_object_or_404(Project, id=proj_id)
+    return get_country_bounds_by_code(project.country)
+
 
-    country = project.country
+def get_country_bounds_by_code(country):
+    """
+    Parameters:
+        country (str): ISO 3166-1 alpha-2 code of the country
+    Returns:
+        dict: Bounding box of the country with the keys longitude_min, latitude_min, longitude_max, latitude_max
+    """
     country_verbose = pycountry.countries.get(alpha_2=country).name
     country_info = country_subunits_by_iso_code(country)
     bboxes = {c.subunit: c.bbox for c in country_info}
@@ -134,85 +231,76 @@ def get_country_bounds(proj_id):
     return bounds_data
 
 
-def check_geographic_bounds(df, proj_id):
+def geographic_bounds_errors(df, proj_id):
+    """Errors of the consumers too far from each other or outside the country of the project"""
     max_distance = float(os.environ.get("MAX_LAT_LON_DIST", 0.15))
+    errors = []
     if (
         df["latitude"].max() - df["latitude"].min() > max_distance
         or df["longitude"].max() - df["longitude"].min() > max_distance
     ):
-        error_msg = "Distance between consumers exceeds maximum allowed distance."
-        raise ValidationError(error_msg)
+        errors.append("Distance between consumers exceeds maximum allowed distance.")
 
     country_bounds = get_country_bounds(proj_id)
-    out_of_bounds = df[
+    out_of_bounds = (
         (df["latitude"] < country_bounds["latitude_min"])
         | (df["latitude"] > country_bounds["latitude_max"])
         | (df["longitude"] < country_bounds["longitude_min"])
         | (df["longitude"] > country_bounds["longitude_max"])
-    ]
-    if not out_of_bounds.empty:
-        error_msg = (
-            "Some latitude/longitude values are outside the selected country bounds."
+    )
+    if out_of_bounds.any():
+        errors.append(
+            f"Some latitude/longitude values are outside the selected country bounds (rows "
+            f"{rows_text(np.flatnonzero(out_of_bounds))})."
         )
-        raise ValidationError(error_msg)
+    return errors
 
 
 def check_imported_consumer_data(df, proj_id):
-    """Validate imported consumer data."""
+    """
+    Validate imported consumer data. All values are validated in bulk and all errors are reported at once.
+    Parameters:
+        df (pd.DataFrame): Imported consumer data, see convert_file_to_df
+        proj_id (int): Id of the project, its country bounds the consumers
+    Returns:
+        tuple: Consumer data with the columns of the map elements and an empty message
+    Raises:
+        ValidationError: With one message per kind of invalid value and the rows in which it occurs
+    """
     if df.empty:
         error = "No data could be read."
         raise ValidationError(error)
 
     check_missing_columns(df, required_columns=["latitude", "longitude"])
-    # Default values
-    defaults = {
-        "consumer_detail": "",
-        "consumer_type": "household",
-        "custom_specification": "",
-        "shs_options": 0,
-    }
-    df = set_default_values(df, defaults)
+    df = set_default_values(df.reset_index(drop=True), CONSUMER_DEFAULTS)
+    for col, val in CONSUMER_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = val
+
+    errors = []
+    for col in ["latitude", "longitude"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+        if df[col].isna().any():
+            errors.append(
+                f"Missing or non-numeric {col} values in rows {rows_text(np.flatnonzero(df[col].isna()))}."
+            )
+    errors += invalid_value_errors(df)
+    if not errors:
+        errors += geographic_bounds_errors(df, proj_id)
+    if errors:
+        raise ValidationError(errors)
+
+    # Read as strings from CSV files
+    df["shs_options"] = pd.to_numeric(df["shs_options"])
+    df = df.astype(
+        {
+            "shs_options": int,
+            "consumer_type": str,
+            "consumer_detail": str,
+            "custom_specification": str,
+        }
+    )
     df["is_connected"], df["how_added"], df["node_type"] = True, "automatic", "consumer"
-    # Validate column inputs
-    for col in [
-        "consumer_type",
-        "shs_options",
-        "consumer_detail",
-        "custom_specification",
-    ]:
-        if col == "custom_specification":
-            custom_loads = df.loc[df[col] != "", col].tolist()
-            processed_loads = []
-            for entry in custom_loads:
-                # split if multiple machinery entries in one enterprise
-                machinery = entry.split(";")
-                # separate machine name for validation
-                processed_entry = [
-                    (
-                        load.split(" x ", 1)[1]
-                        if " x " in load and load[0].isdigit()
-                        else load
-                    )
-                    for load in machinery
-                ]
-                # add to processed loads list
-                processed_loads.extend(processed_entry)
-            validate_column_inputs(processed_loads, col)
-        else:
-            validate_column_inputs(set(df[col]), col)
-
-    # Convert column types
-    column_types = {
-        "latitude": float,
-        "longitude": float,
-        "shs_options": int,
-        "consumer_type": str,
-        "custom_specification": str,
-        "is_connected": bool,
-    }
-    convert_column_types(df, column_types)
-    # Check geographic bounds
-    check_geographic_bounds(df, proj_id)
     df = df[
         [
             "latitude",
@@ -279,3 +367,30 @@ def check_imported_demand_data(df, project_dict):
 
     df.index = ts.to_numpy()[: len(df.index)]
     return df.to_frame("demand"), ""
+
+
+class StageTimer:
+    """Wall-clock duration of named stages of a request, the stages may run in different threads"""
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = time.perf_counter() - started
+
+    def server_timing(self):
+        """Value of a Server-Timing header, so the stages show up in the network tab of the browser"""
+        return ", ".join(
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in self.durations.items()
+        )
+
+    def __str__(self):
+        return ", ".join(
+            f"{name} {duration:.2f} s" for name, duration in self.durations.items()
+        )
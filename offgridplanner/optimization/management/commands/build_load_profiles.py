@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from offgridplanner.optimization.supply.demand_estimation import LOAD_PROFILES
+
+
+class Command(BaseCommand):
+    # Prebuilds the memory-mapped load profile array, so that the web and celery workers can share it without any of
+    # them having to parse the parquet file
+    help = "Build the memory-mapped load profile array from the parquet file"
+
+    def handle(self, *args, **options):
+        LOAD_PROFILES.build()
+        self.stdout.write(
+            self.style.SUCCESS(f"Load profiles written to {LOAD_PROFILES.array_path}")
+        )
@@ -0,0 +1,58 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from config.settings.base import DEFAULT_COUNTRY
+from config.settings.base import SOLAR_POTENTIAL_RASTER_PATH
+from offgridplanner.optimization.helpers import get_country_bounds_by_code
+from offgridplanner.optimization.supply.solar_potential import build_solar_raster
+
+
+class Command(BaseCommand):
+    # Precomputes the solar potential of the whole service country, so starting a calculation only needs a lookup
+    # instead of a pvlib run. Load the weather data first (see load_weather_data command), otherwise every grid point
+    # is requested from the weather data API.
+    help = "Build the solar potential raster covering the bounding box of a country"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--country",
+            default=DEFAULT_COUNTRY[0],
+            help="ISO 3166-1 alpha-2 code of the country",
+        )
+        parser.add_argument(
+            "--resolution",
+            type=float,
+            default=0.25,
+            help="Distance of the grid points in degrees (0.25 is the ERA5 grid)",
+        )
+        parser.add_argument(
+            "--year", type=int, default=2022, help="Reference year of the raster"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of worker processes (default: one per CPU)",
+        )
+        parser.add_argument("--output", default=SOLAR_POTENTIAL_RASTER_PATH)
+
+    def handle(self, *args, **options):
+        bounds = get_country_bounds_by_code(options["country"])
+        start = pd.Timestamp(year=options["year"], month=1, day=1)
+        dt_index = pd.date_range(
+            start, start + pd.DateOffset(years=1), freq="h", inclusive="left"
+        )
+        started = time.perf_counter()
+        raster = build_solar_raster(
+            bounds, options["resolution"], dt_index, workers=options["workers"]
+        )
+        raster.save(options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Solar potential of {raster.lats.size} x {raster.lons.size} grid points "
+                f"({raster.n_missing} without weather data) written to {options['output']} "
+                f"in {time.perf_counter() - started:.1f} s"
+            )
+        )
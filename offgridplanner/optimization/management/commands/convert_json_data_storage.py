@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from offgridplanner.optimization.models import DemandCoverage
+from offgridplanner.optimization.models import DurationCurve
+from offgridplanner.optimization.models import Emissions
+from offgridplanner.optimization.models import EnergyFlow
+from offgridplanner.optimization.models import Links
+from offgridplanner.optimization.models import Nodes
+
+JSON_DATA_MODELS = [Nodes, Links, EnergyFlow, DurationCurve, DemandCoverage, Emissions]
+
+
+class Command(BaseCommand):
+    # Converts the stored dataframes of existing rows into the given storage format (see JSON_DATA_STORAGE in the
+    # settings). Rows that are already stored in the target format are skipped.
+    help = "Convert the stored dataframes of the optimization models to Arrow or JSON storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--storage", choices=["arrow", "json"], default="arrow", type=str
+        )
+        parser.add_argument("--batch-size", default=100, type=int)
+
+    def handle(self, *args, **options):
+        storage = options["storage"]
+        batch_size = options["batch_size"]
+        for model in JSON_DATA_MODELS:
+            if storage == "arrow":
+                qs = model.objects.filter(data_arrow__isnull=True, data__isnull=False)
+            else:
+                qs = model.objects.filter(data_arrow__isnull=False)
+
+            converted = []
+            n_converted = 0
+            for obj in qs.iterator(chunk_size=batch_size):
+                obj.set_df(obj.df, storage=storage)
+                converted.append(obj)
+                if len(converted) == batch_size:
+                    model.objects.bulk_update(converted, ["data", "data_arrow"])
+                    n_converted += len(converted)
+                    converted = []
+            model.objects.bulk_update(converted, ["data", "data_arrow"])
+            n_converted += len(converted)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Converted {n_converted} {model.__name__} rows to {storage}"
+                )
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from offgridplanner.optimization.schemas import SCHEMA_REGISTRY
+
+
+class Command(BaseCommand):
+    # Refreshes the vendored schemas which are used for validation when the simulation server is unreachable, the
+    # refreshed files are committed with the code
+    help = (
+        "Refresh the vendored JSON schemas in SIM_SCHEMA_DIR from the simulation server"
+    )
+
+    def handle(self, *args, **options):
+        for path in SCHEMA_REGISTRY.dump():
+            self.stdout.write(self.style.SUCCESS(f"Schema written to {path}"))
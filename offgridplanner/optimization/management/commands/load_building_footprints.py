@@ -0,0 +1,90 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from config.settings.base import BUILDING_TILE_ZOOM
+from offgridplanner.optimization.grid.building_store import EXTRACT_SUFFIXES
+from offgridplanner.optimization.grid.building_store import extract_boundary
+from offgridplanner.optimization.grid.building_store import iter_extract_buildings
+from offgridplanner.optimization.grid.building_store import mark_tiles_complete
+from offgridplanner.optimization.grid.building_store import store_buildings
+from offgridplanner.optimization.grid.building_store import tiles_within
+from offgridplanner.optimization.models import BuildingTile
+
+
+class Command(BaseCommand):
+    # Fills the local building store, so the buildings inside a drawn boundary are found without requesting the
+    # Overpass API. Already stored buildings are skipped, so an extract can be loaded again. Only the tiles lying
+    # completely inside the area of the extract are marked complete, the buildings of the tiles at its edge are
+    # requested from Overpass when needed.
+    help = (
+        "Load the buildings of an OSM extract (.osm.pbf, .geojson, .geojsonseq or Overpass .json) into the local "
+        "building store"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="OSM extract file")
+        parser.add_argument(
+            "--bbox",
+            type=float,
+            nargs=4,
+            metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"),
+            help="Bounding box of the extract (by default the one in the header of a .osm.pbf file)",
+        )
+        parser.add_argument(
+            "--boundary",
+            help="GeoJSON file with the polygon the extract was cut with",
+        )
+        parser.add_argument(
+            "--zoom",
+            type=int,
+            default=BUILDING_TILE_ZOOM,
+            help="Zoom level of the tiles, must match BUILDING_TILE_ZOOM to be used",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of buildings written per transaction",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the stored tiles and buildings of this zoom level first",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            msg = f"File {path} does not exist"
+            raise CommandError(msg)
+        if path.suffix not in EXTRACT_SUFFIXES:
+            msg = f"Unsupported file type {path.suffix}, expected one of {', '.join(EXTRACT_SUFFIXES)}"
+            raise CommandError(msg)
+
+        try:
+            boundary = extract_boundary(path, options["bbox"], options["boundary"])
+        except ImportError as e:
+            raise CommandError(str(e)) from e
+        if boundary is None:
+            msg = "The area of the extract is not known, pass it with --bbox or --boundary"
+            raise CommandError(msg)
+
+        zoom = options["zoom"]
+        if options["clear"]:
+            BuildingTile.objects.filter(zoom=zoom).delete()
+        n_buildings = 0
+        try:
+            for batch in iter_extract_buildings(path, options["batch_size"]):
+                n_buildings += store_buildings(batch, zoom=zoom, source=path.name)
+        except ImportError as e:
+            raise CommandError(str(e)) from e
+        complete_tiles = tiles_within(boundary, zoom)
+        mark_tiles_complete(complete_tiles, zoom=zoom, source=path.name)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {n_buildings} buildings from {path}, {len(complete_tiles)} complete tiles"
+            )
+        )
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from offgridplanner.optimization.supply.solar_potential import insert_weather_data
+from offgridplanner.optimization.supply.solar_potential import weather_data_from_netcdf
+
+
+class Command(BaseCommand):
+    # Fills WeatherData, so the solar potential can be computed without requesting the weather data API (e.g. in an
+    # air-gapped deployment). Rows of already stored (lat, lon, dt) are skipped, so a file can be loaded again.
+    help = (
+        "Bulk load weather data from an ERA5 NetCDF file or a Parquet file with the columns dt, lat, lon, ghi, "
+        "dni, dhi, temp_air, wind_speed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NetCDF (.nc) or Parquet (.parquet) file")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50000,
+            help="Number of rows written per transaction",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            msg = f"File {path} does not exist"
+            raise CommandError(msg)
+
+        chunk_size = options["chunk_size"]
+        if path.suffix == ".nc":
+            n_rows = 0
+            for point_df in weather_data_from_netcdf(path):
+                n_rows += insert_weather_data(point_df, chunk_size=chunk_size)
+        elif path.suffix == ".parquet":
+            n_rows = insert_weather_data(pd.read_parquet(path), chunk_size=chunk_size)
+        else:
+            msg = f"Unsupported file type {path.suffix}, expected .nc or .parquet"
+            raise CommandError(msg)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Inserted {n_rows} new weather data rows from {path}")
+        )
@@ -0,0 +1,66 @@
+import sys
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from config.settings.base import SIM_SWEEP_MAX_CONCURRENCY
+from offgridplanner.optimization.sweep import ScenarioSweep
+
+
+def parse_values(value):
+    # "name=v1,v2,..." -> (name, [v1, v2, ...])
+    name, sep, values = value.partition("=")
+    if not sep or not values:
+        msg = f"Invalid parameter {value}, expected name=value1,value2,..."
+        raise CommandError(msg)
+    try:
+        return name, [float(v) for v in values.split(",")]
+    except ValueError as e:
+        msg = f"Invalid values of parameter {name}: {values}"
+        raise CommandError(msg) from e
+
+
+class Command(BaseCommand):
+    # Sensitivity analysis of a project, see offgridplanner.optimization.sweep. The project itself is not changed.
+    help = (
+        "Run the supply optimization of a project for all combinations of the given parameter values and write "
+        "the KPIs of the variants as CSV"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("proj_id", type=int)
+        parser.add_argument(
+            "--param",
+            action="append",
+            required=True,
+            help="Parameter and its values, e.g. interest_rate=5,10 or energy_system.pv.capex=600,800 (repeatable)",
+        )
+        parser.add_argument(
+            "--max-concurrency",
+            type=int,
+            default=SIM_SWEEP_MAX_CONCURRENCY,
+            help="Number of variants simulated at the same time",
+        )
+        parser.add_argument("--output", help="CSV file (default: stdout)")
+
+    def handle(self, *args, **options):
+        parameter_grid = dict(parse_values(value) for value in options["param"])
+        try:
+            sweep = ScenarioSweep(
+                options["proj_id"],
+                parameter_grid,
+                max_concurrency=options["max_concurrency"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+
+        self.stderr.write(f"Running {len(sweep.variants)} variants")
+        results = async_to_sync(sweep.run)()
+        results.to_csv(options["output"] or sys.stdout, index=False)
+        if options["output"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Wrote the KPIs of {len(results)} variants to {options['output']}"
+                )
+            )
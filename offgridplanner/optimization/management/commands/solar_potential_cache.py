@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models import Sum
+
+from offgridplanner.optimization.models import SolarPotential
+
+
+class Command(BaseCommand):
+    # Reports how often the cached solar potential series are reused, and allows clearing the cache e.g. after a
+    # change of the PV model
+    help = "Show statistics of the solar potential cache or clear it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete all cached solar potential series",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            deleted, _ = SolarPotential.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} cached series"))
+            return
+
+        for row in (
+            SolarPotential.objects.values("source")
+            .annotate(entries=Count("id"), hits=Sum("hits"))
+            .order_by("source")
+        ):
+            # Every entry was computed once (a miss), every reuse is a hit
+            requests = row["entries"] + row["hits"]
+            self.stdout.write(
+                f"{row['source']}: {row['entries']} cells, {row['hits']} hits, "
+                f"hit rate {row['hits'] / requests:.1%}"
+            )
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from django.db import models
+
+from config.settings.base import WEATHER_DATA_SEARCH_RADIUS
+
+WEATHER_COLUMNS = ["ghi", "dni", "dhi", "temp_air", "wind_speed"]
+
+
+class WeatherDataQuerySet(models.QuerySet):
+    def first_dt(self):
+        return self.order_by("dt").values_list("dt", flat=True).first()
+
+    def nearest_grid_point(self, lat, lon, dt=None, search_radius=None):
+        """
+        Find the stored grid point closest to a site. Only the rows of a single timestep are read (index on dt, lat,
+        lon), so the lookup does not depend on the length of the stored timeseries.
+        Parameters:
+            lat (float): Latitude of the site
+            lon (float): Longitude of the site
+            dt (datetime): Timestep whose grid points are searched, defaults to the first stored timestep
+            search_radius (float): Maximal distance in degrees of the grid point in latitude and longitude
+        Returns:
+            (float, float): Latitude and longitude of the grid point, None if there is none within the search radius
+        """
+        search_radius = search_radius or WEATHER_DATA_SEARCH_RADIUS
+        dt = dt or self.first_dt()
+        if dt is None:
+            return None
+        points = np.array(
+            self.filter(
+                dt=dt,
+                lat__range=(lat - search_radius, lat + search_radius),
+                lon__range=(lon - search_radius, lon + search_radius),
+            ).values_list("lat", "lon"),
+            dtype=float,
+        )
+        if points.size == 0:
+            return None
+        # An equirectangular distance is accurate enough to choose between neighbouring grid points
+        distance = (points[:, 0] - lat) ** 2 + (
+            (points[:, 1] - lon) * np.cos(np.radians(lat))
+        ) ** 2
+        point = points[np.argmin(distance)]
+        return float(point[0]), float(point[1])
+
+    def timeseries(self, lat, lon, start, end):
+        """
+        Read the weather data of a grid point with a single range scan of the (lat, lon, dt) index
+        Parameters:
+            lat (float): Latitude of the grid point (as returned by nearest_grid_point)
+            lon (float): Longitude of the grid point
+            start (datetime): First timestep
+            end (datetime): Last timestep (inclusive)
+        Returns:
+            pd.DataFrame: Weather data indexed by dt (UTC)
+        """
+        rows = (
+            self.filter(lat=lat, lon=lon, dt__range=(start, end))
+            .order_by("dt")
+            .values_list("dt", *WEATHER_COLUMNS)
+        )
+        df = pd.DataFrame.from_records(list(rows), columns=["dt", *WEATHER_COLUMNS])
+        df["dt"] = pd.to_datetime(df["dt"], utc=True)
+        return df.set_index("dt").astype(float)
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.8 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0008_alter_results_cost_grid_alter_results_cost_shs_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='demandcoverage',
+            name='data_arrow',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='durationcurve',
+            name='data_arrow',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='emissions',
+            name='data_arrow',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='energyflow',
+            name='data_arrow',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='links',
+            name='data_arrow',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='nodes',
+            name='data_arrow',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.8 on 2026-10-16 23:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0009_data_arrow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counts', models.JSONField(default=dict)),
+                ('timeseries', models.BinaryField(null=True)),
+                ('nodes', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='demand_aggregate', to='optimization.nodes')),
+            ],
+        ),
+    ]
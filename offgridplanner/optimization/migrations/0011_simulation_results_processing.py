@@ -0,0 +1,23 @@
+# Generated by Django 5.1.8 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0010_demandaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='results_task_id',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='status_results',
+            field=models.CharField(default='not yet started', max_length=25),
+        ),
+    ]
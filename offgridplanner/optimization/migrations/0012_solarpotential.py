@@ -0,0 +1,31 @@
+# Generated by Django 5.1.8 on 2026-10-16 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0011_simulation_results_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolarPotential',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lat_cell', models.IntegerField()),
+                ('lon_cell', models.IntegerField()),
+                ('resolution', models.FloatField()),
+                ('time_key', models.CharField(max_length=80)),
+                ('source', models.CharField(max_length=25)),
+                ('timeseries', models.BinaryField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lat_cell', 'lon_cell', 'resolution', 'time_key'), name='unique_solar_potential_cell')],
+            },
+        ),
+    ]
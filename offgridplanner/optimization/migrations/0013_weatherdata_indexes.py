@@ -0,0 +1,21 @@
+# Generated by Django 5.1.8 on 2026-10-16 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0012_solarpotential'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['dt', 'lat', 'lon'], name='weather_data_dt_lat_lon'),
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdata',
+            constraint=models.UniqueConstraint(fields=('lat', 'lon', 'dt'), name='unique_weather_data_point'),
+        ),
+    ]
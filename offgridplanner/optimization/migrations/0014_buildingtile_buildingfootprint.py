@@ -0,0 +1,42 @@
+# Generated by Django 5.1.8 on 2026-10-16 23:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0013_weatherdata_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildingTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('source', models.CharField(max_length=255)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('zoom', 'x', 'y'), name='unique_building_tile')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BuildingFootprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('osm_id', models.CharField(max_length=30, unique=True)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('area', models.FloatField()),
+                ('tile', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='buildings', to='optimization.buildingtile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tile', 'latitude', 'longitude'], name='building_tile_lat_lon')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.8 on 2026-10-17 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0014_buildingtile_buildingfootprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReusedSimulationResults',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=80, unique=True)),
+                ('results', models.BinaryField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
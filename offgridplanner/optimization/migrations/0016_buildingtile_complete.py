@@ -0,0 +1,25 @@
+# Generated by Django 5.1.8 on 2026-10-17 00:07
+
+from django.db import migrations, models
+
+
+def mark_overpass_tiles_complete(apps, schema_editor):
+    # Tiles stored from Overpass responses hold all their buildings, the tiles of extracts may be partial
+    BuildingTile = apps.get_model("optimization", "BuildingTile")
+    BuildingTile.objects.filter(source="overpass").update(complete=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0015_reusedsimulationresults'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildingtile',
+            name='complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_overpass_tiles_complete, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.8 on 2026-10-17 02:20
+
+from django.db import migrations
+
+
+def delete_renewables_ninja_solar_potential(apps, schema_editor):
+    # The renewables.ninja fallback is no longer cached, the cells are computed again from weather data
+    SolarPotential = apps.get_model("optimization", "SolarPotential")
+    SolarPotential.objects.filter(source="renewables_ninja").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('optimization', '0016_buildingtile_complete'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_renewables_ninja_solar_potential, migrations.RunPython.noop),
+    ]
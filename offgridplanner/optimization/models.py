@@ -1,15 +1,45 @@
 from io import StringIO
+from typing import NamedTuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from django.db import models
 
+from config.settings.base import JSON_DATA_STORAGE
+from offgridplanner.optimization.managers import WeatherDataQuerySet
+from offgridplanner.optimization.supply.demand_estimation import DEMAND_COLUMNS
+from offgridplanner.optimization.supply.demand_estimation import get_demand_engine
+from offgridplanner.optimization.supply.demand_estimation import time_slice
 from offgridplanner.projects.models import Project
 
 
+def df_to_arrow_bytes(df):
+    """Serialize a DataFrame (including its index and column dtypes) into an Arrow IPC file blob"""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def arrow_bytes_to_df(blob):
+    """Read an Arrow IPC file blob back into a DataFrame without any text parsing"""
+    with pa.ipc.open_file(pa.py_buffer(blob)) as reader:
+        return reader.read_all().to_pandas()
+
+
+class DfCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+
+
 class BaseJsonData(models.Model):
-    # An abstract class for all models that only have a data JSONField
+    # An abstract class for all models that only store a single dataframe, either as a JSON string in data or as
+    # a columnar Arrow blob in data_arrow (see JSON_DATA_STORAGE)
     project = models.OneToOneField(Project, on_delete=models.CASCADE, null=True)
     data = models.JSONField(null=True)
+    data_arrow = models.BinaryField(null=True, editable=False)
 
     class Meta:
         abstract = True
@@ -17,12 +47,103 @@ class BaseJsonData(models.Model):
     def __str__(self):
         return f"{self.__class__.__name__} {self.id}: Project {self.project.name}"
 
+    # The decoded dataframe is memoized per instance and keyed on the identity of the stored payload, so any
+    # reassignment of data / data_arrow (set_df, refresh_from_db, ...) or a save() invalidates it
+    _df_cache = None
+    _df_cache_key = None
+    _df_cache_hits = 0
+    _df_cache_misses = 0
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.clear_df_cache()
+
+    def clear_df_cache(self):
+        self._df_cache = None
+        self._df_cache_key = None
+
+    def df_cache_info(self):
+        return DfCacheInfo(self._df_cache_hits, self._df_cache_misses)
+
+    def _read_df(self):
+        if self.data_arrow:
+            return arrow_bytes_to_df(self.data_arrow)
+        return pd.read_json(StringIO(self.data)) if self.data else None
+
     @property
     def df(self):
-        return pd.read_json(StringIO(self.data)) if self.data else None
+        """
+        Decoded dataframe of the stored payload. Callers get a shallow copy of the cached frame, so adding or
+        dropping columns never alters the cache (and with copy-on-write, neither do writes to values).
+        """
+        key = (self.data, self.data_arrow)
+        if self._df_cache_key is None or any(
+            a is not b for a, b in zip(key, self._df_cache_key, strict=True)
+        ):
+            self._df_cache_misses += 1
+            self._df_cache = self._read_df()
+            self._df_cache_key = key
+        else:
+            self._df_cache_hits += 1
+        return self._df_cache.copy(deep=False) if self._df_cache is not None else None
+
+    @df.setter
+    def df(self, df):
+        self.set_df(df)
+
+    def set_df(self, df, storage=JSON_DATA_STORAGE, orient="columns"):
+        """
+        Store the dataframe in the given storage format, clearing the other one.
+        Parameters:
+            df (pd.DataFrame): Dataframe to be stored
+            storage (str): Either "arrow" or "json"
+            orient (str): Orientation of the JSON string (only relevant for "json")
+        """
+        if storage == "arrow":
+            try:
+                self.data_arrow = df_to_arrow_bytes(df)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Columns with mixed types cannot be represented by an Arrow schema, keep them as JSON
+                storage = "json"
+            else:
+                self.data = None
+        if storage == "json":
+            self.data = df.to_json(orient=orient)
+            self.data_arrow = None
+        elif storage != "arrow":
+            msg = f"Unknown storage format: {storage}"
+            raise ValueError(msg)
 
 
 class Nodes(BaseJsonData):
+    def save(self, *args, **kwargs):
+        nodes_df = self.df
+        super().save(*args, **kwargs)
+        aggregate, _ = DemandAggregate.objects.get_or_create(nodes=self)
+        aggregate.update(nodes_df)
+        # Replace a DemandAggregate loaded before the save, demand_timeseries would read the stale counts otherwise
+        self.demand_aggregate = aggregate
+
+    def demand_timeseries(self, custom_demand, time_range=None):
+        """
+        Uncalibrated demand of the nodes, read from the persisted DemandAggregate (created on first access).
+        Parameters:
+            custom_demand (CustomDemand): CustomDemand object for the project
+            time_range (range): List of indices corresponding to timesteps
+        Returns:
+            pd.DataFrame: Demand by columns "household", "enterprise", "public_service"
+        """
+        if self.pk is None:
+            engine = get_demand_engine()
+            weights = engine.consumer_weights(self.df, custom_demand)
+            return engine.demand(weights, time_range=time_range)
+        try:
+            aggregate = self.demand_aggregate
+        except DemandAggregate.DoesNotExist:
+            aggregate = DemandAggregate(nodes=self)
+            aggregate.update(self.df)
+        return aggregate.demand(custom_demand, time_range=time_range)
+
     def filter_consumers(self, consumer_type):
         """
         Parameters:
@@ -41,7 +162,8 @@ class Nodes(BaseJsonData):
 
     @property
     def have_custom_machinery(self):
-        enterprises = self.df[self.df.consumer_type == "enterprise"]
+        nodes = self.df
+        enterprises = nodes[nodes.consumer_type == "enterprise"]
         machinery = (
             enterprises.groupby(["consumer_type", "consumer_detail"])
             .agg({"custom_specification": ";".join})
@@ -55,6 +177,84 @@ class Links(BaseJsonData):
     pass
 
 
+class DemandAggregate(models.Model):
+    # Consumer counts per load profile column of the project nodes and the resulting enterprise and public service
+    # demand. Whenever the nodes are saved, only the profile columns whose counts changed are added to the stored
+    # timeseries. Household demand only depends on the number of households and the wealth shares of CustomDemand,
+    # so it is computed when reading.
+    nodes = models.OneToOneField(
+        Nodes, on_delete=models.CASCADE, related_name="demand_aggregate"
+    )
+    counts = models.JSONField(default=dict)
+    timeseries = models.BinaryField(null=True, editable=False)
+
+    def __str__(self):
+        return f"DemandAggregate {self.id}: Project {self.nodes.project.name}"
+
+    def count_matrix(self, engine):
+        counts = np.zeros((len(engine.columns), len(DEMAND_COLUMNS)), dtype=np.float32)
+        for i, consumer_type in enumerate(DEMAND_COLUMNS):
+            type_counts = pd.Series(self.counts.get(consumer_type, {}), dtype=float)
+            positions = engine.columns.get_indexer(type_counts.index)
+            known = positions != -1
+            counts[positions[known], i] = type_counts.to_numpy()[known]
+        return counts
+
+    def timeseries_array(self):
+        # enterprise and public service demand as an array of shape (n_timesteps, 2)
+        if not self.timeseries:
+            return None
+        return np.frombuffer(self.timeseries, dtype=np.float64).reshape(-1, 2)
+
+    def update(self, nodes_df):
+        """Apply the count changes of the given node set to the stored counts and timeseries and save"""
+        engine = get_demand_engine()
+        new_counts = engine.consumer_counts(nodes_df)
+        timeseries = self.timeseries_array()
+        if timeseries is None or not new_counts[:, 1:].any():
+            # Start from scratch (this also avoids rounding drift once all consumers are removed)
+            timeseries = np.zeros((len(engine.index), 2))
+            old_counts = np.zeros_like(new_counts)
+        else:
+            timeseries = timeseries.copy()
+            old_counts = self.count_matrix(engine)
+
+        delta = (new_counts - old_counts)[:, 1:]
+        changed = np.flatnonzero(delta.any(axis=1))
+        if changed.size:
+            timeseries += engine.profiles[:, changed] @ delta[changed].astype(
+                np.float64
+            )
+
+        self.timeseries = timeseries.tobytes()
+        self.counts = {
+            consumer_type: {
+                engine.columns[i]: float(new_counts[i, j])
+                for i in np.flatnonzero(new_counts[:, j])
+            }
+            for j, consumer_type in enumerate(DEMAND_COLUMNS)
+        }
+        self.save()
+
+    def demand(self, custom_demand, time_range=None):
+        engine = get_demand_engine()
+        rows = time_slice(time_range)
+        household_columns = engine.household_columns()
+        weights = engine.apply_shares(self.count_matrix(engine), custom_demand)
+        household = (
+            engine.profiles[rows][:, household_columns] @ weights[household_columns, 0]
+        )
+        timeseries = self.timeseries_array()[rows]
+        return pd.DataFrame(
+            {
+                "household": household.astype(np.float64),
+                "enterprise": timeseries[:, 0],
+                "public_service": timeseries[:, 1],
+            },
+            index=engine.index[rows],
+        )
+
+
 class WeatherData(models.Model):
     dt = models.DateTimeField()
     lat = models.FloatField()
@@ -65,24 +265,123 @@ class WeatherData(models.Model):
     dni = models.FloatField(null=True, blank=True)
     dhi = models.FloatField(null=True, blank=True)
 
-    # class Meta:
-    #     unique_together = ("dt", "lat", "lon")
+    objects = WeatherDataQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also the index for reading the timeseries of a grid point (see WeatherDataQuerySet.timeseries)
+            models.UniqueConstraint(
+                fields=["lat", "lon", "dt"], name="unique_weather_data_point"
+            )
+        ]
+        indexes = [
+            # Lookup of the grid points of a single timestep (see WeatherDataQuerySet.nearest_grid_point)
+            models.Index(fields=["dt", "lat", "lon"], name="weather_data_dt_lat_lon"),
+        ]
 
     def __str__(self):
         return f"WeatherData({self.dt}, {self.lat}, {self.lon})"
 
 
+class SolarPotential(models.Model):
+    # DC feed-in timeseries (kW per kWp) of a grid cell, computed at the cell center, so that re-runs and nearby
+    # projects skip the weather data requests and pvlib (see supply.solar_potential.SolarPotentialCache)
+    lat_cell = models.IntegerField()
+    lon_cell = models.IntegerField()
+    resolution = models.FloatField()
+    time_key = models.CharField(max_length=80)
+    source = models.CharField(max_length=25)
+    timeseries = models.BinaryField(editable=False)
+    hits = models.PositiveIntegerField(default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["lat_cell", "lon_cell", "resolution", "time_key"],
+                name="unique_solar_potential_cell",
+            )
+        ]
+
+    def __str__(self):
+        return f"SolarPotential({self.lat_cell}, {self.lon_cell}, {self.time_key})"
+
+    def timeseries_array(self):
+        return np.frombuffer(self.timeseries, dtype=np.float64)
+
+
+class BuildingTile(models.Model):
+    # Tile of the local building footprint store (see grid.building_store), a complete tile without buildings is not
+    # fetched again
+    zoom = models.PositiveSmallIntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    source = models.CharField(max_length=255)
+    # All buildings of the tile are stored, otherwise (e.g. at the edge of an extract) they are requested again
+    complete = models.BooleanField(default=False)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["zoom", "x", "y"], name="unique_building_tile"
+            )
+        ]
+
+    def __str__(self):
+        return f"BuildingTile({self.zoom}/{self.x}/{self.y})"
+
+
+class BuildingFootprint(models.Model):
+    # Mean coordinates and surface area of an OSM building, stored in the tile of its mean coordinates
+    tile = models.ForeignKey(
+        BuildingTile, on_delete=models.CASCADE, related_name="buildings", db_index=False
+    )
+    osm_id = models.CharField(max_length=30, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    area = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # Buildings of the tiles overlapping a bounding box, filtered by their coordinates
+            models.Index(
+                fields=["tile", "latitude", "longitude"],
+                name="building_tile_lat_lon",
+            ),
+        ]
+
+    def __str__(self):
+        return f"BuildingFootprint({self.osm_id})"
+
+
 class Simulation(models.Model):
     project = models.OneToOneField(Project, on_delete=models.CASCADE, null=True)
     token_grid = models.CharField(max_length=80, blank=True, default="")
     token_supply = models.CharField(max_length=80, blank=True, default="")
     status_grid = models.CharField(max_length=25, default="not yet started")
     status_supply = models.CharField(max_length=25, default="not yet started")
+    # Status and celery id of the result processing chain (see tasks.queue_results_processing)
+    status_results = models.CharField(max_length=25, default="not yet started")
+    results_task_id = models.CharField(max_length=50, blank=True, default="")
 
     def __str__(self):
         return f"Simulation {self.id}: Project {self.project.name}"
 
 
+class ReusedSimulationResults(models.Model):
+    # Results of an earlier simulation with an identical input reused for a new token (see
+    # results_cache.reuse_simulation_results). The simulation server does not know these tokens, so the results are
+    # stored durably instead of only in the cache, which may be local to a process or lose entries
+    token = models.CharField(max_length=80, unique=True)
+    results = models.BinaryField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"ReusedSimulationResults({self.token})"
+
+
 class Results(models.Model):
     # TODO potentially remove redundant fields that can just be calculated on the fly (e.g. upfront investment)
     simulation = models.OneToOneField(Simulation, on_delete=models.CASCADE, null=True)
@@ -1,14 +1,15 @@
 # Pre- and post-processing for the grid and supply optimization
+import copy
 import json
+import logging
+from functools import cached_property
 from io import StringIO
 
 import numpy as np
 import pandas as pd
-import requests
 from django.shortcuts import get_object_or_404
-from jsonschema import validate
 
-from config.settings.base import SIM_API_HOST
+from offgridplanner.optimization import costs
 from offgridplanner.optimization.models import DemandCoverage
 from offgridplanner.optimization.models import DurationCurve
 from offgridplanner.optimization.models import Emissions
@@ -16,164 +17,264 @@ from offgridplanner.optimization.models import EnergyFlow
 from offgridplanner.optimization.models import Links
 from offgridplanner.optimization.models import Nodes
 from offgridplanner.optimization.models import Results
+from offgridplanner.optimization.schemas import SCHEMA_REGISTRY
 from offgridplanner.optimization.supply.demand_estimation import get_demand_timeseries
 from offgridplanner.optimization.supply.solar_potential import (
     get_dc_feed_in_sync_db_query,
 )
 from offgridplanner.projects.models import Project
 
+logger = logging.getLogger(__name__)
+
+
+class OptimizationContext:
+    """
+    Project data shared by the pre- and post-processing of an optimization run. The project is loaded together with
+    all its one-to-one relations in a single query, and the derived data (nested dicts with the EPCs, demand, results
+    object) is computed on first use only, so processors constructed with the same context do not re-derive it.
+    """
+
+    RELATED = (
+        "options",
+        "energysystemdesign",
+        "griddesign",
+        "customdemand",
+        "nodes__demand_aggregate",
+        "links",
+        "simulation__results",
+    )
 
-class OptimizationDataHandler:
     def __init__(self, proj_id):
-        self.project = get_object_or_404(Project, id=proj_id)
+        self.project = get_object_or_404(
+            Project.objects.select_related(*self.RELATED), id=proj_id
+        )
         self.options = self.project.options
-        self.energy_system_dict = self.project.energysystemdesign.to_nested_dict()
-        self.supply_components = self.energy_system_dict.keys()
-        self.grid_design_dict = self.project.griddesign.to_nested_dict()
-        self.grid_components = self.grid_design_dict.keys()
         self.tax = 0
         self.wacc = self.project.interest_rate / 100
         self.project_lifetime = self.project.lifetime
-        self.crf = (self.wacc * (1 + self.wacc) ** self.project_lifetime) / (
-            (1 + self.wacc) ** self.project_lifetime - 1
+        self.crf = float(
+            costs.capital_recovery_factor(self.wacc, self.project_lifetime)
         )
+        # Solar potential by site and timesteps, shared with the variants of this context
+        self._solar_potentials = {}
+
+    @cached_property
+    def energy_system_dict(self):
+        return self._add_supply_epc(self.project.energysystemdesign.to_nested_dict())
 
-        self.energy_system_dict = self.add_epc_to_dict(
-            self.energy_system_dict,
+    @cached_property
+    def grid_design_dict(self):
+        return self._add_grid_epc(self.project.griddesign.to_nested_dict())
+
+    def _add_supply_epc(self, energy_system_dict):
+        return self.add_epc_to_dict(
+            energy_system_dict,
             ["battery", "diesel_genset", "inverter", "rectifier", "pv"],
+            energy_system_dict.keys(),
         )
 
-        self.grid_design_dict = self.add_epc_to_dict(
-            self.grid_design_dict, ["distribution_cable", "connection_cable", "pole"]
+    def _add_grid_epc(self, grid_design_dict):
+        grid_design_dict = self.add_epc_to_dict(
+            grid_design_dict, ["distribution_cable", "connection_cable", "pole"]
         )
-        self.grid_design_dict["mg"]["epc"] = self.epc(
-            self.grid_design_dict["mg"]["connection_cost"], 0, self.project.lifetime
+        grid_design_dict["mg"]["epc"] = float(
+            self.epc(
+                grid_design_dict["mg"]["connection_cost"], 0, self.project.lifetime
+            )
         )
+        return grid_design_dict
 
-    @staticmethod
-    def validate_json_with_server_schema(json_obj, model, direction):
-        """Request the corresponding schema from the optimization server and validate against json
+    def variant(
+        self,
+        interest_rate=None,
+        energy_system=None,
+        grid_design=None,
+        custom_demand=None,
+    ):
+        """
+        Context of a variant of the project with changed parameters (e.g. for a scenario sweep), nothing is saved to
+        the database. The EPCs are recomputed, the demand only if the CustomDemand changes, and the solar potential
+        is shared with this context.
         Parameters:
-            json_obj (dict): JSON object to be validated
-            model (str): Either "grid" or "supply"
-            direction (str): Either "input" or "output"
+            interest_rate (float): Interest rate in %
+            energy_system (dict): Changed parameters by component, e.g. {"pv": {"capex": 800}}
+            grid_design (dict): Changed parameters by component, e.g. {"pole": {"capex": 500}}
+            custom_demand (dict): Changed fields of the CustomDemand, e.g. {"very_low": 0.2}
+        Returns:
+            OptimizationContext
+        """
+        variant = copy.copy(self)
+        # The copy of a model instance has its own cache of related objects
+        variant.project = copy.copy(self.project)
+        if interest_rate is not None:
+            variant.project.interest_rate = interest_rate
+            variant.wacc = interest_rate / 100
+            variant.crf = float(
+                costs.capital_recovery_factor(variant.wacc, variant.project_lifetime)
+            )
+
+        energy_system_dict = copy.deepcopy(self.energy_system_dict)
+        for component, parameters in (energy_system or {}).items():
+            energy_system_dict[component]["parameters"].update(parameters)
+        variant.energy_system_dict = variant._add_supply_epc(energy_system_dict)  # noqa: SLF001
+
+        grid_design_dict = copy.deepcopy(self.grid_design_dict)
+        for component, parameters in (grid_design or {}).items():
+            grid_design_dict[component].update(parameters)
+        variant.grid_design_dict = variant._add_grid_epc(grid_design_dict)  # noqa: SLF001
+
+        if custom_demand:
+            variant_demand = copy.copy(self.project.customdemand)
+            for field, value in custom_demand.items():
+                setattr(variant_demand, field, value)
+            variant.project.customdemand = variant_demand
+            variant.__dict__.pop("demand", None)
+        return variant
+
+    def solar_potential(self, lat, lon, dt_index):
+        """DC feed-in of the site, computed once for this context and its variants"""
+        key = (lat, lon, dt_index[0], len(dt_index))
+        if key not in self._solar_potentials:
+            self._solar_potentials[key] = get_dc_feed_in_sync_db_query(
+                lat, lon, dt_index
+            )
+        return self._solar_potentials[key]
+
+    @cached_property
+    def demand(self):
+        """
+        Check if the user has ticked the demand estimation box. If so, calculate the demand from the project nodes,
+        else get the demand from the uploaded timeseries
+        Returns:
+            pd.Series
         """
-        response = requests.get(
-            f"{SIM_API_HOST}/schema/{model}/{direction}", timeout=10
+        if self.options.do_demand_estimation:
+            demand_full_year = get_demand_timeseries(
+                self.project.nodes, self.project.customdemand
+            ).sum(axis=1)
+
+            demand = demand_full_year.iloc[: (self.project.n_days * 24)]
+        else:
+            uploaded_data = self.project.customdemand.uploaded_data
+            demand = pd.read_json(StringIO(uploaded_data))["demand"]
+            # # TODO error is thrown for annual total consumption if full year demand is not defined - tbd fix
+            # if self.n_days == 365:
+            #     self.demand_full_year = self.demand
+        return demand
+
+    def _related_or_create(self, obj, attr, model_cls, **kwargs):
+        # Reverse one-to-one relations loaded by select_related, created if they do not exist yet
+        try:
+            return getattr(obj, attr)
+        except model_cls.DoesNotExist:
+            related = model_cls.objects.create(**kwargs)
+            setattr(obj, attr, related)
+            return related
+
+    @property
+    def simulation(self):
+        return self.project.simulation
+
+    @property
+    def nodes(self):
+        return self._related_or_create(
+            self.project, "nodes", Nodes, project=self.project
         )
-        schema = response.json()
 
-        validate(instance=json_obj, schema=schema)
+    @property
+    def links(self):
+        return self._related_or_create(
+            self.project, "links", Links, project=self.project
+        )
 
-    def annualize(self, value):
-        return value / self.project.n_days * 365 if value is not None else 0
+    @property
+    def results(self):
+        return self._related_or_create(
+            self.simulation, "results", Results, simulation=self.simulation
+        )
 
-    def add_epc_to_dict(self, nested_dict, components):
+    def add_epc_to_dict(self, nested_dict, components, supply_components=()):
         """
         Replaces the parameters "capex", "opex" and "lifetime" inside a nested dictionary with "epc" for all components
-        specified in components.
+        specified in components. The EPC of all components is computed in one vectorized call.
         Parameters:
             nested_dict (dict): Nested dictionary from a NestedModel object
             components (list): List of strings with the component names
+            supply_components (list): Components of the energy system (their parameters are nested in "parameters")
         Returns:
             dict: Edited dict with the epc values
         """
-        if set(components).issubset(self.supply_components):
-            for component in components:
-                capex = nested_dict[component]["parameters"]["capex"]
-                opex = nested_dict[component]["parameters"]["opex"]
-                lifetime = nested_dict[component]["parameters"]["lifetime"]
-                # add periodical costs to dict
-                nested_dict[component]["parameters"]["epc"] = self.epc(
-                    capex, opex, lifetime
-                )
-                # delete parameters that are no longer needed for the optimization (reduce size of the json)
-                # del nested_dict[component]["parameters"]["capex"]
-                # del nested_dict[component]["parameters"]["opex"]
-                # del nested_dict[component]["parameters"]["lifetime"]
-
-        elif set(components).issubset(self.grid_components):
-            for component in components:
-                capex = nested_dict[component]["capex"]
-                opex = 0
-                lifetime = nested_dict[component]["lifetime"]
-                # add periodical costs to dict
-                nested_dict[component]["epc"] = self.epc(capex, opex, lifetime)
-                # delete parameters that are no longer needed for the optimization (reduce size of the json)
-                # del nested_dict[component]["lifetime"]
-
+        if set(components).issubset(supply_components):
+            parameters = [
+                nested_dict[component]["parameters"] for component in components
+            ]
+            opex = [params["opex"] for params in parameters]
+        elif set(components).issubset(nested_dict.keys()):
+            parameters = [nested_dict[component] for component in components]
+            opex = 0
         else:
             err = "Components found neither in grid nor energy system models"
             raise ValueError(err)
 
+        epcs = self.epc(
+            [params["capex"] for params in parameters],
+            opex,
+            [params["lifetime"] for params in parameters],
+        )
+        # add periodical costs to dict
+        for params, component_epc in zip(parameters, epcs.tolist(), strict=True):
+            params["epc"] = component_epc
+            # delete parameters that are no longer needed for the optimization (reduce size of the json)
+            # del params["capex"]
+            # del params["opex"]
+            # del params["lifetime"]
+
         return nested_dict
 
     def epc(self, capex, opex, lifetime):
-        epc = (
-            self.crf
-            * self.capex_multi_investment(
-                capex_0=capex,
-                component_lifetime=lifetime,
-            )
-            + opex
+        """EPC of components (scalars or arrays) with the financial parameters of the project, see costs.epc"""
+        return costs.epc(
+            capex, opex, lifetime, self.project_lifetime, self.wacc, tax=self.tax
         )
 
-        return epc
-
     def capex_multi_investment(self, capex_0, component_lifetime):
-        """
-        Calculates the equivalent CAPEX for components
-        with lifetime less than the self.project lifetime.
+        """Equivalent CAPEX of components including replacements and salvage value, see costs.capex_multi_investment"""
+        return costs.capex_multi_investment(
+            capex_0, component_lifetime, self.project_lifetime, self.wacc, tax=self.tax
+        )
 
-        """
-        # convert the string type into the float type for both inputs
-        capex_0 = float(capex_0)
-        component_lifetime = float(component_lifetime)
-        if self.project_lifetime == component_lifetime:
-            number_of_investments = 1
-        else:
-            number_of_investments = int(
-                round(self.project_lifetime / component_lifetime + 0.5),
-            )
-        first_time_investment = capex_0 * (1 + self.tax)
-        capex = first_time_investment
-        for count_of_replacements in range(1, number_of_investments):
-            if count_of_replacements * component_lifetime != self.project_lifetime:
-                capex += first_time_investment / (
-                    (1 + self.wacc) ** (count_of_replacements * component_lifetime)
-                )
-        # Subtraction of component value at end of life with last replacement (= number_of_investments - 1)
-        # This part calculates the salvage costs
-        if number_of_investments * component_lifetime > self.project_lifetime:
-            last_investment = first_time_investment / (
-                (1 + self.wacc) ** ((number_of_investments - 1) * component_lifetime)
-            )
-            linear_depreciation_last_investment = last_investment / component_lifetime
-            capex = capex - linear_depreciation_last_investment * (
-                number_of_investments * component_lifetime - self.project_lifetime
-            ) / ((1 + self.wacc) ** self.project_lifetime)
-        return capex
 
-    def collect_project_demand(self):
+class OptimizationDataHandler:
+    def __init__(self, proj_id=None, context=None):
         """
-        Check if the user has ticked the demand estimation box. If so, calculate the demand from the project nodes,
-        else get the demand from the uploaded timeseries
-        Returns:
-            pd.DataFrame
+        Parameters:
+            proj_id (int): Id of the project, only used if no context is given
+            context (OptimizationContext): Context of the optimization run, shared by the processors of the run
         """
-        if self.options.do_demand_estimation:
-            demand_full_year = get_demand_timeseries(
-                self.project.nodes, self.project.customdemand
-            ).sum(axis=1)
+        self.context = context if context is not None else OptimizationContext(proj_id)
+        self.project = self.context.project
+        self.options = self.context.options
+        self.energy_system_dict = self.context.energy_system_dict
+        self.supply_components = self.energy_system_dict.keys()
+        self.grid_design_dict = self.context.grid_design_dict
+        self.grid_components = self.grid_design_dict.keys()
+        self.tax = self.context.tax
+        self.wacc = self.context.wacc
+        self.project_lifetime = self.context.project_lifetime
+        self.crf = self.context.crf
 
-            demand = demand_full_year.iloc[: (self.project.n_days * 24)]
-        else:
-            uploaded_data = self.project.customdemand.uploaded_data
-            demand = pd.read_json(StringIO(uploaded_data))["demand"]
-            # # TODO error is thrown for annual total consumption if full year demand is not defined - tbd fix
-            # if self.n_days == 365:
-            #     self.demand_full_year = self.demand
-        return demand
+    @staticmethod
+    def validate_json_with_server_schema(json_obj, model, direction):
+        """Validate json against the corresponding (cached) schema of the optimization server
+        Parameters:
+            json_obj (dict): JSON object to be validated
+            model (str): Either "grid" or "supply"
+            direction (str): Either "input" or "output"
+        """
+        SCHEMA_REGISTRY.validate(json_obj, model, direction)
+
+    def annualize(self, value):
+        return value / self.project.n_days * 365 if value is not None else 0
 
 
 class PreProcessor(OptimizationDataHandler):
@@ -182,18 +283,20 @@ class PreProcessor(OptimizationDataHandler):
     jsons sent to the actual optimizer / simulation server
     """
 
-    def __init__(self, proj_id):
-        super().__init__(proj_id)
-        self.demand = self.collect_project_demand()
+    def __init__(self, proj_id=None, context=None):
+        super().__init__(proj_id, context=context)
+        self.demand = self.context.demand
         self.demand_full_year = self.demand * 365 / self.project.n_days
 
     def get_site_coordinates(self):
         # TODO do currently default coords get set if the user uploads a timeseries instead of selecting consumers?
         #  There should be an input about the project site instead
         default_coords = (9.055158, 7.497112)
-        nodes_qs = Nodes.objects.filter(project=self.project)
-        if nodes_qs.exists():
-            nodes = nodes_qs.get().df
+        try:
+            nodes = self.project.nodes.df
+        except Nodes.DoesNotExist:
+            nodes = None
+        if nodes is not None:
             if not nodes[nodes["consumer_type"] == "power_house"].empty:
                 lat, lon = nodes[nodes["consumer_type"] == "power_house"][
                     "latitude",
@@ -227,11 +330,7 @@ class PreProcessor(OptimizationDataHandler):
 
         start_date_for_json = start_datetime.isoformat()
 
-        solar_potential = get_dc_feed_in_sync_db_query(
-            lat,
-            lon,
-            dt_index,
-        )
+        solar_potential = self.context.solar_potential(lat, lon, dt_index)
 
         sequences = {
             "index": {
@@ -270,22 +369,20 @@ class PreProcessor(OptimizationDataHandler):
 
 
 class GridProcessor(OptimizationDataHandler):
-    def __init__(self, results_json, proj_id):
-        super().__init__(proj_id)
+    def __init__(self, results_json, proj_id=None, context=None):
+        super().__init__(proj_id, context=context)
         self.validate_json_with_server_schema(results_json, "grid", "output")
-        self.results_obj, _ = Results.objects.get_or_create(
-            simulation=self.project.simulation
-        )
-        self.nodes_obj, _ = Nodes.objects.get_or_create(project=self.project)
-        self.links_obj, _ = Links.objects.get_or_create(project=self.project)
+        self.results_obj = self.context.results
+        self.nodes_obj = self.context.nodes
+        self.links_obj = self.context.links
         self.grid_results = results_json
         self.nodes_df = pd.DataFrame(self.grid_results["nodes"])
         self.links_df = pd.DataFrame(self.grid_results["links"])
 
     def grid_results_to_db(self):
         # read the nodes and links data and save to the database
-        self.nodes_obj.data = self.nodes_df.to_json()
-        self.links_obj.data = self.links_df.to_json()
+        self.nodes_obj.df = self.nodes_df
+        self.links_obj.df = self.links_df
         self.nodes_obj.save()
         self.links_obj.save()
         # compute the other results and save to the results object
@@ -356,20 +453,24 @@ class GridProcessor(OptimizationDataHandler):
 
 
 class SupplyProcessor(OptimizationDataHandler):
-    def __init__(self, results_json, proj_id):
-        super().__init__(proj_id)
+    def __init__(self, results_json, proj_id=None, context=None):
+        super().__init__(proj_id, context=context)
         self.validate_json_with_server_schema(results_json, "supply", "output")
-        self.results_obj, _ = Results.objects.get_or_create(
-            simulation=self.project.simulation
-        )
         self.supply_results = results_json
-        nodes_df = self.project.nodes.df
+        # Read after the grid results were saved to the same context, so is_connected is up to date
+        nodes_df = self.context.nodes.df
         self.n_households = len(
             nodes_df[
                 (nodes_df["consumer_type"] == "household")
                 & (nodes_df["is_connected"] == True)  # noqa:E712
             ]
         )
+        logger.debug("Nodes dataframe cache: %s", self.context.nodes.df_cache_info())
+
+    @property
+    def results_obj(self):
+        # Only needed to save the results, a scenario sweep processes them in memory
+        return self.context.results
 
     @staticmethod
     def to_kwh(value):
@@ -593,9 +694,14 @@ class SupplyProcessor(OptimizationDataHandler):
             Emissions: self.emissions_df,
         }
         for model_cls, df in mapping.items():
-            obj, _ = model_cls.objects.get_or_create(project=self.project)
-            obj.data = df.to_json()
-            obj.save()
+            # Encode the dataframe as save() would and write it with a single UPDATE (INSERT for a new project)
+            obj = model_cls(project=self.project)
+            obj.df = df
+            updated = model_cls.objects.filter(project=self.project).update(
+                data=obj.data, data_arrow=obj.data_arrow
+            )
+            if not updated:
+                obj.save()
 
     def supply_results_to_db(self):
         self._parsed_dataframes_to_db()
@@ -699,3 +805,18 @@ class SupplyProcessor(OptimizationDataHandler):
         results.co2_savings = self.annual_co2_savings
 
         results.save()
+
+
+def merge_shared_results(proj_id):
+    """Compute the results depending on both the grid and the supply optimization (after both have been processed)"""
+    results = Results.objects.get(simulation__project__id=proj_id)
+    results.lcoe_share_supply = (
+        (results.epc_total - results.cost_grid) / results.epc_total * 100
+    )
+    results.lcoe_share_grid = 100 - results.lcoe_share_supply
+    assets = ["grid", "diesel_genset", "inverter", "rectifier", "battery", "pv"]
+    results.upfront_invest_total = sum(
+        [getattr(results, f"upfront_invest_{key}") for key in assets]
+    )
+    results.save()
+    return results
@@ -1,5 +1,10 @@
+import asyncio
+import importlib.util
 import json
 import logging
+import os
+import time
+import weakref
 
 import httpx
 import pandas as pd
@@ -7,13 +12,138 @@ import requests
 
 from config.settings.base import RN_API_HOST
 from config.settings.base import RN_API_TOKEN
+from config.settings.base import SIM_CONNECT_TIMEOUT
 from config.settings.base import SIM_GET_URL
 from config.settings.base import SIM_GRID_POST_URL
+from config.settings.base import SIM_MAX_CONNECTIONS
+from config.settings.base import SIM_REQUEST_RETRIES
+from config.settings.base import SIM_REQUEST_TIMEOUT
+from config.settings.base import SIM_RETRY_BACKOFF
 from config.settings.base import SIM_SUPPLY_POST_URL
 from config.settings.base import WEATHER_DATA_API_HOST
 
 logger = logging.getLogger(__name__)
 
+# HTTP/2 is only available if the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+class HTTPClientManager:
+    """
+    Shared keep-alive HTTP clients with connection pooling, timeouts and retries with exponential backoff.
+
+    The sync client is created lazily per process (it is recreated after a fork, e.g. in celery workers), the async
+    client once per event loop and closed when the loop ends. Requests are only retried if they are safe to repeat: GET requests on transport
+    errors and 502/503/504 responses, all other methods only if the connection could not be established.
+    """
+
+    def __init__(
+        self,
+        timeout=SIM_REQUEST_TIMEOUT,
+        connect_timeout=SIM_CONNECT_TIMEOUT,
+        retries=SIM_REQUEST_RETRIES,
+        backoff=SIM_RETRY_BACKOFF,
+        max_connections=SIM_MAX_CONNECTIONS,
+    ):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+        self._client_pid = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _client_kwargs(self):
+        return {
+            "timeout": self.timeout,
+            "limits": self.limits,
+            "http2": HTTP2_AVAILABLE,
+        }
+
+    @property
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = httpx.Client(**self._client_kwargs())
+            self._client_pid = os.getpid()
+        return self._client
+
+    @property
+    def async_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            client = httpx.AsyncClient(**self._client_kwargs())
+            # asyncio.run (also used by async_to_sync) cancels the pending tasks before closing the loop
+            closer = loop.create_task(self._close_on_cancel(client))
+            self._async_clients[loop] = client, closer
+        return self._async_clients[loop][0]
+
+    @staticmethod
+    async def _close_on_cancel(client):
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await client.aclose()
+
+    def close(self):
+        if self._client is not None and self._client_pid == os.getpid():
+            self._client.close()
+        self._client = None
+
+    def _should_retry(self, method, attempt, response=None, error=None):
+        if attempt >= self.retries:
+            return False
+        if error is not None:
+            return method == "GET" or isinstance(
+                error, httpx.ConnectError | httpx.ConnectTimeout
+            )
+        return method == "GET" and response.status_code in RETRY_STATUS_CODES
+
+    def _backoff_delay(self, attempt):
+        return self.backoff * 2**attempt
+
+    def request(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if not self._should_retry(method, attempt, error=e):
+                    raise
+                logger.warning("Request to %s failed (%s), retrying", url, e)
+            else:
+                if not self._should_retry(method, attempt, response=response):
+                    return response
+                logger.warning(
+                    "Request to %s returned %s, retrying", url, response.status_code
+                )
+            time.sleep(self._backoff_delay(attempt))
+            attempt += 1
+
+    async def arequest(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = await self.async_client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if not self._should_retry(method, attempt, error=e):
+                    raise
+                logger.warning("Request to %s failed (%s), retrying", url, e)
+            else:
+                if not self._should_retry(method, attempt, response=response):
+                    return response
+                logger.warning(
+                    "Request to %s returned %s, retrying", url, response.status_code
+                )
+            await asyncio.sleep(self._backoff_delay(attempt))
+            attempt += 1
+
+
+HTTP_CLIENT = HTTPClientManager()
+
 
 def check_opt_type(opt_type: str):
     if opt_type not in ["grid", "supply"]:
@@ -21,19 +151,19 @@ def check_opt_type(opt_type: str):
         raise ValueError(msg)
 
 
-def optimization_server_request(data: dict, opt_type: str):
+def _optimization_request_kwargs(data: dict, opt_type: str):
     check_opt_type(opt_type)
-    headers = {"content-type": "application/json"}
-    payload = json.dumps(data)
+    return {
+        "url": SIM_GRID_POST_URL if opt_type == "grid" else SIM_SUPPLY_POST_URL,
+        "content": json.dumps(data),
+        "headers": {"content-type": "application/json"},
+    }
 
-    request_url = SIM_GRID_POST_URL if opt_type == "grid" else SIM_SUPPLY_POST_URL
 
+def optimization_server_request(data: dict, opt_type: str):
+    request_kwargs = _optimization_request_kwargs(data, opt_type)
     try:
-        response = httpx.post(
-            request_url,
-            data=payload,
-            headers=headers,
-        )
+        response = HTTP_CLIENT.request("POST", **request_kwargs)
 
         # If the response was successful, no Exception will be raised
         response.raise_for_status()
@@ -46,9 +176,23 @@ def optimization_server_request(data: dict, opt_type: str):
         return json.loads(response.text)
 
 
+async def async_optimization_server_request(data: dict, opt_type: str):
+    request_kwargs = _optimization_request_kwargs(data, opt_type)
+    try:
+        response = await HTTP_CLIENT.arequest("POST", **request_kwargs)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.exception("HTTP error occurred")
+        msg = "An error occurred during the optimization request."
+        raise RuntimeError(msg) from e
+    else:
+        logger.info("The simulation was sent successfully to MVS API.")
+        return json.loads(response.text)
+
+
 def optimization_check_status(token):
     try:
-        response = httpx.get(SIM_GET_URL + token)
+        response = HTTP_CLIENT.request("GET", SIM_GET_URL + token)
         response.raise_for_status()
     except httpx.HTTPError:
         logger.exception("HTTP error occurred")
@@ -61,6 +205,28 @@ def optimization_check_status(token):
         return json.loads(response.text)
 
 
+async def async_optimization_check_status(token):
+    try:
+        response = await HTTP_CLIENT.arequest("GET", SIM_GET_URL + token)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        logger.exception("HTTP error occurred")
+        return None
+    except Exception:
+        logger.exception("Other error occurred")
+        return None
+    else:
+        return json.loads(response.text)
+
+
+async def async_optimization_check_status_many(tokens):
+    """Check the status of several simulations concurrently, returns a dict {token: response}"""
+    responses = await asyncio.gather(
+        *(async_optimization_check_status(token) for token in tokens)
+    )
+    return dict(zip(tokens, responses, strict=True))
+
+
 def request_renewables_ninja_pv_output(lat, lon):
     headers = {"Authorization": "Token " + RN_API_TOKEN}
     url = RN_API_HOST + "data/pv"
@@ -78,7 +244,7 @@ def request_renewables_ninja_pv_output(lat, lon):
         "azim": 180,
         "format": "json",
     }
-    response = httpx.get(url, headers=headers, params=args)
+    response = HTTP_CLIENT.request("GET", url, headers=headers, params=args)
 
     # Parse JSON to get a pandas.DataFrame of data and dict of metadata
     parsed_response = json.loads(response.text)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import time
+import zlib
+
+from django.core.cache import cache
+
+from config.settings.base import DONE
+from config.settings.base import SIM_INPUT_CACHE_MAX_SIZE
+from config.settings.base import SIM_INPUT_CACHE_TIMEOUT
+from config.settings.base import SIM_RESULTS_CACHE_TIMEOUT
+from offgridplanner.optimization.models import ReusedSimulationResults
+from offgridplanner.optimization.requests import optimization_check_status
+
+logger = logging.getLogger(__name__)
+
+INPUT_CACHE_INDEX_KEY = "simulation_inputs:index"
+# Prefix of the tokens of reused results, which are unknown to the simulation server
+REUSED_TOKEN_PREFIX = "cached-"  # noqa: S105
+
+
+def results_cache_key(token):
+    return f"simulation_results:{token}"
+
+
+def cache_simulation_results(token, results):
+    """
+    Keep the results of a finished simulation server-side (in redis in production), so they are neither sent to the
+    browser nor requested from the simulation server again. The JSON is stored zlib-compressed, as the long
+    timeseries of the supply results compress well.
+    Parameters:
+        token (str): Token of the simulation
+        results (dict): Results of the simulation server
+    """
+    blob = zlib.compress(json.dumps(results).encode())
+    cache.set(results_cache_key(token), blob, timeout=SIM_RESULTS_CACHE_TIMEOUT)
+    input_hash = cache.get(token_input_key(token))
+    if input_hash is not None:
+        _store_input_results(input_hash, blob)
+
+
+def get_simulation_results(token):
+    """
+    Get the results of a finished simulation from the cache, falling back to the stored results of reused simulations
+    and to the simulation server (e.g. if the cache is local to another process)
+    Parameters:
+        token (str): Token of the simulation
+    Returns:
+        dict: Results of the simulation, None if the simulation has not finished successfully
+    """
+    blob = cache.get(results_cache_key(token))
+    if blob is None and token.startswith(REUSED_TOKEN_PREFIX):
+        blob = (
+            ReusedSimulationResults.objects.filter(token=token)
+            .values_list("results", flat=True)
+            .first()
+        )
+        if blob is None:
+            return None
+    if blob is not None:
+        return json.loads(zlib.decompress(blob))
+
+    logger.info("Results of simulation %s not cached, fetching them", token)
+    response = optimization_check_status(token=token)
+    if response is None or response.get("status") != DONE:
+        return None
+    results = response.get("results")
+    cache_simulation_results(token, results)
+    return results
+
+
+def clear_simulation_results(*tokens):
+    cache.delete_many([results_cache_key(token) for token in tokens if token])
+    ReusedSimulationResults.objects.filter(
+        token__in=[token for token in tokens if token.startswith(REUSED_TOKEN_PREFIX)]
+    ).delete()
+
+
+# Content-addressed cache of the results by simulation input: an identical input (e.g. the project was calculated
+# again without changes or was duplicated) reuses the results instead of starting a new simulation
+
+
+def input_cache_key(input_hash):
+    return f"simulation_inputs:{input_hash}"
+
+
+def token_input_key(token):
+    return f"simulation_inputs:token:{token}"
+
+
+def simulation_input_hash(data, opt_type):
+    """
+    Parameters:
+        data (dict): Input json of the simulation
+        opt_type (str): Either "grid" or "supply"
+    Returns:
+        str: SHA-256 of the canonical json (sorted keys, no whitespace) of the input
+    """
+    canonical = json.dumps(
+        {"opt_type": opt_type, "data": data}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _count(name):
+    key = f"simulation_inputs:{name}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted since it was added
+        cache.set(key, 1, timeout=None)
+
+
+def _store_input_results(input_hash, blob):
+    # The index {input_hash: (size, stored_at)} bounds the total size of the cached results by evicting the oldest
+    # ones. It is updated without a lock, an entry lost by a concurrent update still expires after the timeout
+    if len(blob) > SIM_INPUT_CACHE_MAX_SIZE:
+        return
+    now = time.time()
+    index = {
+        key: entry
+        for key, entry in (cache.get(INPUT_CACHE_INDEX_KEY) or {}).items()
+        if now - entry[1] < SIM_INPUT_CACHE_TIMEOUT
+    }
+    index[input_hash] = (len(blob), now)
+    total_size = sum(size for size, _ in index.values())
+    evicted = []
+    for key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+        if total_size <= SIM_INPUT_CACHE_MAX_SIZE:
+            break
+        evicted.append(key)
+        total_size -= size
+    for key in evicted:
+        del index[key]
+    cache.delete_many([input_cache_key(key) for key in evicted])
+    cache.set(input_cache_key(input_hash), blob, timeout=SIM_INPUT_CACHE_TIMEOUT)
+    cache.set(INPUT_CACHE_INDEX_KEY, index, timeout=None)
+
+
+def remember_simulation_input(token, input_hash):
+    """Remember the input of a submitted simulation, so its results are cached by input once it has finished"""
+    cache.set(token_input_key(token), input_hash, timeout=SIM_RESULTS_CACHE_TIMEOUT)
+
+
+def reuse_simulation_results(input_hash, token):
+    """
+    Look up the results of an earlier simulation with the same input and store them as the results of token. They are
+    also stored in the database, so they are found by any process even if the cache is local to this process or loses
+    the entry. If the input is not cached, the simulation has to be submitted.
+    Parameters:
+        input_hash (str): Hash of the input, see simulation_input_hash
+        token (str): Token under which the results are stored, starting with REUSED_TOKEN_PREFIX
+    Returns:
+        bool: True if the results were found
+    """
+    blob = cache.get(input_cache_key(input_hash))
+    _count("hits" if blob is not None else "misses")
+    if blob is None:
+        return False
+    ReusedSimulationResults.objects.update_or_create(
+        token=token, defaults={"results": blob}
+    )
+    cache.set(results_cache_key(token), blob, timeout=SIM_RESULTS_CACHE_TIMEOUT)
+    logger.info(
+        "Reusing the results of simulation input %s (hit rate %s)",
+        input_hash,
+        input_cache_stats()["hit_rate"],
+    )
+    return True
+
+
+def input_cache_stats():
+    """
+    Returns:
+        dict: Number of hits and misses of the input cache, hit rate (None without lookups), number and total size in
+            bytes of the cached results
+    """
+    counts = cache.get_many(["simulation_inputs:hits", "simulation_inputs:misses"])
+    hits = counts.get("simulation_inputs:hits", 0)
+    misses = counts.get("simulation_inputs:misses", 0)
+    index = cache.get(INPUT_CACHE_INDEX_KEY) or {}
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else None,
+        "entries": len(index),
+        "size": sum(size for size, _ in index.values()),
+    }
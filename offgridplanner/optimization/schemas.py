@@ -0,0 +1,171 @@
+import json
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+import httpx
+from django.core.exceptions import ImproperlyConfigured
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+from config.settings.base import SIM_SCHEMA_DIR
+from config.settings.base import SIM_SCHEMA_TTL
+from config.settings.base import SIM_SCHEMA_URL
+from offgridplanner.optimization.requests import HTTP_CLIENT
+
+logger = logging.getLogger(__name__)
+
+MODELS = ("grid", "supply")
+DIRECTIONS = ("input", "output")
+
+
+class SchemaEntry(NamedTuple):
+    schema: dict
+    validator: object
+    etag: str | None
+    fetched_at: float
+    source: str
+
+
+class SchemaRegistry:
+    """
+    Process-wide cache of the JSON schemas of the simulation server, keyed by (model, direction).
+
+    Each schema is fetched once and kept with its compiled validator. After the TTL has expired, the schema is
+    revalidated with a conditional request (If-None-Match), so an unchanged schema is neither downloaded nor
+    recompiled. If the server is unreachable, the cached schema is kept or the vendored copy in SIM_SCHEMA_DIR is used.
+    """
+
+    def __init__(
+        self, url=SIM_SCHEMA_URL, ttl=SIM_SCHEMA_TTL, schema_dir=SIM_SCHEMA_DIR
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.schema_dir = schema_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.n_requests = 0
+
+    @staticmethod
+    def check_key(model, direction):
+        if model not in MODELS or direction not in DIRECTIONS:
+            msg = f"Unknown schema {model}/{direction}"
+            raise ValueError(msg)
+
+    def vendored_path(self, model, direction):
+        return self.schema_dir / f"{model}_{direction}.json"
+
+    def _is_fresh(self, entry):
+        return time.monotonic() - entry.fetched_at < self.ttl
+
+    def _compile(self, schema, etag, source):
+        validator_cls = validator_for(schema)
+        validator_cls.check_schema(schema)
+        return SchemaEntry(
+            schema, validator_cls(schema), etag, time.monotonic(), source
+        )
+
+    def _fetch(self, model, direction, cached=None):
+        headers = {}
+        if cached is not None and cached.etag is not None:
+            headers["If-None-Match"] = cached.etag
+        self.n_requests += 1
+        response = HTTP_CLIENT.request(
+            "GET", f"{self.url}{model}/{direction}", headers=headers
+        )
+        if response.status_code == httpx.codes.NOT_MODIFIED and cached is not None:
+            return cached._replace(fetched_at=time.monotonic())
+        response.raise_for_status()
+        schema = response.json()
+        if cached is not None and schema == cached.schema:
+            return cached._replace(fetched_at=time.monotonic())
+        return self._compile(schema, response.headers.get("ETag"), "server")
+
+    def _load_vendored(self, model, direction):
+        path = self.vendored_path(model, direction)
+        try:
+            with path.open() as f:
+                schema = json.load(f)
+        except FileNotFoundError as e:
+            msg = (
+                f"The simulation server is unreachable and there is no vendored schema {path}. Point "
+                f"SIM_SCHEMA_DIR to the vendored schemas in offgridplanner/static/data/sim_schemas."
+            )
+            raise ImproperlyConfigured(msg) from e
+        return self._compile(schema, None, "vendored")
+
+    def get(self, model, direction):
+        """
+        Parameters:
+            model (str): Either "grid" or "supply"
+            direction (str): Either "input" or "output"
+        Returns:
+            SchemaEntry: Schema with its compiled validator
+        Raises:
+            ImproperlyConfigured: If the server is unreachable and there is no cached or vendored schema
+        """
+        self.check_key(model, direction)
+        key = (model, direction)
+        entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(entry):
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry):
+                return entry
+            try:
+                entry = self._fetch(model, direction, cached=entry)
+            except (httpx.HTTPError, ValueError):
+                if entry is not None:
+                    logger.warning(
+                        "Could not revalidate schema %s/%s, keeping the cached one",
+                        model,
+                        direction,
+                        exc_info=True,
+                    )
+                    entry = entry._replace(fetched_at=time.monotonic())
+                else:
+                    logger.warning(
+                        "Could not fetch schema %s/%s, using the vendored copy",
+                        model,
+                        direction,
+                        exc_info=True,
+                    )
+                    entry = self._load_vendored(model, direction)
+            self._entries[key] = entry
+            return entry
+
+    def validator(self, model, direction):
+        return self.get(model, direction).validator
+
+    def validate(self, json_obj, model, direction):
+        """Validate a JSON object, raises the most relevant jsonschema.ValidationError (as jsonschema.validate)"""
+        error = best_match(self.validator(model, direction).iter_errors(json_obj))
+        if error is not None:
+            raise error
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def dump(self, schema_dir=None):
+        """Write the current schemas of the simulation server to the vendored copies, returns the written paths"""
+        schema_dir = schema_dir or self.schema_dir
+        schema_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for model in MODELS:
+            for direction in DIRECTIONS:
+                entry = self._fetch(model, direction)
+                path = schema_dir / f"{model}_{direction}.json"
+                with path.open("w") as f:
+                    json.dump(entry.schema, f, indent=2, sort_keys=True)
+                    f.write("\n")
+                with self._lock:
+                    self._entries[(model, direction)] = entry
+                paths.append(path)
+        return paths
+
+
+SCHEMA_REGISTRY = SchemaRegistry()
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+
+from django.db.models import Q
+
+from config.settings.base import DONE
+from config.settings.base import ERROR
+from config.settings.base import PENDING
+from config.settings.base import SIM_STATUS_POLL_INTERVAL
+from offgridplanner.optimization.models import Simulation
+
+logger = logging.getLogger(__name__)
+
+
+def simulation_status_message(token, model, response):
+    """
+    Build the status message sent to the browser from a response of the simulation server
+    Parameters:
+        token (str): Token of the simulation
+        model (str): Either "grid" or "supply"
+        response (dict): Response of optimization_check_status (None if the request failed)
+    Returns:
+        dict: Message with keys "token", "model", "status", "finished" and "results" (only the error message, the
+            results of a finished simulation are kept server-side, see results_cache)
+    """
+    status = response.get("status") if response is not None else ERROR
+    results = None
+    if status not in [DONE, ERROR, PENDING]:
+        logger.warning("Simulation returned unexpected status")
+
+    if status == DONE:
+        logger.info("Simulation finished")
+    elif status == ERROR:
+        try:
+            results = json.dumps(response.get("results", {}).get(ERROR))
+        except AttributeError:
+            results = None
+        logger.warning("Simulation failed with errors.")
+
+    return {
+        "token": token,
+        "model": model,
+        "status": status,
+        "finished": status != PENDING,
+        "results": results,
+    }
+
+
+class SimulationStatusPoller:
+    """
+    Pushes the final status of the simulations to the browsers waiting for them. The simulation server is checked by
+    the periodic task_poll_simulation_status, which writes the status changes to the Simulation. This poller only
+    reads the statuses of all awaited tokens of this process from the database in one query per interval and hands
+    the final status message to every waiter of the token.
+    """
+
+    def __init__(self, interval=SIM_STATUS_POLL_INTERVAL):
+        self.interval = interval
+        self._loop = None
+        self._task = None
+        self._waiters = {}
+        self._models = {}
+
+    def _reset_for_loop(self, loop):
+        # The state is bound to the event loop it was created in (e.g. in tests every async_to_sync call uses a new one)
+        if self._loop is not loop:
+            self._loop = loop
+            self._task = None
+            self._waiters = {}
+            self._models = {}
+
+    def pending_tokens(self):
+        return list(self._waiters)
+
+    async def wait(self, token, model):
+        """
+        Wait until the simulation has finished
+        Parameters:
+            token (str): Token of the simulation
+            model (str): Either "grid" or "supply"
+        Returns:
+            dict: Final status message (see simulation_status_message)
+        """
+        loop = asyncio.get_running_loop()
+        self._reset_for_loop(loop)
+        future = loop.create_future()
+        self._waiters.setdefault(token, set()).add(future)
+        self._models[token] = model
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        try:
+            return await future
+        finally:
+            waiters = self._waiters.get(token)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    self._forget(token)
+
+    def _forget(self, token):
+        self._waiters.pop(token, None)
+        self._models.pop(token, None)
+
+    @staticmethod
+    async def statuses(tokens):
+        """Returns the status of the simulations by token, None for tokens without Simulation (e.g. deleted)"""
+        statuses = {}
+        async for (
+            token_grid,
+            status_grid,
+            token_supply,
+            status_supply,
+        ) in Simulation.objects.filter(
+            Q(token_grid__in=tokens) | Q(token_supply__in=tokens)
+        ).values_list("token_grid", "status_grid", "token_supply", "status_supply"):
+            statuses[token_grid] = status_grid
+            statuses[token_supply] = status_supply
+        return {token: statuses.get(token) for token in tokens}
+
+    async def poll(self):
+        """Read the status of all awaited tokens at once and resolve the waiters of finished simulations"""
+        tokens = self.pending_tokens()
+        if not tokens:
+            return
+        for token, status in (await self.statuses(tokens)).items():
+            model = self._models.get(token)
+            if model is None or status == PENDING:
+                continue
+            message = simulation_status_message(
+                token, model, {"status": status} if status is not None else None
+            )
+            for future in self._waiters.get(token, ()):
+                if not future.done():
+                    future.set_result(message)
+            self._forget(token)
+
+    async def _run(self):
+        while self._waiters:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Error while reading the simulation status")
+            await asyncio.sleep(self.interval)
+
+
+STATUS_POLLER = SimulationStatusPoller()
+
+
+async def simulation_event_stream(tokens, keepalive=15, finished=()):
+    """
+    Server-Sent Events stream with one "status" event per simulation once it has finished
+    Parameters:
+        tokens (dict): Tokens of the simulations by model, e.g. {"grid": "...", "supply": "..."} (empty tokens are skipped)
+        keepalive (float): Seconds after which a comment is sent to keep the connection open
+        finished (list): Status messages of simulations which have finished already, sent right away
+    """
+    tasks = {
+        asyncio.ensure_future(STATUS_POLLER.wait(token, model))
+        for model, token in tokens.items()
+        if token
+    }
+    try:
+        yield "retry: 5000\n\n"
+        for message in finished:
+            yield f"event: status\ndata: {json.dumps(message)}\n\n"
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, timeout=keepalive)
+            if not done:
+                yield ": keep-alive\n\n"
+            for task in done:
+                yield f"event: status\ndata: {json.dumps(task.result())}\n\n"
+    finally:
+        # The browser disconnected before all simulations finished
+        for task in tasks:
+            task.cancel()
@@ -1,14 +1,105 @@
+import json
 import logging
+import os
+import tempfile
+from functools import cache
+from functools import cached_property
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from django.forms import model_to_dict
 
 from config.settings.base import FULL_PATH_PROFILES
+from config.settings.base import FULL_PATH_PROFILES_ARRAY
 
 logging.basicConfig(format="%(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-LOAD_PROFILES = pd.read_parquet(path=FULL_PATH_PROFILES, engine="pyarrow")
+
+class LoadProfileStore:
+    """
+    Read-only access to the load profiles. Only the parquet schema is read on creation; the values are served from
+    a prebuilt float32 .npy file that is memory-mapped on first access, so all processes on a host share the same
+    pages. The .npy file is built from the parquet file if it does not exist yet (see build_load_profiles command).
+    """
+
+    def __init__(self, parquet_path, array_path):
+        self.parquet_path = Path(parquet_path)
+        self.array_path = Path(array_path)
+        schema = pq.read_schema(self.parquet_path)
+        self._index_columns = json.loads(schema.metadata[b"pandas"])["index_columns"]
+        self.columns = pd.Index(
+            [name for name in schema.names if name not in self._index_columns]
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    @cached_property
+    def index(self):
+        table = pq.read_table(self.parquet_path, columns=self._index_columns)
+        return pd.DatetimeIndex(table.column(0).to_pandas()).rename(None)
+
+    @cached_property
+    def values(self):
+        if not self.array_path.exists():
+            try:
+                self.build()
+            except OSError:
+                logger.warning(
+                    "Could not write %s, keeping the load profiles in memory instead",
+                    self.array_path,
+                )
+                return self._read_parquet_values()
+        return np.load(self.array_path, mmap_mode="r")
+
+    def _read_parquet_values(self):
+        df = pd.read_parquet(path=self.parquet_path, engine="pyarrow")
+        return df[self.columns].to_numpy(dtype=np.float32)
+
+    def build(self):
+        """(Re)build the .npy file from the parquet file, replacing it atomically"""
+        values = self._read_parquet_values()
+        fd, tmp_path = tempfile.mkstemp(dir=self.array_path.parent, suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, values)
+            # mkstemp creates the file owner-readable only, but all workers must be able to map it
+            Path(tmp_path).chmod(0o644)
+            Path(tmp_path).replace(self.array_path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.__dict__.pop("values", None)
+
+    def frame(self, time_range=None, columns=None):
+        """
+        Parameters:
+            time_range (range): Indices of the timesteps (contiguous ranges are served without copying)
+            columns (list): Subset of profile columns
+        Returns:
+            pd.DataFrame: Read-only load profiles
+        """
+        rows = time_slice(time_range)
+        values = self.values[rows]
+        df = pd.DataFrame(
+            values, index=self.index[rows], columns=self.columns, copy=False
+        )
+        return df[columns] if columns is not None else df
+
+
+def time_slice(time_range):
+    """Convert a range of timesteps into a slice where possible, so arrays are indexed without copying"""
+    if time_range is None:
+        return slice(None)
+    if isinstance(time_range, range) and time_range.step == 1:
+        return slice(time_range.start, time_range.stop)
+    return np.asarray(time_range)
+
+
+LOAD_PROFILES = LoadProfileStore(FULL_PATH_PROFILES, FULL_PATH_PROFILES_ARRAY)
 
 PUBLIC_SERVICE_LIST = [
     profile.split("_", maxsplit=1)[1]
@@ -45,6 +136,147 @@ LARGE_LOAD_KW_MAPPING = {
 }
 
 
+HOUSEHOLD_TIERS = ["very_low", "low", "middle", "high", "very_high"]
+DEMAND_COLUMNS = ["household", "enterprise", "public_service"]
+MACHINERY_PATTERN = r"(\d+)\s*x\s*([^\(;]+?)\s*(?:\(|;|$)"
+
+
+class DemandEngine:
+    """
+    Computes demand timeseries as a single matrix product of the load profiles (timesteps x profiles, float32) with
+    a weight matrix (profiles x consumer types) holding the number of consumers per profile column.
+    """
+
+    def __init__(self, load_profiles):
+        self.index = load_profiles.index
+        self.columns = pd.Index(load_profiles.columns)
+        # No copy for the memory-mapped float32 array of a LoadProfileStore
+        self.profiles = np.asarray(load_profiles.values, dtype=np.float32)
+
+    def household_columns(self):
+        return self.columns.get_indexer(
+            [
+                f"Household_Distribution_Based_{tier.title().replace('_', ' ')} Consumption"
+                for tier in HOUSEHOLD_TIERS
+            ]
+        )
+
+    def _add_counts(self, weights, demand_column, prefix, counts):
+        if counts.empty:
+            return
+        positions = self.columns.get_indexer(prefix + "_" + counts.index.astype(str))
+        unknown = positions == -1
+        if unknown.any():
+            logger.warning(
+                "No load profile found for %s %s, their demand is ignored",
+                prefix,
+                counts.index[unknown].tolist(),
+            )
+        np.add.at(
+            weights[:, demand_column], positions[~unknown], counts.to_numpy()[~unknown]
+        )
+
+    def consumer_counts(self, nodes_df):
+        """
+        Count the consumers of a node set per load profile column.
+        Parameters:
+            nodes_df (pd.DataFrame): Nodes of the project
+        Returns:
+            counts (np.ndarray): Array of shape (n_profiles, 3) with columns "household", "enterprise", "public_service",
+                where every household wealth tier row holds the total number of households
+        """
+        counts = np.zeros((len(self.columns), len(DEMAND_COLUMNS)), dtype=np.float32)
+        if nodes_df is None or nodes_df.empty:
+            return counts
+
+        consumer_type = nodes_df["consumer_type"]
+        consumer_detail = nodes_df["consumer_detail"]
+
+        n_households = (
+            (consumer_type == "household") & (consumer_detail == "default")
+        ).sum()
+        counts[self.household_columns(), 0] = n_households
+
+        self._add_counts(
+            counts,
+            1,
+            "Enterprise",
+            consumer_detail[consumer_type == "enterprise"].value_counts(),
+        )
+        self._add_counts(
+            counts,
+            2,
+            "Public Service",
+            consumer_detail[consumer_type == "public_service"].value_counts(),
+        )
+
+        # Machinery of connected enterprises, e.g. "2 x Milling Machine (7.5kW);1 x Welder (5.25kW)"
+        machinery = nodes_df.loc[
+            (consumer_type == "enterprise") & (nodes_df["is_connected"] == True),  # noqa:E712
+            "custom_specification",
+        ]
+        machinery = machinery[machinery.fillna("") != ""]
+        if not machinery.empty:
+            matches = machinery.str.extractall(MACHINERY_PATTERN)
+            machinery_counts = (
+                matches[0].astype(int).groupby(matches[1].to_numpy()).sum()
+            )
+            self._add_counts(counts, 1, "Enterprise_Large Load", machinery_counts)
+
+        return counts
+
+    def apply_shares(self, counts, custom_demand):
+        """Weight the household counts with the wealth shares of the CustomDemand instance"""
+        shares = np.array(
+            [getattr(custom_demand, tier) or 0 for tier in HOUSEHOLD_TIERS],
+            dtype=np.float32,
+        )
+        weights = counts.copy()
+        weights[self.household_columns(), 0] *= shares
+        return weights
+
+    def consumer_weights(self, nodes_df, custom_demand):
+        """
+        Build the weight matrix of a node set.
+        Parameters:
+            nodes_df (pd.DataFrame): Nodes of the project
+            custom_demand (CustomDemand): CustomDemand instance for the project (household wealth shares)
+        Returns:
+            weights (np.ndarray): Array of shape (n_profiles, 3) with columns "household", "enterprise", "public_service"
+        """
+        return self.apply_shares(self.consumer_counts(nodes_df), custom_demand)
+
+    def demand(self, weights, time_range=None):
+        """
+        Parameters:
+            weights (np.ndarray): Weight matrix from consumer_weights
+            time_range (range): Indices of the timesteps to compute
+        Returns:
+            demand_df (pd.DataFrame): Demand by columns "household", "enterprise", "public_service"
+        """
+        rows = time_slice(time_range)
+        values = self.profiles[rows] @ weights
+        return pd.DataFrame(
+            values.astype(np.float64), index=self.index[rows], columns=DEMAND_COLUMNS
+        )
+
+    def demand_batch(self, weights, time_range=None):
+        """
+        Compute the demand of many node sets at once.
+        Parameters:
+            weights (np.ndarray): Stacked weight matrices of shape (n_sets, n_profiles, 3)
+            time_range (range): Indices of the timesteps to compute
+        Returns:
+            np.ndarray: Array of shape (n_sets, n_timesteps, 3)
+        """
+        return np.matmul(self.profiles[time_slice(time_range)], weights)
+
+
+@cache
+def get_demand_engine():
+    return DemandEngine(LOAD_PROFILES)
+
+
 def get_demand_timeseries(nodes, custom_demand, time_range=None):
     """
     Get the demand timeseries for the project
@@ -55,28 +287,12 @@ def get_demand_timeseries(nodes, custom_demand, time_range=None):
     Returns:
         demand_df (pd.DataFrame): DataFrame with aggregated demands by columns "households", "enterprises", "public_services"
     """
-    load_profiles = (
-        LOAD_PROFILES.iloc[time_range].copy()
-        if time_range is not None
-        else LOAD_PROFILES.copy()
-    )
     # TODO change the index to pd.date_range(nodes.project.start_date, nodes.project.start_date + timedelta(nodes.project.n_days), freq='h'))
     # TODO consider not only n_days but also start_date on time_range
-    demand_df = pd.DataFrame(index=load_profiles.index)
-    demand_df["household"] = combine_profiles(
-        nodes,
-        "household",
-        load_profiles,
-        custom_demand=custom_demand,
-    )
-    demand_df["enterprise"] = combine_profiles(nodes, "enterprise", load_profiles)
-    demand_df["public_service"] = combine_profiles(
-        nodes,
-        "public_service",
-        load_profiles,
-    )
+    demand_df = nodes.demand_timeseries(custom_demand, time_range=time_range)
 
     demand_df = calibrate_profiles(demand_df, custom_demand)
+    logger.debug("Nodes dataframe cache: %s", nodes.df_cache_info())
     return demand_df
 
 
@@ -107,131 +323,3 @@ def calibrate_profiles(demand_df, custom_demand):
         raise ValueError(msg)
 
     return demand_df * calibration_factor
-
-
-def combine_profiles(nodes, consumer_type, load_profiles, custom_demand=None):
-    # Logic will need fixing if name formatting in load profiles changes
-    """
-    Parameters:
-        nodes (Nodes): Nodes object
-        consumer_type (str): One of "household", "enterprise", "public_service"
-        load_profiles (pd.DataFrame): Load profiles
-        custom_demand (CustomDemand): CustomDemand object (only relevant for households)
-    Returns:
-        total_demand (pd.Series): Total demand for the given consumer type including machinery
-    """
-    node_counts = nodes.counts
-    try:
-        consumer_type_counts = node_counts.loc[consumer_type]
-
-        if consumer_type == "household":
-            custom_demand_parameters = model_to_dict(custom_demand)
-            total_demand = compute_household_demand(
-                consumer_type_counts,
-                custom_demand_parameters,
-                load_profiles,
-            )
-
-        else:
-            total_demand = compute_standard_demand(
-                consumer_type,
-                consumer_type_counts,
-                load_profiles,
-            )
-
-        # Add machinery loads to enterprises
-        if consumer_type == "enterprise":
-            # Check if there are any large loads in the custom_specifications
-            if nodes.have_custom_machinery:
-                ent_nodes = nodes.filter_consumers("enterprise")
-                large_load_enterprises = ent_nodes[ent_nodes.custom_specification != ""]
-                machinery = unpack_machinery(large_load_enterprises)
-
-                # Compute machinery demand and add to enterprises
-                machinery_demand = compute_standard_demand(
-                    "machinery",
-                    machinery,
-                    load_profiles,
-                )
-                total_demand += machinery_demand
-
-    # consumer_type does not exist
-    except KeyError:
-        logger.warning(
-            "Can't compute demand for %s, since none were selected", consumer_type
-        )
-        total_demand = pd.Series(0, index=load_profiles.index)
-
-    return total_demand
-
-
-def compute_household_demand(consumer_type_counts, custom_demand_params, load_profiles):
-    """
-    Compute demand for households applying wealth shares defined in CustomDemand.
-
-    Parameters:
-        consumer_type_counts (pd.DataFrame): Household nodes
-        custom_demand_params (dict): Custom demand shares dictionary
-        load_profiles (pd.DataFrame): Load profiles
-    Returns:
-        total_demand (pd.Series): Total household demand
-    """
-    total_demand = pd.Series(0, index=load_profiles.index)
-    total_households = consumer_type_counts.get("default", 0)
-
-    for demand_param, value in custom_demand_params.items():
-        if demand_param in ["very_low", "low", "middle", "high", "very_high"]:
-            profile_col = f"Household_Distribution_Based_{demand_param.title().replace('_', ' ')} Consumption"
-            total_demand += load_profiles[profile_col] * value
-
-    return total_demand * total_households
-
-
-def compute_standard_demand(consumer_type, consumer_type_counts, load_profiles):
-    """
-    Compute demand for enterprises, public services or machinery.
-
-    Parameters:
-        consumer_type (str): One of "enterprise", "public_service" or "machinery"
-        consumer_type_counts (pd.DataFrame): Household nodes
-        load_profiles (pd.DataFrame): Load profiles
-    Returns:
-        total_demand (pd.Series): Total demand
-    """
-    if consumer_type == "machinery":
-        ts_string_prefix = "Enterprise_Large Load"
-    else:
-        ts_string_prefix = f"{consumer_type.title().replace('_', ' ')}"
-    ts_cols = [f"{ts_string_prefix}_{ts}" for ts in consumer_type_counts.index]
-    total_demand = load_profiles[ts_cols].dot(consumer_type_counts.to_numpy())
-
-    return total_demand
-
-
-def unpack_machinery(large_load_enterprises):
-    """
-    Unpack the machinery strings saved in custom_specification attribute of enterprise nodes.
-
-    Parameters:
-        large_load_enterprises (pd.DataFrame): Filtered nodes DataFrame by enterprises with custom machinery
-    Returns:
-        large_loads (pd.Series): Series with machinery as index and count column
-    """
-    # Split large loads string into list, then expand into separate rows
-    expanded = (
-        large_load_enterprises.assign(
-            custom_specification=lambda df: df["custom_specification"].str.split(";"),
-        )
-        .explode("custom_specification")
-        .reset_index(drop=True)
-    )
-    # Drop power ratings and extract counts from string, create series with machinery as index
-    large_loads = (
-        expanded["custom_specification"]
-        .str.extract(r"(\d+)\s*x\s*([^\(]+?)\s*(?:\(|$)")
-        .astype({0: int})
-        .groupby(1)[0]
-        .sum()  # Sum duplicate machinery types
-    )
-
-    return large_loads
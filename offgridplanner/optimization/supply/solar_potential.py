@@ -8,14 +8,27 @@ of a photovoltaic (PV) system based on the weather data. The module's integratio
 combined with detailed solar panel and inverter specifications, enables it to calculate solar potential time series
 """
 
+import hashlib
 import logging
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache
+from functools import cached_property
+from itertools import repeat
 from pathlib import Path
+from typing import NamedTuple
 
+import django
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 import pvlib
+import xarray as xr
+from django.db import connection
+from django.db import connections
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from feedinlib import era5
 from pvlib.location import Location
 from pvlib.modelchain import ModelChain
@@ -23,49 +36,111 @@ from pvlib.pvsystem import PVSystem
 from pvlib.temperature import TEMPERATURE_MODEL_PARAMETERS
 
 from config.settings.base import CDS_API_KEY
+from config.settings.base import SOLAR_POTENTIAL_RESOLUTION
+from offgridplanner.optimization.managers import WEATHER_COLUMNS
+from offgridplanner.optimization.models import SolarPotential
+from offgridplanner.optimization.models import WeatherData
 from offgridplanner.optimization.requests import request_renewables_ninja_pv_output
 from offgridplanner.optimization.requests import request_weather_data
+from offgridplanner.optimization.supply.solar_raster import SolarPotentialRaster
+from offgridplanner.optimization.supply.solar_raster import get_solar_raster
+from offgridplanner.optimization.supply.solar_raster import raster_axis
 
 logger = logging.getLogger(__name__)
 
-# TODO this will no longer be needed, for local try to mode from oginal ogp mySQL
-# originally in sync_queries.py
-# def update_weather_db(country='Nigeria', year=None):
-#     if year is not None and year >= (pd.Timestamp.now() + pd.Timedelta(24 * 7, unit='H')).year:
-#         raise Exception("This function excepts available weather data for a entire year, "
-#                         "but for {} that data is not yet available".format(year))
-#     elif year != 2022:
-#         warnings.warn("Currently, only simulation the year 2022 is possible. Refer to the comments for "
-#                       "detailed explanations.")
-# year = (pd.Timestamp.now() + pd.Timedelta(24 * 14, unit='H')).year - 1 if year is None else int(year)
-# year = 2022 # so fast demand data is only available for 2022 and start_date is always 2022-01-01 and max. duration
-# # is one year (see func 'save_project_setup' in static/js/backend_communications.js )
-# for month in range(1, 13, 3):  # Increment by 3
-#     start_date = pd.Timestamp(year=year, month=month, day=1) - pd.Timedelta(25, unit='H')
-#     end_month = month + 2  # Third month in the interval
-#     end_month = 12 if end_month > 12 else end_month  # Ensure it does not exceed December
-#     last_day_of_end_month = calendar.monthrange(year, end_month)[1]
-#     end_date = pd.Timestamp(year=year, month=end_month, day=last_day_of_end_month) + pd.Timedelta(25, unit='H')
-#     file_name = 'cfd_weather_data_{}.nc'.format(start_date.strftime('%Y-%m'))
-#     data_xr = download_weather_data(start_date, end_date, country=country, target_file=file_name).copy()
-#     df = prepare_weather_data(data_xr)
-#     df.to_csv("weather_data.csv")
-# insert_df(WeatherData, df)
-
-
-# def insert_df(model_class, df, user_id=None, project_id=None):
-#     if user_id is not None and project_id is not None:
-#         user_id, project_id = int(user_id), int(project_id)
-#     df = df.dropna(how='all', axis=0)
-#     if not df.empty:
-#         if user_id is not None and project_id is not None:
-#             remove(model_class, user_id, project_id)
-#             df['id'] = int(user_id)
-#             df['project_id'] = int(project_id)
-#         if hasattr(model_class, 'dt') and 'dt' not in df.columns:
-#             df.index.name = 'dt'
-#             df = df.reset_index()
-#         _insert_df(model_class.__name__.lower(), df, if_exists='update')
+WEATHER_DATA_COLUMNS = ["dt", "lat", "lon", *WEATHER_COLUMNS]
+
+
+def weather_data_from_netcdf(path):
+    """
+    Read an ERA5 NetCDF file (as downloaded by download_weather_data) grid point by grid point
+    Parameters:
+        path (str): Path of the NetCDF file
+    Yields:
+        pd.DataFrame: Prepared weather data of one grid point with the columns of WeatherData
+    """
+    with xr.open_dataset(path) as ds:
+        for lat in ds.latitude.to_numpy():
+            for lon in ds.longitude.to_numpy():
+                point = ds.sel(latitude=lat, longitude=lon).load()
+                yield prepare_weather_data(point).reset_index()
+
+
+def insert_weather_data(df, chunk_size=50000):
+    """
+    Bulk insert weather data, skipping the rows of already stored (lat, lon, dt). On PostgreSQL each chunk is
+    written with COPY into a temporary table and merged with INSERT ... ON CONFLICT DO NOTHING, otherwise
+    bulk_create is used.
+    Parameters:
+        df (pd.DataFrame): Weather data with the columns dt (naive timestamps are taken as UTC), lat, lon and
+            optionally ghi, dni, dhi, temp_air, wind_speed
+        chunk_size (int): Number of rows written per transaction
+    Returns:
+        int: Number of inserted rows (without the skipped duplicates)
+    """
+    df = df.reindex(columns=WEATHER_DATA_COLUMNS)
+    df["dt"] = pd.to_datetime(df["dt"], utc=True)
+    df = df.astype(object).where(df.notna(), None)
+    n_inserted = 0
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start : start + chunk_size]
+        if connection.vendor == "postgresql":
+            n_inserted += _copy_weather_data(chunk)
+        else:
+            # bulk_create does not report the rows skipped by ignore_conflicts
+            n_before = WeatherData.objects.count()
+            WeatherData.objects.bulk_create(
+                [WeatherData(**row) for row in chunk.to_dict("records")],
+                ignore_conflicts=True,
+            )
+            n_inserted += WeatherData.objects.count() - n_before
+    return n_inserted
+
+
+def _copy_weather_data(chunk):
+    table = WeatherData._meta.db_table  # noqa: SLF001
+    columns = ", ".join(WEATHER_DATA_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE weather_data_staging ON COMMIT DROP AS "  # noqa: S608
+            f"SELECT {columns} FROM {table} WITH NO DATA"
+        )
+        with cursor.copy(f"COPY weather_data_staging ({columns}) FROM STDIN") as copy:
+            for row in chunk.itertuples(index=False, name=None):
+                copy.write_row(row)
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM weather_data_staging "  # noqa: S608
+            "ON CONFLICT (lat, lon, dt) DO NOTHING"
+        )
+        return cursor.rowcount
+
+
+def local_weather_data(lat, lon, dt_index):
+    """
+    Weather data of the nearest grid point stored in WeatherData
+    Parameters:
+        lat (float): Latitude of the site
+        lon (float): Longitude of the site
+        dt_index (pd.DatetimeIndex): Timesteps (naive timestamps are taken as UTC)
+    Returns:
+        pd.DataFrame: Weather data on dt_index, None if no grid point is close enough or its data is incomplete
+    """
+    point = WeatherData.objects.nearest_grid_point(lat, lon)
+    if point is None:
+        return None
+    utc_index = dt_index.tz_localize("UTC") if dt_index.tz is None else dt_index
+    step = pd.Timedelta("1h")
+    df = WeatherData.objects.timeseries(
+        *point, utc_index[0] - step, utc_index[-1] + step
+    )
+    if df.empty:
+        return None
+    # The ERA5 timestamps are shifted to the middle of the interval, allow them to differ by up to one hour
+    df = df.reindex(utc_index, method="nearest", tolerance=step)
+    if df[["ghi", "dni", "dhi"]].isna().any().any():
+        return None
+    df.index = dt_index
+    return df
 
 
 def create_cdsapirc_file():
@@ -164,11 +239,102 @@ def build_xarray_for_pvlib(lat, lon, dt_index):
     return ds
 
 
-def get_dc_feed_in_sync_db_query(lat, lon, dt_index):
+class SolarPotentialCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class SolarPotentialCache:
+    """
+    Database-backed cache of DC feed-in timeseries, keyed by the grid cell of the site (SOLAR_POTENTIAL_RESOLUTION
+    degrees) and the time index. The series is computed at the center of the cell, so it does not depend on which
+    project requested it first. Hits are counted per process (info) and per entry (SolarPotential.hits).
+    """
+
+    def __init__(self, resolution=SOLAR_POTENTIAL_RESOLUTION):
+        self.resolution = resolution
+        self.hits = 0
+        self.misses = 0
+
+    def cell(self, lat, lon):
+        return round(lat / self.resolution), round(lon / self.resolution)
+
+    def cell_center(self, lat, lon):
+        lat_cell, lon_cell = self.cell(lat, lon)
+        return (
+            round(lat_cell * self.resolution, 6),
+            round(lon_cell * self.resolution, 6),
+        )
+
+    @staticmethod
+    def time_key(dt_index):
+        if dt_index.freqstr is not None:
+            return f"{dt_index[0].isoformat()}/{len(dt_index)}/{dt_index.freqstr}"
+        digest = hashlib.sha1(dt_index.asi8.tobytes()).hexdigest()  # noqa: S324
+        return f"{dt_index[0].isoformat()}/{len(dt_index)}/{digest}"
+
+    def _lookup(self, lat, lon, dt_index):
+        lat_cell, lon_cell = self.cell(lat, lon)
+        return {
+            "lat_cell": lat_cell,
+            "lon_cell": lon_cell,
+            "resolution": self.resolution,
+            "time_key": self.time_key(dt_index),
+        }
+
+    def get(self, lat, lon, dt_index):
+        """Returns the cached feed-in as a pd.Series on dt_index, None if the cell is not cached yet"""
+        entry = (
+            SolarPotential.objects.filter(**self._lookup(lat, lon, dt_index))
+            .only("id", "timeseries")
+            .first()
+        )
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        SolarPotential.objects.filter(id=entry.id).update(
+            hits=F("hits") + 1, last_used=timezone.now()
+        )
+        return pd.Series(entry.timeseries_array(), index=dt_index)
+
+    def set(self, lat, lon, dt_index, solar_potential, source):
+        SolarPotential.objects.update_or_create(
+            **self._lookup(lat, lon, dt_index),
+            defaults={
+                "source": source,
+                "timeseries": np.asarray(solar_potential, dtype=np.float64).tobytes(),
+            },
+        )
+
+    def info(self):
+        requests = self.hits + self.misses
+        return SolarPotentialCacheInfo(
+            self.hits, self.misses, self.hits / requests if requests else 0.0
+        )
+
+
+SOLAR_POTENTIAL_CACHE = SolarPotentialCache()
+# Sources of the DC feed-in which are not stored in SOLAR_POTENTIAL_CACHE (see compute_dc_feed_in)
+UNCACHED_SOURCES = ("renewables_ninja",)
+
+
+def compute_dc_feed_in(lat, lon, dt_index):
+    """
+    Compute the DC feed-in from the locally stored weather data (see load_weather_data command) or the weather data
+    API, falling back to renewables.ninja
+    Returns:
+        (pd.Series, str): DC feed-in on dt_index and the name of its source
+    """
+    weather_df = local_weather_data(lat, lon, dt_index)
+    if weather_df is not None:
+        return _get_dc_feed_in(lat, lon, weather_df), "weather_data_db"
     try:
         cds_data = build_xarray_for_pvlib(lat, lon, dt_index)
         weather_df = prepare_weather_data(cds_data)
         solar_potential = _get_dc_feed_in(lat, lon, weather_df)
+        source = "weather_data_api"
     # If something goes wrong using the internal weather data API, request data from renewables.ninja instead (warning: results can vary)
     except Exception as e:  # noqa:BLE001
         logger.warning(
@@ -177,28 +343,252 @@ def get_dc_feed_in_sync_db_query(lat, lon, dt_index):
         )
         solar_potential = request_renewables_ninja_pv_output(lat, lon)["electricity"]
         solar_potential.index = dt_index
+        source = "renewables_ninja"
+    return solar_potential, source
+
+
+def get_dc_feed_in_sync_db_query(lat, lon, dt_index):
+    raster = get_solar_raster()
+    if raster is not None:
+        solar_potential = raster.feed_in(lat, lon, dt_index)
+        if solar_potential is not None:
+            return solar_potential
+        logger.info("Site (%s, %s) not covered by the solar potential raster", lat, lon)
+    solar_potential = SOLAR_POTENTIAL_CACHE.get(lat, lon, dt_index)
+    if solar_potential is None:
+        solar_potential, source = compute_dc_feed_in(
+            *SOLAR_POTENTIAL_CACHE.cell_center(lat, lon), dt_index
+        )
+        # The renewables.ninja fallback is not cached, so the site is computed from weather data once it is available
+        if source not in UNCACHED_SOURCES:
+            SOLAR_POTENTIAL_CACHE.set(lat, lon, dt_index, solar_potential, source)
+    logger.info("Solar potential cache: %s", SOLAR_POTENTIAL_CACHE.info())
     return solar_potential
 
 
-def _get_dc_feed_in(lat, lon, weather_df):
-    module = pvlib.pvsystem.retrieve_sam("SandiaMod")[
-        "SolarWorld_Sunmodule_250_Poly__2013_"
-    ]
-    inverter = pvlib.pvsystem.retrieve_sam("cecinverter")[
-        "ABB__MICRO_0_25_I_OUTD_US_208__208V_"
-    ]
-    temperature_model_parameters = TEMPERATURE_MODEL_PARAMETERS["sapm"][
-        "open_rack_glass_glass"
-    ]
-    system = PVSystem(
+def raster_weather_data(lat, lon, dt_index):
+    """Weather data of a grid point of the solar potential raster, None if neither the database nor the API has it"""
+    weather_df = local_weather_data(lat, lon, dt_index)
+    if weather_df is not None:
+        return weather_df
+    try:
+        return prepare_weather_data(build_xarray_for_pvlib(lat, lon, dt_index))
+    except Exception:  # noqa:BLE001
+        logger.warning("No weather data for (%s, %s)", lat, lon, exc_info=True)
+        return None
+
+
+def compute_raster_rows(points, dt_index):
+    """
+    Compute the DC feed-in of a chunk of grid points, the points are computed together in PVEngine.dc_feed_in_many
+    Parameters:
+        points (list): (lat, lon) of the grid points
+        dt_index (pd.DatetimeIndex): Timesteps of the raster
+    Returns:
+        np.ndarray: float32 array of shape (points, timesteps), NaN for the points without weather data
+    """
+    rows = np.full((len(points), len(dt_index)), np.nan, dtype=np.float32)
+    # The weather data of the API is shifted by half an hour, only points with the same timesteps are stacked
+    groups = {}
+    for i, (lat, lon) in enumerate(points):
+        weather_df = raster_weather_data(lat, lon, dt_index)
+        if weather_df is not None and len(weather_df) == len(dt_index):
+            groups.setdefault(weather_df.index[0], []).append((i, lat, lon, weather_df))
+    for group in groups.values():
+        rows_idx, lats, lons, weather_dfs = zip(*group, strict=True)
+        feed_in = get_pv_engine().dc_feed_in_many(lats, lons, weather_dfs)
+        rows[list(rows_idx)] = feed_in.to_numpy().T
+    return rows
+
+
+def _init_raster_worker():
+    # Needed if the pool does not fork (e.g. spawn on macOS), a no-op otherwise
+    django.setup()
+
+
+def build_solar_raster(bounds, resolution, dt_index, workers=None, chunk_size=16):
+    """
+    Compute the DC feed-in of every grid point within the bounds in a process pool
+    Parameters:
+        bounds (dict): Bounding box with the keys latitude_min, latitude_max, longitude_min, longitude_max (see
+            get_country_bounds_by_code)
+        resolution (float): Distance of the grid points in degrees
+        dt_index (pd.DatetimeIndex): Timesteps of the raster
+        workers (int): Number of worker processes (None for one per CPU, 1 to compute in this process)
+        chunk_size (int): Number of grid points computed together by a worker
+    Returns:
+        SolarPotentialRaster: Raster of the computed feed-in
+    """
+    lats = raster_axis(bounds["latitude_min"], bounds["latitude_max"], resolution)
+    lons = raster_axis(bounds["longitude_min"], bounds["longitude_max"], resolution)
+    points = [(lat, lon) for lat in lats for lon in lons]
+    chunks = [points[i : i + chunk_size] for i in range(0, len(points), chunk_size)]
+    logger.info(
+        "Computing the solar potential of %s x %s grid points", len(lats), len(lons)
+    )
+
+    if workers == 1:
+        rows = [compute_raster_rows(chunk, dt_index) for chunk in chunks]
+    else:
+        # The workers must not share the database connection of this process
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_raster_worker
+        ) as executor:
+            rows = []
+            for chunk_rows in executor.map(
+                compute_raster_rows, chunks, repeat(dt_index)
+            ):
+                rows.append(chunk_rows)
+                logger.info("Computed %s of %s chunks", len(rows), len(chunks))
+
+    values = np.concatenate(rows).reshape(len(lats), len(lons), len(dt_index))
+    return SolarPotentialRaster(lats, lons, dt_index, values)
+
+
+SAM_MODULE = "SolarWorld_Sunmodule_250_Poly__2013_"
+SAM_INVERTER = "ABB__MICRO_0_25_I_OUTD_US_208__208V_"
+
+
+class PVEngine:
+    """
+    Computes the DC feed-in of the reference PV system (fixed tilt, SAPM module). The SAM databases are only read once
+    per process (see get_pv_engine) and the PVSystem is shared by all sites, as it does not depend on the location.
+
+    dc_feed_in_many evaluates the same chain as pvlib's ModelChain with the models inferred for this system (SAPM
+    DC model and AOI loss, no spectral loss, SAPM cell temperature, Hay-Davies transposition), but on arrays of shape
+    (timesteps, sites), so many sites are computed in one pass. Only the solar position is computed per site.
+    """
+
+    def __init__(
+        self,
+        module_name=SAM_MODULE,
+        inverter_name=SAM_INVERTER,
         surface_tilt=30,
         surface_azimuth=180,
-        module_parameters=module,
-        inverter_parameters=inverter,
-        temperature_model_parameters=temperature_model_parameters,
-    )
-    location = Location(latitude=lat, longitude=lon)
-    mc = ModelChain(system, location)
-    mc.run_model(weather=weather_df)
-    dc_power = mc.results.dc["p_mp"].clip(0).fillna(0) / 1000
-    return dc_power
+    ):
+        self.module_name = module_name
+        self.inverter_name = inverter_name
+        self.surface_tilt = surface_tilt
+        self.surface_azimuth = surface_azimuth
+
+    @cached_property
+    def module(self):
+        return pvlib.pvsystem.retrieve_sam("SandiaMod")[self.module_name]
+
+    @cached_property
+    def inverter(self):
+        return pvlib.pvsystem.retrieve_sam("cecinverter")[self.inverter_name]
+
+    @cached_property
+    def system(self):
+        return PVSystem(
+            surface_tilt=self.surface_tilt,
+            surface_azimuth=self.surface_azimuth,
+            module_parameters=self.module,
+            inverter_parameters=self.inverter,
+            temperature_model_parameters=TEMPERATURE_MODEL_PARAMETERS["sapm"][
+                "open_rack_glass_glass"
+            ],
+        )
+
+    def model_chain(self, lat, lon):
+        """pvlib ModelChain of the system at a site, the reference that dc_feed_in_many is tested against"""
+        return ModelChain(self.system, Location(latitude=lat, longitude=lon))
+
+    @staticmethod
+    def _stack(weather_dfs, column, default=None):
+        if default is not None and column not in weather_dfs[0]:
+            return np.full((len(weather_dfs[0]), len(weather_dfs)), float(default))
+        return np.column_stack([df[column].to_numpy(dtype=float) for df in weather_dfs])
+
+    def _solar_position(self, times, lats, lons, weather_dfs):
+        zenith = np.empty((len(times), len(lats)))
+        azimuth = np.empty_like(zenith)
+        for i, (lat, lon, weather_df) in enumerate(
+            zip(lats, lons, weather_dfs, strict=True)
+        ):
+            kwargs = {}
+            if "pressure" in weather_df:
+                kwargs["pressure"] = weather_df["pressure"]
+            if "temp_air" in weather_df:
+                kwargs["temperature"] = weather_df["temp_air"]
+            solar_position = Location(latitude=lat, longitude=lon).get_solarposition(
+                times, **kwargs
+            )
+            zenith[:, i] = solar_position["apparent_zenith"].to_numpy()
+            azimuth[:, i] = solar_position["azimuth"].to_numpy()
+        return zenith, azimuth
+
+    def dc_feed_in_many(self, lats, lons, weather_dfs):
+        """
+        Compute the DC feed-in of many sites at once.
+        Parameters:
+            lats (list): Latitudes of the sites
+            lons (list): Longitudes of the sites
+            weather_dfs (list): Weather dataframes of the sites (columns ghi, dhi, dni and optionally temp_air,
+                wind_speed, pressure), all with the same index
+        Returns:
+            pd.DataFrame: DC feed-in in kW per kWp, one column per site
+        """
+        times = weather_dfs[0].index
+        zenith, azimuth = self._solar_position(times, lats, lons, weather_dfs)
+        airmass = pvlib.atmosphere.get_relative_airmass(zenith, "kastenyoung1989")
+        dni_extra = pvlib.irradiance.get_extra_radiation(times).to_numpy()[:, None]
+
+        total_irrad = pvlib.irradiance.get_total_irradiance(
+            self.surface_tilt,
+            self.surface_azimuth,
+            zenith,
+            azimuth,
+            self._stack(weather_dfs, "dni"),
+            self._stack(weather_dfs, "ghi"),
+            self._stack(weather_dfs, "dhi"),
+            dni_extra=dni_extra,
+            airmass=airmass,
+            albedo=self.system.arrays[0].albedo,
+            model="haydavies",
+        )
+        aoi = pvlib.irradiance.aoi(
+            self.surface_tilt, self.surface_azimuth, zenith, azimuth
+        )
+        aoi_modifier = pvlib.iam.sapm(aoi, self.module)
+        effective_irradiance = (
+            total_irrad["poa_direct"] * aoi_modifier
+            + self.module.get("FD", 1.0) * total_irrad["poa_diffuse"]
+        )
+
+        temperature_parameters = self.system.arrays[0].temperature_model_parameters
+        cell_temperature = pvlib.temperature.sapm_cell(
+            total_irrad["poa_global"],
+            self._stack(weather_dfs, "temp_air", default=20),
+            self._stack(weather_dfs, "wind_speed", default=0),
+            temperature_parameters["a"],
+            temperature_parameters["b"],
+            temperature_parameters["deltaT"],
+        )
+        p_mp = pvlib.pvsystem.sapm(effective_irradiance, cell_temperature, self.module)[
+            "p_mp"
+        ]
+        dc_power = np.nan_to_num(np.clip(p_mp, 0, None)) / 1000
+        return pd.DataFrame(dc_power, index=times)
+
+    def dc_feed_in(self, lat, lon, weather_df):
+        """
+        Parameters:
+            lat (float): Latitude of the site
+            lon (float): Longitude of the site
+            weather_df (pd.DataFrame): Weather data of the site (see dc_feed_in_many)
+        Returns:
+            pd.Series: DC feed-in in kW per kWp
+        """
+        return self.dc_feed_in_many([lat], [lon], [weather_df])[0].rename("p_mp")
+
+
+@cache
+def get_pv_engine():
+    return PVEngine()
+
+
+def _get_dc_feed_in(lat, lon, weather_df):
+    return get_pv_engine().dc_feed_in(lat, lon, weather_df)
@@ -0,0 +1,127 @@
+"""
+Precomputed DC feed-in on a regular latitude/longitude grid covering the service country. As all projects use the
+same reference year, the feed-in only depends on the location, so it can be computed once offline (see
+build_solar_raster command) and looked up with a bilinear interpolation of the four surrounding grid points.
+"""
+
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config.settings.base import SOLAR_POTENTIAL_RASTER_PATH
+
+logger = logging.getLogger(__name__)
+
+
+def raster_axis(value_min, value_max, resolution):
+    """Grid coordinates in steps of resolution that cover [value_min, value_max] (at least two points)"""
+    start = np.floor(value_min / resolution)
+    stop = max(np.ceil(value_max / resolution), start + 1)
+    return np.round(np.arange(start, stop + 1) * resolution, 6)
+
+
+class SolarPotentialRaster:
+    """
+    DC feed-in in kW per kWp of the grid points, stored as a float32 array of shape (latitudes, longitudes,
+    timesteps) so the series of a grid point is contiguous. Grid points without weather data are NaN.
+    """
+
+    def __init__(self, lats, lons, dt_index, values):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.dt_index = dt_index
+        self.values = values
+
+    @property
+    def n_missing(self):
+        return int(np.isnan(self.values[:, :, 0]).sum())
+
+    def save(self, path):
+        """Write the raster to a compressed .npz file, replacing it atomically"""
+        path = Path(path)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    lats=self.lats,
+                    lons=self.lons,
+                    start=np.str_(self.dt_index[0].isoformat()),
+                    freq=np.str_(self.dt_index.freqstr),
+                    values=self.values,
+                )
+            # mkstemp creates the file owner-readable only, but all workers must be able to read it
+            Path(tmp_path).chmod(0o644)
+            Path(tmp_path).replace(path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            values = data["values"]
+            dt_index = pd.date_range(
+                str(data["start"]), periods=values.shape[2], freq=str(data["freq"])
+            )
+            return cls(data["lats"], data["lons"], dt_index, values)
+
+    def _time_slice(self, dt_index):
+        if dt_index.freq is None or dt_index.freqstr != self.dt_index.freqstr:
+            return None
+        start = self.dt_index.get_indexer([dt_index[0]])[0]
+        if start < 0 or start + len(dt_index) > len(self.dt_index):
+            return None
+        return slice(start, start + len(dt_index))
+
+    @staticmethod
+    def _cell(axis, value):
+        # Index of the lower grid point and the weight of the upper one
+        if not axis[0] <= value <= axis[-1]:
+            return None, None
+        i = min(int(np.searchsorted(axis, value, side="right")) - 1, len(axis) - 2)
+        return i, (value - axis[i]) / (axis[i + 1] - axis[i])
+
+    def feed_in(self, lat, lon, dt_index):
+        """
+        Parameters:
+            lat (float): Latitude of the site
+            lon (float): Longitude of the site
+            dt_index (pd.DatetimeIndex): Timesteps, must be covered by the raster and have the same frequency
+        Returns:
+            pd.Series: Bilinearly interpolated DC feed-in on dt_index, None if the site or the timesteps are outside
+                the raster or a surrounding grid point has no data
+        """
+        time_slice = self._time_slice(dt_index)
+        i, lat_weight = self._cell(self.lats, lat)
+        j, lon_weight = self._cell(self.lons, lon)
+        if time_slice is None or i is None or j is None:
+            return None
+        weights = np.outer([1 - lat_weight, lat_weight], [1 - lon_weight, lon_weight])
+        corners = self.values[i : i + 2, j : j + 2, time_slice].astype(np.float64)
+        # A missing grid point does not matter if the site lies on the opposite edge of the cell
+        if np.isnan(corners[weights > 0]).any():
+            return None
+        feed_in = np.einsum("ij,ijt->t", weights, np.nan_to_num(corners))
+        return pd.Series(feed_in, index=dt_index)
+
+
+@lru_cache(maxsize=1)
+def _load_raster(path, mtime):
+    logger.info("Loading solar potential raster %s", path)
+    return SolarPotentialRaster.load(path)
+
+
+def get_solar_raster(path=SOLAR_POTENTIAL_RASTER_PATH):
+    """Returns the raster loaded once per process (reloaded after it was rebuilt), None if it does not exist"""
+    path = Path(path)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _load_raster(path, mtime)
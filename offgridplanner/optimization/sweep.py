@@ -0,0 +1,197 @@
+"""
+Scenario sweep (sensitivity analysis) of a project: the supply optimization is run for every combination of a grid of
+parameter values and the KPIs of all variants are collected in one table. Nothing is saved to the database, the
+variants are derived in memory from one OptimizationContext (see OptimizationContext.variant), so the project is
+loaded and the solar potential computed only once, and the demand is only recomputed for changed wealth shares.
+
+Parameters are addressed as
+    "interest_rate"
+    "energy_system.<component>.<parameter>", e.g. "energy_system.pv.capex" or "energy_system.diesel_genset.fuel_cost"
+    "custom_demand.<field>", e.g. "custom_demand.very_low" (wealth shares and demand calibration)
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+
+import pandas as pd
+from asgiref.sync import sync_to_async
+
+from config.settings.base import DONE
+from config.settings.base import ERROR
+from config.settings.base import PENDING
+from config.settings.base import SIM_STATUS_POLL_INTERVAL
+from config.settings.base import SIM_SWEEP_MAX_CONCURRENCY
+from config.settings.base import SIM_SWEEP_MAX_VARIANTS
+from offgridplanner.optimization.processing import OptimizationContext
+from offgridplanner.optimization.processing import PreProcessor
+from offgridplanner.optimization.processing import SupplyProcessor
+from offgridplanner.optimization.requests import async_optimization_check_status
+from offgridplanner.optimization.requests import async_optimization_server_request
+
+logger = logging.getLogger(__name__)
+
+CUSTOM_DEMAND_FIELDS = (
+    "very_low",
+    "low",
+    "middle",
+    "high",
+    "very_high",
+    "annual_total_consumption",
+    "annual_peak_consumption",
+)
+KPIS = (
+    "lcoe",
+    "res",
+    "shortage",
+    "surplus_rate",
+    "total_renewable",
+    "total_non_renewable",
+    "total_fuel",
+    "total_revenue",
+    "co2_emissions",
+)
+
+
+def parse_parameter(name):
+    """
+    Parameters:
+        name (str): Name of a sweep parameter, e.g. "energy_system.pv.capex"
+    Returns:
+        tuple: The part of the project it belongs to ("interest_rate", "energy_system" or "custom_demand") and the
+            remaining keys, e.g. ("energy_system", ["pv", "capex"])
+    """
+    kind, *keys = name.split(".")
+    if (
+        (kind == "interest_rate" and not keys)
+        or (kind == "energy_system" and len(keys) == 2)  # noqa:PLR2004
+        or (
+            kind == "custom_demand"
+            and len(keys) == 1
+            and keys[0] in CUSTOM_DEMAND_FIELDS
+        )
+    ):
+        return kind, keys
+    msg = (
+        f"Invalid sweep parameter {name}, expected interest_rate, energy_system.<component>.<parameter> or "
+        f"custom_demand.<{'|'.join(CUSTOM_DEMAND_FIELDS)}>"
+    )
+    raise ValueError(msg)
+
+
+def expand_parameter_grid(parameter_grid, max_variants=SIM_SWEEP_MAX_VARIANTS):
+    """
+    Parameters:
+        parameter_grid (dict): Values of each parameter, e.g. {"interest_rate": [5, 10], "energy_system.pv.capex":
+            [600, 800]}
+        max_variants (int): Maximum number of variants
+    Returns:
+        list: One dict {parameter: value} per combination of the values
+    """
+    n_variants = math.prod(len(values) for values in parameter_grid.values())
+    if n_variants > max_variants:
+        msg = f"The sweep has {n_variants} variants, at most {max_variants} are allowed"
+        raise ValueError(msg)
+    return [
+        dict(zip(parameter_grid, values, strict=True))
+        for values in itertools.product(*parameter_grid.values())
+    ]
+
+
+def variant_overrides(variant):
+    """Keyword arguments of OptimizationContext.variant for a variant {parameter: value}"""
+    overrides = {"energy_system": {}, "custom_demand": {}}
+    for name, value in variant.items():
+        kind, keys = parse_parameter(name)
+        if kind == "interest_rate":
+            overrides["interest_rate"] = value
+        elif kind == "energy_system":
+            component, parameter = keys
+            overrides["energy_system"].setdefault(component, {})[parameter] = value
+        else:
+            overrides["custom_demand"][keys[0]] = value
+    return overrides
+
+
+class ScenarioSweep:
+    # Runs the supply optimization of all variants of a project, at most max_concurrency of them at the same time
+    def __init__(
+        self,
+        proj_id,
+        parameter_grid,
+        max_concurrency=SIM_SWEEP_MAX_CONCURRENCY,
+        poll_interval=SIM_STATUS_POLL_INTERVAL,
+    ):
+        self.context = OptimizationContext(proj_id)
+        # Computed before the variants are derived, so those without a changed CustomDemand share it (cached_property
+        # values are copied by OptimizationContext.variant)
+        self.context.demand  # noqa: B018
+        self.variants = expand_parameter_grid(parameter_grid)
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval
+        energy_system_dict = self.context.energy_system_dict
+        for name in parameter_grid:
+            kind, keys = parse_parameter(name)
+            if kind == "energy_system" and keys[1] not in energy_system_dict.get(
+                keys[0], {}
+            ).get("parameters", {}):
+                msg = f"Unknown energy system parameter {name}"
+                raise ValueError(msg)
+
+    def supply_json(self, variant):
+        """Returns the context of the variant and the input json of its supply optimization"""
+        context = self.context.variant(**variant_overrides(variant))
+        return context, PreProcessor(context=context).collect_supply_opt_json_data()
+
+    @staticmethod
+    def kpis(context, results_json):
+        """KPIs of a variant, computed from the results of its supply optimization without saving them"""
+        processor = SupplyProcessor(results_json, context=context)
+        processor.process_supply_optimization_results()
+        kpis = {kpi: float(getattr(processor, kpi)) for kpi in KPIS}
+        kpis.update(
+            {
+                f"{component}_capacity": float(capacity)
+                for component, capacity in processor.capacities.items()
+            }
+        )
+        return kpis
+
+    async def _wait(self, token):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            response = await async_optimization_check_status(token)
+            status = response.get("status") if response is not None else ERROR
+            if status != PENDING:
+                return status, response
+
+    async def _run_variant(self, variant, semaphore):
+        row = dict(variant)
+        try:
+            async with semaphore:
+                context, supply_json = await sync_to_async(self.supply_json)(variant)
+                response = await async_optimization_server_request(
+                    supply_json, "supply"
+                )
+                row["status"], response = await self._wait(response["id"])
+            if row["status"] == DONE:
+                row.update(
+                    await sync_to_async(self.kpis)(context, response.get("results"))
+                )
+        except Exception:
+            logger.exception("Variant %s of the scenario sweep failed", variant)
+            row["status"] = ERROR
+        return row
+
+    async def run(self):
+        """
+        Returns:
+            pd.DataFrame: One row per variant with the parameter values, the status of its simulation and its KPIs
+                (NaN for failed variants)
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        rows = await asyncio.gather(
+            *(self._run_variant(variant, semaphore) for variant in self.variants)
+        )
+        return pd.DataFrame(rows)
@@ -7,9 +7,40 @@ This module in a FastAPI application uses Celery to handle asynchronous tasks:
 
 Additionally, it includes functions to check the status of these tasks, identifying if they have completed, failed,
 or been revoked. This setup enables efficient, asynchronous processing of complex tasks and user management.
+
+The status of all PENDING simulations is checked periodically by `task_poll_simulation_status` (run by celery beat, see
+CELERY_BEAT_SCHEDULE), independent of any browser waiting for the results. The results of the simulation server are
+then processed by a chain of tasks (grid results, supply results, shared results), which is queued by
+`queue_results_processing` as soon as the simulations that were run are DONE.
 """
 
+import logging
+import uuid
+
+import httpx
+from asgiref.sync import async_to_sync
+from celery import Task
+from celery import chain
+from celery import shared_task
 from celery.result import AsyncResult
+from django.db import OperationalError
+from django.db import transaction
+from django.db.models import Q
+
+from config.settings.base import DONE
+from config.settings.base import ERROR
+from config.settings.base import PENDING
+from offgridplanner.optimization.models import Simulation
+from offgridplanner.optimization.processing import GridProcessor
+from offgridplanner.optimization.processing import OptimizationContext
+from offgridplanner.optimization.processing import SupplyProcessor
+from offgridplanner.optimization.processing import merge_shared_results
+from offgridplanner.optimization.requests import async_optimization_check_status_many
+from offgridplanner.optimization.results_cache import cache_simulation_results
+from offgridplanner.optimization.results_cache import clear_simulation_results
+from offgridplanner.optimization.results_cache import get_simulation_results
+
+logger = logging.getLogger(__name__)
 
 # TODO the celery queue could still be used to send the simulation request and fetch its status
 # @shared_task(
@@ -36,6 +67,174 @@ from celery.result import AsyncResult
 #     return result
 
 
+class SimulationResultsNotReadyError(Exception):
+    """The results of a simulation could not be fetched from the simulation server (yet)"""
+
+
+class ResultsProcessingTask(Task):
+    # Every step of the chain only overwrites the results of the project, so it can safely be retried
+    autoretry_for = (SimulationResultsNotReadyError, httpx.HTTPError, OperationalError)
+    retry_kwargs = {"max_retries": 3, "countdown": 10}
+    retry_backoff = True
+    acks_late = True
+    track_started = True
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        proj_id = args[0] if args else kwargs.get("proj_id")
+        logger.error("Processing the results of project %s failed: %s", proj_id, exc)
+        Simulation.objects.filter(project__id=proj_id).update(status_results=ERROR)
+
+
+def fetch_simulation_results(proj_id, model):
+    """
+    Get the results of a finished simulation from the results cache (or the simulation server)
+    Parameters:
+        proj_id (int): Id of the project
+        model (str): Either "grid" or "supply"
+    Returns:
+        dict: Results of the simulation
+    """
+    simulation = Simulation.objects.get(project__id=proj_id)
+    token = simulation.token_grid if model == "grid" else simulation.token_supply
+    results = get_simulation_results(token)
+    if results is None:
+        msg = f"No results for the {model} simulation of project {proj_id}"
+        raise SimulationResultsNotReadyError(msg)
+    return results
+
+
+@shared_task(name="task_process_grid_results", base=ResultsProcessingTask)
+def task_process_grid_results(proj_id):
+    results_json = fetch_simulation_results(proj_id, "grid")
+    context = OptimizationContext(proj_id)
+    grid_processor = GridProcessor(results_json=results_json, context=context)
+    grid_processor.grid_results_to_db()
+
+
+@shared_task(name="task_process_supply_results", base=ResultsProcessingTask)
+def task_process_supply_results(proj_id):
+    results_json = fetch_simulation_results(proj_id, "supply")
+    context = OptimizationContext(proj_id)
+    supply_processor = SupplyProcessor(results_json=results_json, context=context)
+    supply_processor.process_supply_optimization_results()
+    supply_processor.supply_results_to_db()
+
+
+@shared_task(name="task_merge_results", base=ResultsProcessingTask)
+def task_merge_results(proj_id):
+    simulation = Simulation.objects.get(project__id=proj_id)
+    if simulation.token_grid and simulation.token_supply:
+        merge_shared_results(proj_id)
+    simulation.status_results = DONE
+    simulation.save(update_fields=["status_results"])
+    # The results are in the database now
+    clear_simulation_results(simulation.token_grid, simulation.token_supply)
+
+
+def queue_results_processing(**lookup):
+    """
+    Queue the result processing chain of a simulation once the simulations that were run are DONE (a simulation
+    without token was not run, e.g. for a supply-only project). The conditional update makes sure the chain is queued
+    only once, even if several processes see the DONE status. The chain is sent when the current transaction is
+    committed, so the worker sees the updated statuses and nothing is queued if the transaction is rolled back.
+    Parameters:
+        lookup: Filter identifying the Simulation, e.g. project__id=1 or token_grid="..."
+    Returns:
+        str: Id of the queued chain, None if it was not queued by this call
+    """
+    simulation = Simulation.objects.filter(**lookup).only("id").first()
+    if simulation is None:
+        return None
+    task_id = str(uuid.uuid4())
+    queued = (
+        Simulation.objects.filter(
+            Q(status_grid=DONE) | Q(token_grid=""),
+            Q(status_supply=DONE) | Q(token_supply=""),
+            id=simulation.id,
+        )
+        .exclude(token_grid="", token_supply="")
+        .exclude(status_results__in=[PENDING, DONE])
+        .update(status_results=PENDING, results_task_id=task_id)
+    )
+    if not queued:
+        return None
+
+    simulation = Simulation.objects.only(
+        "project_id", "token_grid", "token_supply"
+    ).get(id=simulation.id)
+    proj_id = simulation.project_id
+    tasks = [
+        task.si(proj_id)
+        for task, token in [
+            (task_process_grid_results, simulation.token_grid),
+            (task_process_supply_results, simulation.token_supply),
+        ]
+        if token
+    ]
+    processing = chain(*tasks, task_merge_results.si(proj_id))
+    transaction.on_commit(lambda: processing.apply_async(task_id=task_id))
+    logger.info("Queued the result processing of project %s", proj_id)
+    return task_id
+
+
+def pending_simulation_tokens():
+    """Returns the model ("grid" or "supply") by token of all simulations with a PENDING status"""
+    pending = {}
+    for model in ["grid", "supply"]:
+        tokens = (
+            Simulation.objects.filter(**{f"status_{model}": PENDING})
+            .exclude(**{f"token_{model}": ""})
+            .values_list(f"token_{model}", flat=True)
+        )
+        pending.update(dict.fromkeys(tokens, model))
+    return pending
+
+
+def poll_pending_simulations():
+    """
+    Check the status of all PENDING simulations at the simulation server in one batch, write the status changes and
+    queue the result processing of the finished simulations, so it does not depend on a browser waiting for them. A
+    simulation whose status could not be requested stays PENDING and is checked again by the next run.
+    Returns:
+        dict: New status by token of the simulations which have finished
+    """
+    pending = pending_simulation_tokens()
+    if not pending:
+        return {}
+    responses = async_to_sync(async_optimization_check_status_many)(list(pending))
+    finished = {}
+    for token, response in responses.items():
+        status = response.get("status") if response is not None else None
+        if status not in [DONE, ERROR]:
+            if status not in [None, PENDING]:
+                logger.warning(
+                    "Simulation %s returned unexpected status %s", token, status
+                )
+            continue
+        model = pending[token]
+        if status == DONE:
+            # Keep the results server-side until they are processed
+            cache_simulation_results(token, response.get("results"))
+        else:
+            logger.warning("Simulation %s failed with errors", token)
+        with transaction.atomic():
+            # Only the first process seeing the new status writes it and queues the processing
+            updated = Simulation.objects.filter(
+                **{f"token_{model}": token, f"status_{model}": PENDING}
+            ).update(**{f"status_{model}": status})
+            if updated and status == DONE:
+                queue_results_processing(**{f"token_{model}": token})
+        finished[token] = status
+    return finished
+
+
+@shared_task(name="task_poll_simulation_status", ignore_result=True)
+def task_poll_simulation_status():
+    finished = poll_pending_simulations()
+    if finished:
+        logger.info("Simulations finished: %s", finished)
+
+
 def get_status(task_id):
     task = AsyncResult(task_id)
     status = task.state.lower()
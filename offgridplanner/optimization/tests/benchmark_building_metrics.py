@@ -0,0 +1,36 @@
+"""
+Benchmark of the building metrics of an Overpass response (not collected by pytest), run with
+    python -m offgridplanner.optimization.tests.benchmark_building_metrics [n_buildings]
+"""
+
+import sys
+import time
+
+from offgridplanner.optimization.grid import identify_consumers_on_map as ocm
+from offgridplanner.optimization.tests.test_building_metrics import overpass_payload
+from offgridplanner.optimization.tests.test_building_metrics import (
+    reference_areas_and_mean_coordinates,
+)
+
+
+def best_time(func, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(n_buildings=20000):
+    geojson = ocm.convert_overpass_json_to_geojson(overpass_payload(n_buildings))
+    reference = best_time(reference_areas_and_mean_coordinates, geojson)
+    vectorized = best_time(ocm.obtain_areas_and_mean_coordinates_from_geojson, geojson)
+    sys.stdout.write(
+        f"{n_buildings} buildings: per building {reference * 1000:.0f} ms, "
+        f"vectorized {vectorized * 1000:.0f} ms, speedup {reference / vectorized:.0f}x\n"
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,86 @@
+"""
+Benchmark of the status requests to the simulation server against a local stub server (not collected by pytest), per
+call httpx.get compared to the pooled keep-alive client of HTTPClientManager, run with
+    python -m offgridplanner.optimization.tests.benchmark_http_client [n_pollers] [n_requests]
+"""
+
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import httpx
+
+from offgridplanner.optimization.requests import HTTPClientManager
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    # Answers every request like the status endpoint of a pending simulation, keeping the connection open
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # noqa: N802
+        body = json.dumps({"status": "PENDING", "results": None}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # The default backlog of 5 connections drops the connections of many concurrent pollers
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def poll(get, url, n_requests):
+    latencies = []
+    for i in range(n_requests):
+        start = time.perf_counter()
+        get(f"{url}{i}").raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(get, url, n_pollers, n_requests):
+    """Returns the wall time and the latencies of n_pollers threads sending n_requests each"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_pollers) as executor:
+        results = executor.map(lambda _: poll(get, url, n_requests), range(n_pollers))
+        latencies = [latency for result in results for latency in result]
+    return time.perf_counter() - start, latencies
+
+
+def report(name, wall, latencies):
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    sys.stdout.write(
+        f"{name}: wall {wall:.1f} s, median {statistics.median(latencies) * 1000:.0f} ms, "
+        f"p95 {p95 * 1000:.0f} ms\n"
+    )
+
+
+def main(n_pollers=50, n_requests=20):
+    server = StubServer(("127.0.0.1", 0), StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/status/"
+    manager = HTTPClientManager()
+    try:
+        report("per-call httpx.get", *run(httpx.get, url, n_pollers, n_requests))
+        report(
+            "pooled client",
+            *run(lambda url: manager.request("GET", url), url, n_pollers, n_requests),
+        )
+    finally:
+        manager.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,124 @@
+import io
+import json
+
+import numpy as np
+import pytest
+from shapely import geometry
+
+from offgridplanner.optimization.grid import identify_consumers_on_map as ocm
+
+
+def overpass_payload(n_buildings, seed=0):
+    """Synthetic Overpass response (nodes before ways) with buildings scattered over a 0.15° x 0.15° bbox"""
+    rng = np.random.default_rng(seed)
+    nodes, ways = [], []
+    node_id = 0
+    for building_id in range(n_buildings):
+        center = 9 + rng.random() * 0.15, 7 + rng.random() * 0.15
+        # Mostly houses of a few to a few hundred m², some tiny or compact outlines that are filtered out
+        n_vertices = rng.integers(3, 9)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+        radius = rng.choice([1e-5, 5e-5, 1.5e-4]) * rng.uniform(0.5, 1.5, n_vertices)
+        ring = []
+        for angle, r in zip(angles, radius, strict=True):
+            node_id += 1
+            nodes.append(
+                {
+                    "type": "node",
+                    "id": node_id,
+                    "lat": round(center[0] + r * np.cos(angle), 7),
+                    "lon": round(center[1] + r * np.sin(angle), 7),
+                }
+            )
+            ring.append(node_id)
+        # Overpass closes the outlines by repeating the first node, except for a few broken ones
+        if building_id % 10:
+            ring.append(ring[0])
+        ways.append({"type": "way", "id": 10**7 + building_id, "nodes": ring})
+    return {"version": 0.6, "elements": nodes + ways}
+
+
+def reference_areas_and_mean_coordinates(geojson):
+    # Per building implementation previously used by obtain_areas_and_mean_coordinates_from_geojson
+    building_mean_coordinates = {}
+    building_surface_areas = {}
+    reference_coordinate = geojson["features"][0]["geometry"]["coordinates"][0][0]
+    for building in geojson["features"]:
+        latitudes_longitudes = list(building["geometry"]["coordinates"][0])
+        latitudes = [x[0] for x in latitudes_longitudes]
+        longitudes = [x[1] for x in latitudes_longitudes]
+        mean_coord = [np.mean(latitudes), np.mean(longitudes)]
+        xy_coordinates = [
+            ocm.xy_coordinates_from_latitude_longitude(
+                latitude=latitude,
+                longitude=longitude,
+                ref_latitude=reference_coordinate[0],
+                ref_longitude=reference_coordinate[1],
+            )
+            for latitude, longitude in latitudes_longitudes
+        ]
+        polygon = geometry.Polygon(xy_coordinates)
+        area = polygon.area
+        perimeter = polygon.length
+        compactness = 4 * np.pi * area / (perimeter**2) if perimeter else 0
+        if area > 4 and not (0.81 < compactness < 1.91 and area < 8):  # noqa:PLR2004
+            building_mean_coordinates[building["property"]["@id"]] = mean_coord
+            building_surface_areas[building["property"]["@id"]] = area
+    return building_mean_coordinates, building_surface_areas
+
+
+def assert_same_buildings(result, expected):
+    coordinates, areas = result
+    expected_coordinates, expected_areas = expected
+    assert coordinates.keys() == expected_coordinates.keys()
+    keys = list(expected_areas)
+    np.testing.assert_allclose(
+        [areas[key] for key in keys], [expected_areas[key] for key in keys], rtol=1e-9
+    )
+    np.testing.assert_allclose(
+        [coordinates[key] for key in keys],
+        [expected_coordinates[key] for key in keys],
+        rtol=1e-12,
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_building_metrics_match_shapely(seed):
+    geojson = ocm.convert_overpass_json_to_geojson(overpass_payload(2000, seed))
+    expected = reference_areas_and_mean_coordinates(geojson)
+    # Some outlines of the payload are filtered out
+    assert 0 < len(expected[0]) < len(geojson["features"])
+    assert_same_buildings(
+        ocm.obtain_areas_and_mean_coordinates_from_geojson(geojson), expected
+    )
+
+
+def test_streamed_buildings_match_geojson():
+    payload = overpass_payload(500)
+    expected = ocm.obtain_areas_and_mean_coordinates_from_geojson(
+        ocm.convert_overpass_json_to_geojson(payload)
+    )
+    stream = io.BytesIO(json.dumps(payload, indent=1).encode())
+    buildings = list(
+        ocm.iter_buildings_from_overpass_elements(
+            ocm.iter_overpass_elements(stream, chunk_size=100), batch_size=7
+        )
+    )
+    assert_same_buildings(
+        (
+            {building_id: coord for building_id, coord, _area in buildings},
+            {building_id: area for building_id, _coord, area in buildings},
+        ),
+        expected,
+    )
+
+
+def test_perimeter_and_compactness_of_a_square():
+    # A 10 m x 10 m square at the reference coordinate
+    side = np.degrees(10 / 6371000)
+    ring = [[0, 0], [side, 0], [side, side], [0, side]]
+    metrics = ocm.building_metrics([ring], [0, 0])
+    assert metrics["area"][0] == pytest.approx(100)
+    assert metrics["perimeter"][0] == pytest.approx(40)
+    assert metrics["compactness"][0] == pytest.approx(np.pi / 4)
+    assert metrics["is_building"][0]
@@ -0,0 +1,165 @@
+import io
+import json
+
+import numpy as np
+import pytest
+import shapely
+from django.core.management import call_command
+
+from offgridplanner.optimization.grid import building_store
+from offgridplanner.optimization.grid import identify_consumers_on_map as ocm
+from offgridplanner.optimization.models import BuildingFootprint
+from offgridplanner.optimization.models import BuildingTile
+from offgridplanner.optimization.tests.test_building_metrics import overpass_payload
+
+ZOOM = 14
+
+
+class OverpassStub:
+    # Stands in for request_overpass_buildings, returns the buildings of a payload and records the requested bboxes
+    def __init__(self, payload):
+        self.buildings = list(
+            ocm.iter_buildings_from_overpass_elements(payload["elements"])
+        )
+        self.requests = []
+
+    def __call__(self, *bbox):
+        self.requests.append(bbox)
+        return self.buildings
+
+
+@pytest.fixture
+def payload():
+    return overpass_payload(300)
+
+
+@pytest.fixture
+def overpass(monkeypatch, payload):
+    stub = OverpassStub(payload)
+    monkeypatch.setattr(building_store, "request_overpass_buildings", stub)
+    return stub
+
+
+def in_bbox(buildings, bbox):
+    min_latitude, min_longitude, max_latitude, max_longitude = bbox
+    return {
+        building_id
+        for building_id, (latitude, longitude), _area in buildings
+        if min_latitude <= latitude <= max_latitude
+        and min_longitude <= longitude <= max_longitude
+    }
+
+
+def test_tile_of_and_tile_bounds():
+    assert building_store.tile_of(0.1, 0.1, 1) == (1, 0)
+    assert building_store.tile_of(-0.1, -0.1, 1) == (0, 1)
+    min_latitude, min_longitude, max_latitude, max_longitude = (
+        building_store.tile_bounds(0, 0, 0)
+    )
+    assert (min_longitude, max_longitude) == (-180, 180)
+    assert max_latitude == pytest.approx(85.0511, abs=1e-4)
+    assert min_latitude == pytest.approx(-85.0511, abs=1e-4)
+
+    rng = np.random.default_rng(0)
+    latitudes, longitudes = rng.uniform(-60, 60, 100), rng.uniform(-179, 179, 100)
+    xs, ys = building_store.tile_of(latitudes, longitudes, ZOOM)
+    for latitude, longitude, x, y in zip(latitudes, longitudes, xs, ys, strict=True):
+        min_latitude, min_longitude, max_latitude, max_longitude = (
+            building_store.tile_bounds(x, y, ZOOM)
+        )
+        assert min_latitude <= latitude <= max_latitude
+        assert min_longitude <= longitude <= max_longitude
+
+
+def test_tiles_in_bbox_and_within():
+    x, y = building_store.tile_of(9.05, 7.05, ZOOM)
+    bounds = building_store.tile_bounds(x, y, ZOOM)
+    # A bbox inside a tile
+    shrunk = np.add(bounds, [1e-6, 1e-6, -1e-6, -1e-6])
+    assert building_store.tiles_in_bbox(*shrunk, ZOOM) == [(x, y)]
+    # 2 x 3 tiles, y increases southward
+    last = building_store.tile_bounds(x + 1, y + 2, ZOOM)
+    bbox = (last[0], bounds[1], bounds[2], last[3])
+    tiles = building_store.tiles_in_bbox(*np.add(bbox, [1e-6, 1e-6, -1e-6, -1e-6]))
+    assert sorted(tiles) == [(x + i, y + j) for i in range(2) for j in range(3)]
+
+    boundary = shapely.box(bbox[1], bbox[0], bbox[3], bbox[2])
+    assert sorted(building_store.tiles_within(boundary, ZOOM)) == sorted(tiles)
+    # Only the tiles completely inside the boundary
+    smaller = shapely.box(bbox[1], bbox[0], bbox[3] - 1e-4, bbox[2])
+    assert sorted(building_store.tiles_within(smaller, ZOOM)) == [
+        (x, y + j) for j in range(3)
+    ]
+
+
+@pytest.mark.django_db
+def test_loaded_extract_is_answered_locally(tmp_path, payload, overpass):
+    path = tmp_path / "extract.json"
+    path.write_text(json.dumps(payload))
+    extract_bbox = (8.9, 6.9, 9.3, 7.3)
+    call_command(
+        "load_building_footprints", str(path), "--bbox", *map(str, extract_bbox)
+    )
+    assert BuildingFootprint.objects.count() == len(overpass.buildings)
+
+    bbox = (9.02, 7.03, 9.11, 7.12)
+    buildings = building_store.buildings_in_bbox(*bbox, ZOOM)
+    assert overpass.requests == []
+    assert {building_id for building_id, _, _ in buildings} == in_bbox(
+        overpass.buildings, bbox
+    )
+
+
+@pytest.mark.django_db
+def test_edge_tiles_of_an_extract_fall_back_to_overpass(tmp_path, payload, overpass):
+    path = tmp_path / "extract.json"
+    path.write_text(json.dumps(payload))
+    # The extract only covers part of the buildings' area
+    call_command(
+        "load_building_footprints", str(path), "--bbox", "8.9", "6.9", "9.3", "7.08"
+    )
+    bbox = (9.02, 7.03, 9.11, 7.12)
+    buildings = building_store.buildings_in_bbox(*bbox, ZOOM)
+    assert len(overpass.requests) == 1
+    assert in_bbox(overpass.buildings, bbox) <= {b[0] for b in buildings}
+
+    # The missing tiles are stored now
+    building_store.buildings_in_bbox(*bbox, ZOOM)
+    assert len(overpass.requests) == 1
+
+
+@pytest.mark.django_db
+def test_missing_tiles_are_requested_once(overpass):
+    bbox = (9.02, 7.03, 9.11, 7.12)
+    first = building_store.buildings_in_bbox(*bbox, ZOOM)
+    second = building_store.buildings_in_bbox(*bbox, ZOOM)
+    assert len(overpass.requests) == 1
+    # The request covers the bbox
+    requested = overpass.requests[0]
+    assert np.all(np.less_equal(requested[:2], bbox[:2]))
+    assert np.all(np.greater_equal(requested[2:4], bbox[2:4]))
+    assert {b[0] for b in second} == in_bbox(overpass.buildings, bbox)
+    assert in_bbox(overpass.buildings, bbox) <= {b[0] for b in first}
+    assert BuildingTile.objects.filter(complete=True).count() == len(
+        building_store.tiles_in_bbox(*bbox, ZOOM)
+    )
+
+
+@pytest.mark.django_db
+def test_incomplete_overpass_response_is_not_stored(monkeypatch):
+    response = io.BytesIO(
+        b'{"version": 0.6, "elements": [{"type": "node", "id": 1, "lat": 9.05, "lon": 7.05}], '
+        b'"remark": "runtime error: Query timed out"}'
+    )
+
+    def request(*_bbox):
+        return list(
+            ocm.iter_buildings_from_overpass_elements(
+                ocm.iter_overpass_elements(response)
+            )
+        )
+
+    monkeypatch.setattr(building_store, "request_overpass_buildings", request)
+    with pytest.raises(ocm.OverpassError, match="Query timed out"):
+        building_store.buildings_in_bbox(9.02, 7.03, 9.11, 7.12, ZOOM)
+    assert not BuildingTile.objects.exists()
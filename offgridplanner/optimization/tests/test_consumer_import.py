@@ -0,0 +1,109 @@
+import json
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from offgridplanner.optimization import helpers
+
+CSV = (
+    "Latitude ,longitude,consumer_type,consumer_detail,custom_specification,shs_options\n"
+    "9.01,7.01,household,,,0\n"
+    "9.02,7.02,enterprise,Food_Bar,2 x Welder (5.25kW);Drill (0.4kW),\n"
+    "9.03,7.03,,,,1\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def country_bounds(monkeypatch):
+    monkeypatch.setattr(
+        helpers,
+        "get_country_bounds",
+        lambda _proj_id: {
+            "latitude_min": 4,
+            "latitude_max": 14,
+            "longitude_min": 2,
+            "longitude_max": 15,
+        },
+    )
+
+
+def read(content):
+    if isinstance(content, str):
+        content = content.encode()
+    return helpers.convert_file_to_df(
+        SimpleUploadedFile("consumers.csv", content), "csv"
+    )
+
+
+def test_valid_consumers():
+    df, msg = helpers.check_imported_consumer_data(read(CSV), proj_id=1)
+    assert msg == ""
+    assert df.to_dict("records")[1:] == [
+        {
+            "latitude": 9.02,
+            "longitude": 7.02,
+            "how_added": "automatic",
+            "node_type": "consumer",
+            "consumer_type": "enterprise",
+            "custom_specification": "2 x Welder (5.25kW);Drill (0.4kW)",
+            "shs_options": 0,
+            "consumer_detail": "Food_Bar",
+            "is_connected": True,
+        },
+        {
+            "latitude": 9.03,
+            "longitude": 7.03,
+            "how_added": "automatic",
+            "node_type": "consumer",
+            "consumer_type": "household",
+            "custom_specification": "",
+            "shs_options": 1,
+            "consumer_detail": "",
+            "is_connected": True,
+        },
+    ]
+
+
+def test_all_errors_are_reported_with_rows():
+    content = (
+        CSV.replace("9.02,", "north,")
+        .replace("household", "houshold")
+        .replace(",1\n", ",2\n")
+        .replace("Drill (0.4kW)", "Drill")
+    )
+    with pytest.raises(ValidationError) as e:
+        helpers.check_imported_consumer_data(read(content), proj_id=1)
+    assert e.value.messages == [
+        "Missing or non-numeric latitude values in rows 3.",
+        "Invalid consumer_type values in rows 2: ['houshold']. "
+        "Allowed: ['enterprise', 'household', 'public_service']",
+        "Invalid shs_options values in rows 4: ['2']. Allowed: ['0', '1']",
+        "Invalid custom_specification values in rows 3: ['Drill']. "
+        f"Allowed: {sorted(helpers.allowed_column_values()['custom_specification'])}",
+    ]
+
+
+def test_consumers_outside_country():
+    with pytest.raises(ValidationError) as e:
+        helpers.check_imported_consumer_data(
+            read(CSV.replace("7.03", "17.03")), proj_id=1
+        )
+    assert e.value.messages == [
+        "Distance between consumers exceeds maximum allowed distance.",
+        "Some latitude/longitude values are outside the selected country bounds (rows 4).",
+    ]
+
+
+def test_consumer_columns_are_read_as_written():
+    df = read(CSV.replace("Food_Bar", "1"))
+    assert df["shs_options"].dropna().tolist() == ["0", "1"]
+    assert df["consumer_detail"].dropna().tolist() == ["1"]
+
+
+def test_invalid_utf8_is_an_encoding_error():
+    response = read(CSV.encode().replace(b"Food_Bar", b"Food\xff"))
+    assert response.status_code == 400  # noqa:PLR2004
+    assert json.loads(response.content) == {
+        "responseMsg": "File encoding error. Please check the file format."
+    }
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from offgridplanner.optimization import costs
+
+
+def reference_capex_multi_investment(
+    capex_0, component_lifetime, project_lifetime, wacc, tax=0
+):
+    # Scalar implementation previously used by OptimizationDataHandler.capex_multi_investment
+    capex_0 = float(capex_0)
+    component_lifetime = float(component_lifetime)
+    if project_lifetime == component_lifetime:
+        number_of_investments = 1
+    else:
+        number_of_investments = int(round(project_lifetime / component_lifetime + 0.5))
+    first_time_investment = capex_0 * (1 + tax)
+    capex = first_time_investment
+    for count_of_replacements in range(1, number_of_investments):
+        if count_of_replacements * component_lifetime != project_lifetime:
+            capex += first_time_investment / (
+                (1 + wacc) ** (count_of_replacements * component_lifetime)
+            )
+    if number_of_investments * component_lifetime > project_lifetime:
+        last_investment = first_time_investment / (
+            (1 + wacc) ** ((number_of_investments - 1) * component_lifetime)
+        )
+        linear_depreciation_last_investment = last_investment / component_lifetime
+        capex = capex - linear_depreciation_last_investment * (
+            number_of_investments * component_lifetime - project_lifetime
+        ) / ((1 + wacc) ** project_lifetime)
+    return capex
+
+
+def reference_epc(capex, opex, component_lifetime, project_lifetime, wacc):
+    crf = (wacc * (1 + wacc) ** project_lifetime) / ((1 + wacc) ** project_lifetime - 1)
+    return (
+        crf
+        * reference_capex_multi_investment(
+            capex, component_lifetime, project_lifetime, wacc
+        )
+        + opex
+    )
+
+
+def random_parameters(seed, size=5000):
+    rng = np.random.default_rng(seed)
+    project_lifetime = rng.integers(1, 36, size)
+    # Mix integer lifetimes, divisors and multiples of the project lifetime (replacement exactly at the end of the
+    # project, rounding half to even) and arbitrary fractional lifetimes
+    lifetime = np.select(
+        [rng.random(size) < 1 / 3, rng.random(size) < 1 / 2],
+        [
+            rng.integers(1, 41, size),
+            project_lifetime / rng.integers(1, 6, size) * rng.integers(1, 3, size),
+        ],
+        rng.uniform(0.5, 40, size),
+    )
+    return {
+        "capex": rng.uniform(0, 1e5, size),
+        "opex": rng.uniform(0, 1e3, size),
+        "component_lifetime": lifetime,
+        "project_lifetime": project_lifetime,
+        "wacc": rng.uniform(0.001, 0.3, size),
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_epc_matches_scalar_implementation(seed):
+    params = random_parameters(seed)
+    expected = np.array(
+        [
+            reference_epc(*values)
+            for values in zip(
+                params["capex"],
+                params["opex"],
+                params["component_lifetime"],
+                params["project_lifetime"],
+                params["wacc"],
+                strict=True,
+            )
+        ]
+    )
+    np.testing.assert_allclose(costs.epc(**params), expected, rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize(
+    ("component_lifetime", "project_lifetime"),
+    [(25, 25), (5, 25), (5, 20), (10, 25), (30, 25), (0.75, 3), (7.5, 15)],
+)
+def test_capex_multi_investment_edge_cases(component_lifetime, project_lifetime):
+    expected = reference_capex_multi_investment(
+        1000, component_lifetime, project_lifetime, 0.08
+    )
+    result = costs.capex_multi_investment(
+        1000, component_lifetime, project_lifetime, 0.08
+    )
+    assert result == pytest.approx(expected, rel=1e-12)
+
+
+def test_epc_broadcasts_parameters():
+    wacc = np.linspace(0.01, 0.2, 20)[:, None]
+    capex = np.array([1000, 2000, 3000])
+    result = costs.epc(capex, 10, 8, 25, wacc)
+    assert result.shape == (20, 3)
+    np.testing.assert_allclose(result[:, 1] - 10, 2 * (result[:, 0] - 10))
+
+
+def test_scalar_parameters_give_a_scalar():
+    assert np.ndim(costs.epc(1000, 10, 8, 25, 0.1)) == 0
+
+
+def test_crf_without_interest():
+    assert costs.capital_recovery_factor(0, 20) == pytest.approx(1 / 20)
+    assert costs.epc(1000, 0, 20, 20, 0) == pytest.approx(50)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from offgridplanner.optimization.models import Nodes
+from offgridplanner.projects.models import Options
+from offgridplanner.projects.models import Project
+from offgridplanner.steps.models import CustomDemand
+
+CUSTOM_DEMAND = CustomDemand(
+    very_low=0.1, low=0.2, middle=0.3, high=0.25, very_high=0.15
+)
+
+
+def households(n):
+    return pd.DataFrame(
+        {
+            "latitude": np.linspace(9.0, 9.01, n),
+            "longitude": 7.0,
+            "node_type": "consumer",
+            "consumer_type": "household",
+            "consumer_detail": "default",
+            "custom_specification": "",
+            "is_connected": True,
+        }
+    )
+
+
+@pytest.mark.django_db
+def test_demand_is_read_from_the_saved_nodes():
+    project = Project.objects.create(
+        name="test",
+        country="NG",
+        interest_rate=10,
+        options=Options.objects.create(),
+    )
+    nodes = Nodes(project=project)
+    nodes.df = households(3)
+    nodes.save()
+    demand = nodes.demand_timeseries(CUSTOM_DEMAND, time_range=range(24))
+
+    nodes.df = households(6)
+    nodes.save()
+    updated = nodes.demand_timeseries(CUSTOM_DEMAND, time_range=range(24))
+    assert updated["household"].sum() > 0
+    np.testing.assert_allclose(updated["household"], 2 * demand["household"])
+    reloaded = Nodes.objects.get(id=nodes.id)
+    pd.testing.assert_frame_equal(
+        reloaded.demand_timeseries(CUSTOM_DEMAND, time_range=range(24)), updated
+    )
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from offgridplanner.optimization.grid import identify_consumers_on_map as ocm
+from offgridplanner.optimization.grid.node_index import NodeIndex
+from offgridplanner.optimization.grid.node_index import duplicated_consumers
+
+
+@pytest.fixture
+def nodes():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "latitude": (9 + rng.random(1000) * 0.05).round(6),
+            "longitude": (7 + rng.random(1000) * 0.05).round(6),
+        }
+    )
+    # Exact copies of some nodes and nodes moved by a few centimetres
+    return pd.concat(
+        [df, df.iloc[:50], df.iloc[50:100] + 3e-7], ignore_index=True
+    ).sample(frac=1, random_state=0)
+
+
+def test_exact_duplicates_match_drop_duplicates(nodes):
+    expected = nodes.duplicated(subset=["latitude", "longitude"], keep="first")
+    duplicated = NodeIndex.from_df(nodes).duplicated(tolerance=0)
+    np.testing.assert_array_equal(duplicated, expected.to_numpy())
+
+
+def test_near_duplicates(nodes):
+    duplicated = NodeIndex.from_df(nodes).duplicated(tolerance=0.1)
+    assert duplicated.sum() == 100  # noqa:PLR2004
+    assert not nodes[~duplicated].round(5).duplicated().any()
+
+
+def test_within_matches_points_in_boundaries(nodes):
+    boundaries = [[9.01, 7.01], [9.04, 7.015], [9.035, 7.045], [9.012, 7.03]]
+    expected = ocm.points_in_boundaries(
+        nodes["latitude"], nodes["longitude"], boundaries
+    )
+    assert expected.any()
+    np.testing.assert_array_equal(NodeIndex.from_df(nodes).within(boundaries), expected)
+
+
+def test_chained_nodes_are_compared_to_kept_nodes():
+    # Nodes 0.6 m apart along a line, each one is closer than 1 m to the previous one
+    latitudes = 9 + np.arange(5) * 0.6 / (np.pi / 180 * 6371000)
+    index = NodeIndex(latitudes, np.full(5, 7.0))
+    np.testing.assert_array_equal(
+        index.duplicated(tolerance=1), [False, True, False, True, False]
+    )
+
+
+def test_power_house_is_never_a_duplicate():
+    df = pd.DataFrame(
+        {
+            "latitude": [9.0, 9.0, 9.0, 9.1],
+            "longitude": [7.0, 7.0, 7.0, 7.1],
+            "node_type": ["consumer", "power-house", "consumer", "consumer"],
+        }
+    )
+    np.testing.assert_array_equal(duplicated_consumers(df), [False, False, True, False])
+    assert len(duplicated_consumers(pd.DataFrame())) == 0
+
+
+def test_empty_index():
+    index = NodeIndex.from_df(pd.DataFrame())
+    assert len(index.duplicated()) == 0
+    assert len(index.within([[0, 0], [1, 0], [1, 1]])) == 0
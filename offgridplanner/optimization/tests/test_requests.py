@@ -0,0 +1,20 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+
+from offgridplanner.optimization.requests import HTTPClientManager
+
+
+async def async_clients(manager):
+    return manager.async_client, manager.async_client
+
+
+def test_async_client_is_shared_within_a_loop_and_closed_with_it():
+    manager = HTTPClientManager()
+    first, same = asyncio.run(async_clients(manager))
+    assert first is same
+    assert first.is_closed
+
+    second, _ = async_to_sync(async_clients)(manager)
+    assert second is not first
+    assert second.is_closed
@@ -0,0 +1,43 @@
+import pytest
+from django.core.cache import cache
+
+from offgridplanner.optimization import results_cache
+from offgridplanner.optimization.models import ReusedSimulationResults
+
+RESULTS = {"lcoe": 0.3, "timeseries": list(range(100))}
+
+
+@pytest.fixture(autouse=True)
+def no_simulation_server(monkeypatch):
+    def check_status(token):
+        msg = f"Unexpected request of {token} to the simulation server"
+        raise AssertionError(msg)
+
+    monkeypatch.setattr(results_cache, "optimization_check_status", check_status)
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_reused_results_survive_a_cache_miss():
+    input_hash = results_cache.simulation_input_hash({"nodes": [1, 2]}, "grid")
+    results_cache.remember_simulation_input("first", input_hash)
+    results_cache.cache_simulation_results("first", RESULTS)
+
+    token = f"{results_cache.REUSED_TOKEN_PREFIX}1"
+    assert results_cache.reuse_simulation_results(input_hash, token)
+    # e.g. the cache is local to the web process and the results are processed by a celery worker
+    cache.delete(results_cache.results_cache_key(token))
+    assert results_cache.get_simulation_results(token) == RESULTS
+
+    results_cache.clear_simulation_results(token)
+    assert not ReusedSimulationResults.objects.exists()
+    # Never requested from the simulation server, which does not know the token
+    assert results_cache.get_simulation_results(token) is None
+
+
+@pytest.mark.django_db
+def test_unknown_input_is_not_reused():
+    input_hash = results_cache.simulation_input_hash({"nodes": [3]}, "supply")
+    token = f"{results_cache.REUSED_TOKEN_PREFIX}2"
+    assert not results_cache.reuse_simulation_results(input_hash, token)
+    assert not ReusedSimulationResults.objects.exists()
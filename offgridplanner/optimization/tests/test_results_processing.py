@@ -0,0 +1,96 @@
+import pytest
+
+from config.settings.base import DONE
+from config.settings.base import PENDING
+from offgridplanner.optimization import tasks
+from offgridplanner.optimization.models import Simulation
+from offgridplanner.projects.models import Options
+from offgridplanner.projects.models import Project
+
+
+class ChainRecorder:
+    # Stands in for celery.chain, records the queued tasks instead of sending them to the broker
+    def __init__(self):
+        self.queued = []
+
+    def __call__(self, *signatures):
+        recorder = self
+
+        class Chain:
+            def apply_async(self, task_id):
+                recorder.queued.append(([s.task for s in signatures], task_id))
+
+        return Chain()
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = ChainRecorder()
+    monkeypatch.setattr(tasks, "chain", recorder)
+    return recorder
+
+
+def make_simulation(**fields):
+    project = Project.objects.create(
+        name="test",
+        country="NG",
+        interest_rate=10,
+        n_days=365,
+        options=Options.objects.create(),
+    )
+    return Simulation.objects.create(project=project, **fields)
+
+
+@pytest.mark.django_db
+def test_supply_only_run_is_processed(recorder, django_capture_on_commit_callbacks):
+    simulation = make_simulation(
+        token_supply="supply",  # noqa: S106
+        status_supply=DONE,
+        status_grid=PENDING,
+    )
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        task_id = tasks.queue_results_processing(id=simulation.id)
+    # Nothing is sent before the transaction is committed
+    assert task_id is not None
+    assert recorder.queued == []
+    callbacks[0]()
+    assert recorder.queued == [
+        (["task_process_supply_results", "task_merge_results"], task_id)
+    ]
+    simulation.refresh_from_db()
+    assert simulation.status_results == PENDING
+    assert simulation.results_task_id == task_id
+    # Queued only once
+    assert tasks.queue_results_processing(id=simulation.id) is None
+
+
+@pytest.mark.django_db
+def test_waits_for_all_simulations_that_were_run(
+    recorder, django_capture_on_commit_callbacks
+):
+    simulation = make_simulation(
+        token_grid="grid",  # noqa: S106
+        token_supply="supply",  # noqa: S106
+        status_grid=DONE,
+        status_supply=PENDING,
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        assert tasks.queue_results_processing(id=simulation.id) is None
+        Simulation.objects.filter(id=simulation.id).update(status_supply=DONE)
+        task_id = tasks.queue_results_processing(id=simulation.id)
+    assert recorder.queued == [
+        (
+            [
+                "task_process_grid_results",
+                "task_process_supply_results",
+                "task_merge_results",
+            ],
+            task_id,
+        )
+    ]
+
+
+@pytest.mark.django_db
+def test_nothing_to_process_without_simulations(recorder):
+    simulation = make_simulation(status_grid=DONE, status_supply=DONE)
+    assert tasks.queue_results_processing(id=simulation.id) is None
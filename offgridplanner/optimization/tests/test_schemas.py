@@ -0,0 +1,62 @@
+import json
+
+import httpx
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from jsonschema.exceptions import ValidationError
+
+from offgridplanner.optimization.schemas import DIRECTIONS
+from offgridplanner.optimization.schemas import MODELS
+from offgridplanner.optimization.schemas import SchemaRegistry
+
+SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "required": ["nodes"],
+}
+
+
+@pytest.fixture
+def unreachable(monkeypatch):
+    def fetch(*_args, **_kwargs):
+        msg = "Connection refused"
+        raise httpx.ConnectError(msg)
+
+    monkeypatch.setattr(SchemaRegistry, "_fetch", fetch)
+
+
+def test_vendored_schema_is_used_when_the_server_is_unreachable(tmp_path, unreachable):
+    (tmp_path / "grid_input.json").write_text(json.dumps(SCHEMA))
+    registry = SchemaRegistry(schema_dir=tmp_path)
+    entry = registry.get("grid", "input")
+    assert entry.source == "vendored"
+    registry.validate({"nodes": []}, "grid", "input")
+
+
+def test_missing_vendored_schema_is_a_configuration_error(tmp_path, unreachable):
+    registry = SchemaRegistry(schema_dir=tmp_path)
+    with pytest.raises(ImproperlyConfigured, match="SIM_SCHEMA_DIR"):
+        registry.get("grid", "input")
+
+
+@pytest.mark.parametrize("direction", DIRECTIONS)
+@pytest.mark.parametrize("model", MODELS)
+def test_committed_schemas_are_vendored(model, direction, unreachable):
+    registry = SchemaRegistry()
+    assert registry.get(model, direction).source == "vendored"
+    with pytest.raises(ValidationError):
+        registry.validate({}, model, direction)
+
+
+def test_committed_grid_output_schema_accepts_results(unreachable):
+    results = {
+        "nodes": {
+            "latitude": [9.05, 9.06],
+            "longitude": [7.49, 7.5],
+            "node_type": ["power-house", "consumer"],
+            "consumer_type": ["power_house", "household"],
+            "is_connected": [True, True],
+        },
+        "links": {"link_type": ["distribution"], "length": [120.5]},
+    }
+    SchemaRegistry().validate(results, "grid", "output")
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pvlib.location import Location
+
+from offgridplanner.optimization.models import SolarPotential
+from offgridplanner.optimization.supply import solar_potential
+
+DT_INDEX = pd.date_range("2022-01-01", periods=48, freq="h", tz="UTC")
+SITES = [(9.05, 7.45), (12.0, 4.2)]
+
+
+def weather_data(lat, lon, seed):
+    rng = np.random.default_rng(seed)
+    clearsky = Location(latitude=lat, longitude=lon).get_clearsky(DT_INDEX)
+    return pd.DataFrame(
+        {
+            "ghi": clearsky["ghi"] * rng.uniform(0.5, 1, len(DT_INDEX)),
+            "dhi": clearsky["dhi"],
+            "dni": clearsky["dni"] * rng.uniform(0.5, 1, len(DT_INDEX)),
+            "temp_air": rng.uniform(20, 35, len(DT_INDEX)),
+            "wind_speed": rng.uniform(0, 5, len(DT_INDEX)),
+        },
+        index=DT_INDEX,
+    )
+
+
+class ComputeRecorder:
+    # Stands in for compute_dc_feed_in, records the computed sites and returns a constant feed-in from source
+    def __init__(self):
+        self.sites = []
+        self.source = "weather_data_db"
+
+    def __call__(self, lat, lon, dt_index):
+        self.sites.append((lat, lon))
+        return pd.Series(0.5, index=dt_index), self.source
+
+
+@pytest.fixture
+def computed(monkeypatch):
+    recorder = ComputeRecorder()
+    monkeypatch.setattr(solar_potential, "get_solar_raster", lambda: None)
+    monkeypatch.setattr(solar_potential, "compute_dc_feed_in", recorder)
+    return recorder
+
+
+@pytest.mark.django_db
+def test_feed_in_from_weather_data_is_cached(computed):
+    computed.source = "weather_data_db"
+    for _ in range(2):
+        feed_in = solar_potential.get_dc_feed_in_sync_db_query(9.05, 7.45, DT_INDEX)
+        assert (feed_in == 0.5).all()  # noqa:PLR2004
+    assert len(computed.sites) == 1
+    assert SolarPotential.objects.get().source == "weather_data_db"
+
+
+@pytest.mark.django_db
+def test_renewables_ninja_fallback_is_not_cached(computed):
+    computed.source = "renewables_ninja"
+    for _ in range(2):
+        solar_potential.get_dc_feed_in_sync_db_query(9.05, 7.45, DT_INDEX)
+    assert len(computed.sites) == 2  # noqa:PLR2004
+    assert not SolarPotential.objects.exists()
+
+
+def test_pv_engine_matches_pvlib_model_chain():
+    engine = solar_potential.PVEngine()
+    weather_dfs = [
+        weather_data(lat, lon, seed) for seed, (lat, lon) in enumerate(SITES)
+    ]
+    lats, lons = zip(*SITES, strict=True)
+    feed_in = engine.dc_feed_in_many(lats, lons, weather_dfs)
+    for i, ((lat, lon), weather_df) in enumerate(zip(SITES, weather_dfs, strict=True)):
+        model_chain = engine.model_chain(lat, lon).run_model(weather_df)
+        expected = model_chain.results.dc["p_mp"].clip(lower=0).fillna(0) / 1000
+        assert expected.max() > 0
+        np.testing.assert_allclose(feed_in[i], expected, rtol=1e-9, atol=1e-12)
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from config.settings.base import DONE
+from config.settings.base import ERROR
+from config.settings.base import PENDING
+from offgridplanner.optimization import tasks
+from offgridplanner.optimization.models import Simulation
+from offgridplanner.optimization.results_cache import get_simulation_results
+from offgridplanner.optimization.status_poller import SimulationStatusPoller
+from offgridplanner.optimization.tests.test_results_processing import ChainRecorder
+from offgridplanner.optimization.tests.test_results_processing import make_simulation
+
+
+class StatusServer:
+    # Stands in for async_optimization_check_status_many, answers with the responses set by the test
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+
+    async def __call__(self, tokens):
+        self.requests.append(sorted(tokens))
+        return {token: self.responses.get(token) for token in tokens}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = StatusServer()
+    monkeypatch.setattr(tasks, "async_optimization_check_status_many", server)
+    return server
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = ChainRecorder()
+    monkeypatch.setattr(tasks, "chain", recorder)
+    return recorder
+
+
+@pytest.mark.django_db
+def test_pending_simulations_are_polled_without_browser(
+    server, recorder, django_capture_on_commit_callbacks
+):
+    done = make_simulation(
+        token_grid="grid-1",  # noqa: S106
+        token_supply="supply-1",  # noqa: S106
+        status_grid=PENDING,
+        status_supply=DONE,
+    )
+    failed = make_simulation(token_supply="supply-2", status_supply=PENDING)  # noqa: S106
+    waiting = make_simulation(token_grid="grid-3", status_grid=PENDING)  # noqa: S106
+    server.responses = {
+        "grid-1": {"status": DONE, "results": {"lcoe": 1}},
+        "supply-2": {"status": ERROR, "results": {ERROR: "infeasible"}},
+        # The status of grid-3 could not be requested
+    }
+    with django_capture_on_commit_callbacks(execute=True):
+        finished = tasks.poll_pending_simulations()
+
+    assert server.requests == [["grid-1", "grid-3", "supply-2"]]
+    assert finished == {"grid-1": DONE, "supply-2": ERROR}
+    statuses = dict(Simulation.objects.values_list("id", "status_grid")) | {
+        failed.id: Simulation.objects.get(id=failed.id).status_supply
+    }
+    assert statuses == {done.id: DONE, failed.id: ERROR, waiting.id: PENDING}
+    assert get_simulation_results("grid-1") == {"lcoe": 1}
+    # The results processing is queued once both simulations of the project are DONE
+    assert len(recorder.queued) == 1
+    assert recorder.queued[0][1] == Simulation.objects.get(id=done.id).results_task_id
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert tasks.poll_pending_simulations() == {}
+    assert server.requests[-1] == ["grid-3"]
+    assert len(recorder.queued) == 1
+
+
+@pytest.mark.django_db
+def test_nothing_is_requested_without_pending_simulations(server):
+    make_simulation(token_grid="grid", status_grid=DONE)  # noqa: S106
+    assert tasks.poll_pending_simulations() == {}
+    assert server.requests == []
+
+
+@pytest.mark.django_db
+def test_waiters_are_resolved_from_the_stored_status():
+    simulation = make_simulation(token_grid="grid", status_grid=PENDING)  # noqa: S106
+
+    async def wait():
+        poller = SimulationStatusPoller(interval=0.01)
+        waiter = asyncio.ensure_future(poller.wait("grid", "grid"))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await Simulation.objects.filter(id=simulation.id).aupdate(status_grid=DONE)
+        return await asyncio.wait_for(waiter, timeout=5)
+
+    message = async_to_sync(wait)()
+    assert message["status"] == DONE
+    assert message["finished"]
@@ -54,11 +54,21 @@ urlpatterns = [
         waiting_for_results,
         name="waiting_for_results",
     ),
+    path(
+        "simulation_events/<int:proj_id>",
+        simulation_events,
+        name="simulation_events",
+    ),
     path(
         "process_optimization_results/<int:proj_id>",
         process_optimization_results,
         name="process_optimization_results",
     ),
+    path(
+        "results_processing_status/<int:proj_id>",
+        results_processing_status,
+        name="results_processing_status",
+    ),
     path(
         "abort_calculation/<int:proj_id>", abort_calculation, name="abort_calculation"
     ),
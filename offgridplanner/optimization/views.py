@@ -3,23 +3,35 @@
 import json
 import logging
 import os
+import uuid
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
 # from jsonview.decorators import json_view
 import pandas as pd
 from django.core.exceptions import PermissionDenied
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db import transaction
 from django.forms import model_to_dict
 from django.http import JsonResponse
 from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
 from django.shortcuts import get_object_or_404
+from django.utils.html import escape
 from django.views.decorators.http import require_http_methods
 
 from config.settings.base import DONE
 from config.settings.base import ERROR
 from config.settings.base import PENDING
+from config.settings.base import SIM_STATUS_POLL_INTERVAL
+from offgridplanner.optimization.grid import building_store
 from offgridplanner.optimization.grid import identify_consumers_on_map
+from offgridplanner.optimization.grid.node_index import NodeIndex
+from offgridplanner.optimization.grid.node_index import duplicated_consumers
+from offgridplanner.optimization.helpers import StageTimer
 from offgridplanner.optimization.helpers import check_imported_consumer_data
 from offgridplanner.optimization.helpers import check_imported_demand_data
 from offgridplanner.optimization.helpers import consumer_data_to_file
@@ -27,15 +39,19 @@ from offgridplanner.optimization.helpers import convert_file_to_df
 from offgridplanner.optimization.helpers import validate_file_extension
 from offgridplanner.optimization.models import Links
 from offgridplanner.optimization.models import Nodes
-from offgridplanner.optimization.models import Results
 from offgridplanner.optimization.models import Simulation
-from offgridplanner.optimization.processing import GridProcessor
 from offgridplanner.optimization.processing import PreProcessor
-from offgridplanner.optimization.processing import SupplyProcessor
-from offgridplanner.optimization.requests import optimization_check_status
 from offgridplanner.optimization.requests import optimization_server_request
+from offgridplanner.optimization.results_cache import REUSED_TOKEN_PREFIX
+from offgridplanner.optimization.results_cache import remember_simulation_input
+from offgridplanner.optimization.results_cache import reuse_simulation_results
+from offgridplanner.optimization.results_cache import simulation_input_hash
+from offgridplanner.optimization.status_poller import simulation_event_stream
+from offgridplanner.optimization.status_poller import simulation_status_message
 from offgridplanner.optimization.supply.demand_estimation import LOAD_PROFILES
 from offgridplanner.optimization.supply.demand_estimation import get_demand_timeseries
+from offgridplanner.optimization.tasks import get_status
+from offgridplanner.optimization.tasks import queue_results_processing
 from offgridplanner.optimization.tasks import revoke_task
 from offgridplanner.projects.helpers import df_to_file
 from offgridplanner.projects.models import Project
@@ -61,6 +77,9 @@ logger = logging.getLogger(__name__)
 
 # TODO should be used as AJAX from map
 @require_http_methods(["POST"])
+# The buildings of missing tiles are requested from Overpass, which can take minutes, so the request is not wrapped in
+# a transaction (the building store writes its own)
+@transaction.non_atomic_requests
 def add_buildings_inside_boundary(request, proj_id):
     if proj_id is not None:
         project = get_object_or_404(Project, id=proj_id)
@@ -96,9 +115,20 @@ def add_buildings_inside_boundary(request, proj_id):
                 "Please select a smaller area.",
             },
         )
-    data, building_coordinates_within_boundaries = (
-        identify_consumers_on_map.get_consumer_within_boundaries(df)
-    )
+    try:
+        building_coordinates_within_boundaries = (
+            identify_consumers_on_map.get_consumer_within_boundaries(
+                df, buildings_in_bbox=building_store.buildings_in_bbox
+            )
+        )
+    except (identify_consumers_on_map.OverpassError, OSError):
+        logger.exception("Requesting the buildings from Overpass failed")
+        return JsonResponse(
+            {
+                "executed": False,
+                "msg": "The buildings could not be requested from OpenStreetMap. Please try again later.",
+            },
+        )
     if not building_coordinates_within_boundaries:
         return JsonResponse(
             {
@@ -127,7 +157,7 @@ def add_buildings_inside_boundary(request, proj_id):
                 "executed": False,
                 "msg": "You have selected {} consumers. You can select a maximum of {} consumer. "
                 "Reduce the number of consumers by selecting a small area, for example.".format(
-                    len(data["elements"]),
+                    len(nodes["latitude"]),
                     max_consumer,
                 ),
             },
@@ -136,7 +166,8 @@ def add_buildings_inside_boundary(request, proj_id):
     df["is_connected"] = df["is_connected"]
     df_existing = pd.DataFrame.from_records(js_data["map_elements"])
     df = pd.concat([df_existing, df], ignore_index=True)
-    df = df.drop_duplicates(subset=["longitude", "latitude"], keep="first")
+    # Buildings already on the map (or closer than NODE_DUPLICATE_TOLERANCE to a consumer) are not added again
+    df = df[~duplicated_consumers(df)]
     df["shs_options"] = df["shs_options"].fillna(0)
     df["custom_specification"] = df["custom_specification"].fillna("")
     df["is_connected"] = df["is_connected"].fillna(value=True)
@@ -160,12 +191,7 @@ def remove_buildings_inside_boundary(
             .to_numpy()
             .tolist()
         )
-        df["inside_boundary"] = identify_consumers_on_map.are_points_in_boundaries(
-            df,
-            boundaries=boundaries,
-        )
-        df = df[df["inside_boundary"] == False]  # noqa: E712
-        df = df.drop(columns=["inside_boundary"])
+        df = df[~NodeIndex.from_df(df).within(boundaries)]
         return JsonResponse({"map_elements": df.to_dict("records")})
 
 
@@ -178,7 +204,7 @@ def db_links_to_js(request, proj_id):
             raise PermissionDenied
         links_qs = Links.objects.filter(project=project)
         links = links_qs.get() if links_qs.exists() else None
-        links_json = json.loads(links.data) if links is not None else json.loads("{}")
+        links_json = json.loads(links.df.to_json()) if links is not None else {}
         return JsonResponse(links_json, status=200)
 
 
@@ -254,8 +280,8 @@ def consumer_to_db(request, proj_id=None):
             Nodes.objects.filter(project=project).delete()
             return JsonResponse({"message": "No valid data"}, status=200)
 
-        df = df.drop_duplicates(subset=["latitude", "longitude"])
         df = df[df["node_type"].isin(["power-house", "consumer"])]
+        df = df[~duplicated_consumers(df)]
 
         # Ensure only one power-house node remains
         df = df.drop(df[df["node_type"] == "power-house"].index[1:], errors="ignore")
@@ -281,8 +307,8 @@ def consumer_to_db(request, proj_id=None):
         df["node_type"] = df["node_type"].astype(str)
 
         # Format latitude and longitude
-        df["latitude"] = df["latitude"].map(lambda x: f"{x:.6f}")
-        df["longitude"] = df["longitude"].map(lambda x: f"{x:.6f}")
+        df["latitude"] = df["latitude"].astype(float).round(6)
+        df["longitude"] = df["longitude"].astype(float).round(6)
 
         # Handle optional 'parent' column
         if "parent" in df.columns:
@@ -290,7 +316,8 @@ def consumer_to_db(request, proj_id=None):
 
         if file_type == "db":
             nodes, _ = Nodes.objects.get_or_create(project=project)
-            nodes.data = df.to_json(orient="records")  # Keep format structured
+            # Keep format structured
+            nodes.set_df(df.reset_index(drop=True), orient="records")
             nodes.save()
             return JsonResponse({"message": "Success"}, status=200)
 
@@ -323,11 +350,16 @@ def file_nodes_to_js(request, proj_id):
 
     file_extension = result
     df = convert_file_to_df(file, file_extension)
+    if isinstance(df, JsonResponse):
+        return df
 
     try:
-        df, msg = check_imported_consumer_data(df, proj_id)
-        if df is None and msg:
-            return JsonResponse({"responseMsg": msg}, status=400)
+        df, _msg = check_imported_consumer_data(df, proj_id)
+    except ValidationError as e:
+        return JsonResponse(
+            {"responseMsg": "<br>".join(escape(message) for message in e.messages)},
+            status=400,
+        )
     except ValueError as e:
         return JsonResponse(
             {"responseMsg": f"Failed to validate data: {e!s}"}, status=400
@@ -348,7 +380,7 @@ def load_demand_plot_data(request, proj_id=None):
     demand_df = (
         get_demand_timeseries(nodes, custom_demand, time_range=time_range) / 1000
     )
-    load_profiles = LOAD_PROFILES.iloc[time_range].copy()
+    load_profiles = LOAD_PROFILES.frame(time_range)
 
     timeseries = {
         "x": demand_df.index.tolist(),
@@ -403,6 +435,8 @@ def import_demand(request, proj_id):
     file_extension = result
 
     df = convert_file_to_df(file, file_extension)
+    if isinstance(df, JsonResponse):
+        return df
     project_dict = model_to_dict(project)
 
     df, error_msg = check_imported_demand_data(df, project_dict)
@@ -491,6 +525,39 @@ def load_plot_data(request, proj_id, plot_type=None):
         return JsonResponse({"msg": "Plot type undefined"}, status=400)
 
 
+def collect_and_submit(preprocessor, model, timer):
+    """
+    Collect the input json of one optimization and submit it to the simulation server, runs in a worker thread of
+    start_calculation
+    Parameters:
+        preprocessor (PreProcessor): Preprocessor of the project
+        model (str): Either "grid" or "supply"
+        timer (StageTimer): Timer of the request
+    Returns:
+        tuple: Token and status of the simulation, DONE if the results of an identical input are reused
+    """
+    collect = {
+        "grid": preprocessor.collect_grid_opt_json_data,
+        "supply": preprocessor.collect_supply_opt_json_data,
+    }[model]
+    try:
+        with timer.stage(f"{model}_json"):
+            opt_json = collect()
+        with timer.stage(f"{model}_cache"):
+            input_hash = simulation_input_hash(opt_json, model)
+            # The token of reused results is unique, as the simulation is looked up by its token
+            token = f"{REUSED_TOKEN_PREFIX}{uuid.uuid4().hex}"
+            if reuse_simulation_results(input_hash, token):
+                return token, DONE
+        with timer.stage(f"{model}_request"):
+            token = optimization_server_request(opt_json, model)["id"]
+        remember_simulation_input(token, input_hash)
+        return token, PENDING
+    finally:
+        # Close the database connection of this thread
+        connections.close_all()
+
+
 @require_http_methods(["POST"])
 def start_calculation(request, proj_id):
     project = get_object_or_404(Project, id=proj_id)
@@ -500,35 +567,48 @@ def start_calculation(request, proj_id):
     # forward, redirect = await async_queries.check_data_availability(user.id, project_id)
     # if forward is False:
     #     return JsonResponse({'token': '', 'redirect': redirect})
-    preprocessor = PreProcessor(proj_id)
-    supply_opt_json = preprocessor.collect_supply_opt_json_data()
-    grid_opt_json = preprocessor.collect_grid_opt_json_data()
-    try:
-        token_grid = (
-            optimization_server_request(grid_opt_json, "grid")["id"]
-            if opts.do_grid_optimization
-            else ""
-        )
-        token_supply = (
-            optimization_server_request(supply_opt_json, "supply")["id"]
-            if opts.do_es_design_optimization
-            else ""
-        )
-
-    except RuntimeError as e:
-        logger.exception("Error getting optimization tokens")
-        return JsonResponse(
-            {
-                "error": "There was an error with the simulation request. Hint: check the server connection and/or the outgoing JSON format"
-            },
-            status=500,
-        )
+    timer = StageTimer()
+    with timer.stage("total"):
+        with timer.stage("preprocessor"):
+            preprocessor = PreProcessor(proj_id)
+        models = {
+            "grid": opts.do_grid_optimization,
+            "supply": opts.do_es_design_optimization,
+        }
+        # The grid and supply pipelines are independent, so the grid job is submitted without waiting for the
+        # solar potential of the supply job
+        with ThreadPoolExecutor(max_workers=len(models)) as executor:
+            futures = {
+                model: executor.submit(collect_and_submit, preprocessor, model, timer)
+                for model, enabled in models.items()
+                if enabled
+            }
+        try:
+            submitted = {model: future.result() for model, future in futures.items()}
+        except RuntimeError as e:
+            logger.exception("Error getting optimization tokens")
+            return JsonResponse(
+                {
+                    "error": "There was an error with the simulation request. Hint: check the server connection and/or the outgoing JSON format"
+                },
+                status=500,
+            )
+    logger.info("Started calculation of project %s: %s", proj_id, timer)
 
+    token_grid, status_grid = submitted.get("grid", ("", PENDING))
+    token_supply, status_supply = submitted.get("supply", ("", PENDING))
     simulation.token_grid = token_grid
     simulation.token_supply = token_supply
+    simulation.status_grid = status_grid
+    simulation.status_supply = status_supply
+    simulation.status_results = "not yet started"
+    simulation.results_task_id = ""
     simulation.save()
 
-    return JsonResponse({"token_supply": token_supply, "token_grid": token_grid})
+    return JsonResponse(
+        {"token_supply": token_supply, "token_grid": token_grid},
+        headers={"Server-Timing": timer.server_timing()},
+    )
 
 
 # async def check_data_availability(user_id, project_id):
@@ -557,87 +637,74 @@ def start_calculation(request, proj_id):
 
 @require_http_methods(["POST"])
 def waiting_for_results(request, proj_id):
+    # Fallback for browsers without Server-Sent Events, see simulation_events
     data = json.loads(request.body)
 
     token = data["token"]
     model = data["model"]
     total_time = data["time"]
-    results = None
-    # TODO handle wait time between sim checks
-    wait_time = 3
+    wait_time = SIM_STATUS_POLL_INTERVAL
 
     # Fetch the right simulation object
     if model == "grid":
         simulation = get_object_or_404(Simulation, token_grid=token)
     else:
         simulation = get_object_or_404(Simulation, token_supply=token)
+    # The status is checked at the simulation server and written by the periodic task_poll_simulation_status
+    status = simulation.status_grid if model == "grid" else simulation.status_supply
+    message = simulation_status_message(token, model, {"status": status})
+    if message["finished"]:
+        return JsonResponse({**message, "time": total_time})
+    return JsonResponse({**message, "time": total_time + wait_time})
 
-    # Check the optimization server
-    response = optimization_check_status(token=token)
-    status = response.get("status") if response is not None else ERROR
-    print(f"{model} {status}")
-    if status not in [DONE, ERROR, PENDING]:
-        logger.warning("Simulation returned unexpected status")
 
-    if status == DONE:
-        try:
-            model = response.get("server_info")
-            server_results = response.get("results")
-            results = server_results
-            logger.info("Simulation finished")
-        except Exception:
-            logger.exception("Error parsing results")
-            status = ERROR
-    elif status == ERROR:
-        try:
-            results = json.dumps(response.get("results", {}).get(ERROR))
-        except AttributeError:
-            results = None
-        logger.warning("Simulation failed with errors.")
+@require_http_methods(["GET"])
+@transaction.non_atomic_requests  # ATOMIC_REQUESTS cannot wrap async views
+async def simulation_events(request, proj_id):
+    # Streams the final status of the project's simulations as Server-Sent Events. The statuses written by the periodic
+    # task_poll_simulation_status are read for all waiting browsers of the process at once
+    simulation = await aget_object_or_404(Simulation, project__id=proj_id)
+    tokens = {"grid": simulation.token_grid, "supply": simulation.token_supply}
+    statuses = {"grid": simulation.status_grid, "supply": simulation.status_supply}
+    # Simulations which have finished already (e.g. the results of an identical input were reused) are not polled
+    finished = [
+        simulation_status_message(token, model, {"status": DONE})
+        for model, token in tokens.items()
+        if token and statuses[model] == DONE
+    ]
+    tokens = {
+        model: token for model, token in tokens.items() if statuses[model] != DONE
+    }
+    return StreamingHttpResponse(
+        simulation_event_stream(tokens, finished=finished),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    # Update simulation status
-    if model == "grid":
-        simulation.status_grid = status
-    else:
-        simulation.status_supply = status
-    simulation.save()
+
+@require_http_methods(["POST"])
+def process_optimization_results(request, proj_id):
+    # The results are processed by a celery chain, which is normally already queued by task_poll_simulation_status once
+    # both simulations are DONE. Queuing it here again is a no-op in that case
+    simulation = get_object_or_404(Simulation, project__id=proj_id)
+    queue_results_processing(id=simulation.id)
+    return results_processing_status(request, proj_id)
+
+
+def results_processing_status(request, proj_id):
+    simulation = get_object_or_404(Simulation, project__id=proj_id)
+    status = simulation.status_results
     return JsonResponse(
         {
-            "token": token,
-            "model": model,
-            "time": total_time + wait_time,
             "status": status,
-            "finished": status != PENDING,
-            "results": results,
+            "task_status": get_status(simulation.results_task_id)
+            if simulation.results_task_id
+            else None,
+            "finished": status in [DONE, ERROR],
         }
     )
 
 
-def process_optimization_results(request, proj_id):
-    # Processes the results (contains both optimization result objects)
-    data = json.loads(request.body)
-    sim_res = data.get("results", {})
-    grid_processor = GridProcessor(proj_id=proj_id, results_json=sim_res.get("grid"))
-    grid_processor.grid_results_to_db()
-    supply_processor = SupplyProcessor(
-        proj_id=proj_id, results_json=sim_res.get("supply")
-    )
-    supply_processor.process_supply_optimization_results()
-    supply_processor.supply_results_to_db()
-    # Process shared results (after both grid and supply have been processed)
-    results = Results.objects.get(simulation__project__id=proj_id)
-    results.lcoe_share_supply = (
-        (results.epc_total - results.cost_grid) / results.epc_total * 100
-    )
-    results.lcoe_share_grid = 100 - results.lcoe_share_supply
-    assets = ["grid", "diesel_genset", "inverter", "rectifier", "battery", "pv"]
-    results.upfront_invest_total = sum(
-        [getattr(results, f"upfront_invest_{key}") for key in assets]
-    )
-    results.save()
-    return JsonResponse({"msg": "Optimization results saved to database"})
-
-
 def abort_calculation(request, proj_id):
     # TODO send an abort request to the simulation server
     simulation = Simulation.objects.get(project=proj_id)
@@ -25,7 +25,7 @@ from reportlab.platypus import Image
 from svglib.svglib import svg2rlg
 
 from offgridplanner.optimization.models import Nodes
-from offgridplanner.optimization.processing import PreProcessor
+from offgridplanner.optimization.processing import OptimizationContext
 from offgridplanner.projects.exports import create_pdf_report
 from offgridplanner.projects.exports import prepare_data_for_export
 from offgridplanner.projects.exports import project_data_df_to_xlsx
@@ -265,7 +265,7 @@ def download_pdf_report(request, proj_id):  # noqa:PLR0915
             img = Image(image_io, width=final_width, height=final_height)
             image_dict[plot_id] = img
     if "demand" not in energy_flow_df.columns:
-        energy_flow_df["demand"] = PreProcessor(proj_id).demand
+        energy_flow_df["demand"] = OptimizationContext(proj_id).demand
     doc, buffer = create_pdf_report(image_dict, dataframes)
 
     buffer.seek(0)  # ensure we're at the start
@@ -738,27 +738,76 @@ async function show_email_and_project_in_navbar(project_id = null) {
 
 let shouldStop = false;
 
+function wait_for_results_events(project_id, token_supply, token_grid) {
+    // Resolves with the final status messages of both simulations, which are pushed by the server as Server-Sent
+    // Events. Falls back to polling if the event stream is not available.
+    const tokens = {supply: token_supply, grid: token_grid};
+    const messages = {};
+    for (const model in tokens) {
+        if (!tokens[model]) messages[model] = {results: null};
+    }
+    return new Promise(resolve => {
+        if (typeof EventSource === 'undefined') {
+            resolve(null);
+            return;
+        }
+        const source = new EventSource(simulationEventsUrl);
+        document.getElementById("statusMsg").innerHTML = "Waiting for optimization...";
+        source.addEventListener('status', event => {
+            const res = JSON.parse(event.data);
+            if (res.status === "ERROR") {
+                source.close();
+                shouldStop = true;
+                document.getElementById("loader").classList.remove("loader");
+                document.getElementById("loader").classList.add("error-cross");
+                document.getElementById("statusMsg").innerHTML = "There was an error fetching the optimization";
+                return;
+            }
+            messages[res.model] = res;
+            if ('supply' in messages && 'grid' in messages) {
+                source.close();
+                resolve(messages);
+            }
+        });
+        source.onerror = () => {
+            // The stream was closed before both results arrived (e.g. by a proxy), continue with polling
+            if (source.readyState === EventSource.CLOSED && !shouldStop) resolve(null);
+        };
+    });
+}
+
+
 async function wait_for_both_results(project_id, token_supply, token_grid) {
-    const [supplyRes, gridRes] = await Promise.all([
-        check_optimization(project_id, token_supply, 0, 'supply'),
-        check_optimization(project_id, token_grid, 0, 'grid')
-    ]);
-    // Once both are finished, send results together for final processing
-    const response = await fetch(processResultsUrl, {
+    let supplyRes, gridRes;
+    const messages = await wait_for_results_events(project_id, token_supply, token_grid);
+    if (shouldStop) return;
+    if (messages !== null) {
+        supplyRes = messages.supply;
+        gridRes = messages.grid;
+    } else {
+        [supplyRes, gridRes] = await Promise.all([
+            check_optimization(project_id, token_supply, 0, 'supply'),
+            check_optimization(project_id, token_grid, 0, 'grid')
+        ]);
+    }
+    if (shouldStop || !supplyRes || !gridRes) return;
+    // Once both are finished, the results are processed on the server (the processing is usually already queued)
+    document.getElementById("statusMsg").innerHTML = "Processing results...";
+    let response = await fetch(processResultsUrl, {
         method: "POST",
         headers: {
             "Content-Type": "application/json",
             'X-CSRFToken': csrfToken
-        },
-        body: JSON.stringify({
-            results: {
-                supply: supplyRes.results,
-                grid: gridRes.results
-            }
-        })
+        }
     });
+    let res = response.ok ? await response.json() : null;
+    while (res !== null && !res.finished) {
+        await new Promise(resolve => setTimeout(resolve, 2000));
+        response = await fetch(resultsProcessingStatusUrl);
+        res = response.ok ? await response.json() : null;
+    }
 
-    if (response.ok) {
+    if (res !== null && res.status === "DONE") {
         const lang_prefix = '/' + lang;
         window.location.href = window.location.origin + lang_prefix +'/steps/simulation_results/' + project_id;
     } else {